@@ -0,0 +1,348 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import re
+import sys
+import threading
+import time
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# no logger here: utils accounts every fetch with this module and imports it first.
+
+# bean name -> group kept per target, a RegionServer names its regions in the bean names
+MAX_CLASSIFIED_BEANS = 50000
+# the key every bean has once, see utils._BEAN_MARKER
+_BEAN_MARKER = '"modelerType"'
+_PORT_SUFFIX = re.compile(r'ForPort\d+$')
+# the ObjectName properties a catalog is named by, the most specific first, as the collectors
+# dispatch (sub=Regions, name=FSNamesystem, type=producer-metrics), see common.REDUCED_PLAN_PATTERNS
+_CATALOG_KEYS = ('sub', 'name', 'type')
+
+# url -> catalog names of the collector polling it, longest first, see set_catalogs
+_catalogs = {}
+# the BeanCostAccountant of --debug-beans. Without it every fetch still times its decode and
+# calls observe_fetch, which returns at once, and set_catalogs still keeps the catalogs of every
+# collector.
+_accountant = None
+
+
+def configure(metrics=False):
+    '''
+    Enable the cost accounting of the fetched MBeans.
+    @param metrics: also export the costs as hadoop_exporter_mbean_* families.
+    @return the BeanCostAccountant.
+    '''
+    global _accountant
+    _accountant = BeanCostAccountant(metrics)
+    return _accountant
+
+
+def enabled():
+    return _accountant is not None
+
+
+def set_catalogs(url, catalogs):
+    '''
+    @param catalogs: the catalog names the collector of the url dispatches on, e.g.
+                     FSNamesystem or JvmMetrics, see catalog_of.
+    '''
+    _catalogs[url] = sorted(catalogs, key=len, reverse=True)
+
+
+def _properties(name):
+    domain, _, keys = name.partition(':')
+    return domain, dict(key.split('=', 1) for key in keys.split(',') if '=' in key)
+
+
+def catalog_of(name, catalogs):
+    '''
+    @param catalogs: catalog names, the longest first.
+    @return the catalog of the bean: the longest one starting the value of its sub, name or
+            type property, e.g. RpcActivity for name=RpcActivityForPort8020, None when no
+            catalog reads the bean, e.g. sub=TableLatencies of a RegionServer.
+    '''
+    domain, properties = _properties(name)
+    for key in _CATALOG_KEYS:
+        value = properties.get(key)
+        if value is None:
+            continue
+        for catalog in catalogs:
+            if value.startswith(catalog):
+                return catalog
+    return None
+
+
+def bean_group(name):
+    '''
+    @return the group of a bean no catalog reads, from its ObjectName: the name property (the
+            type outside the Hadoop domain) without the RPC port, and the sub property, e.g.
+            RegionServer,sub=Regions, RpcDetailedActivity or Memory for java.lang:type=Memory.
+    '''
+    domain, properties = _properties(name)
+    group = properties.get('name') if domain == 'Hadoop' else properties.get('type') or properties.get('name')
+    if group is None:
+        return name
+    group = _PORT_SUFFIX.sub('', group)
+    if 'sub' in properties:
+        group += ',sub=' + properties['sub']
+    return group
+
+
+def _bean_sizes(body, beans):
+    '''
+    @return the bytes of every bean in the body: from the opening brace of a bean to the one
+            of the next, found through the "modelerType" key every bean has once, right after
+            its name in the /jmx servlet. When that does not line up with the beans, the sizes
+            of the beans serialized again, scaled to the body.
+    '''
+    starts = []
+    position = body.find(_BEAN_MARKER)
+    previous = 0
+    while position >= 0:
+        start = body.rfind('{', previous, position)
+        starts.append(start if start >= 0 else position)
+        previous = position
+        position = body.find(_BEAN_MARKER, position + len(_BEAN_MARKER))
+    if len(starts) == len(beans):
+        starts.append(len(body))
+        sizes = [starts[i + 1] - starts[i] for i in range(len(beans))]
+        if all(body.find(_encode(bean.get('name', '')), starts[i], starts[i + 1]) >= 0
+               for i, bean in enumerate(beans)):
+            return sizes
+    sizes = [len(json.dumps(bean)) for bean in beans]
+    scale = len(body) / float(sum(sizes) or 1)
+    return [int(round(size * scale)) for size in sizes]
+
+
+def _encode(name):
+    return name.encode('utf-8') if isinstance(name, unicode) else name
+
+
+def observe_fetch(url, body, beans, wire, decode):
+    '''
+    Account one /jmx response of the url.
+    @param body: the decompressed body, `wire` bytes on the wire, decoded in `decode` seconds.
+    '''
+    accountant = _accountant
+    if accountant is None or not beans:
+        return
+    accountant.observe_fetch(url, body, beans, wire, decode)
+
+
+def observe_scrape(url, series, extract):
+    '''
+    Account the extraction of one scrape of the url.
+    @param series: catalog name -> series the scrape built from its beans.
+    @param extract: seconds from the beans to the last family, split over the catalogs by series.
+    '''
+    accountant = _accountant
+    if accountant is None:
+        return
+    accountant.observe_scrape(url, series, extract)
+
+
+class _GroupCost(object):
+    __slots__ = ('read', 'beans', 'fetches', 'bytes', 'wire_bytes', 'decode', 'scrapes', 'extract', 'series')
+
+    def __init__(self, read):
+        # whether a catalog reads the beans of the group
+        self.read = read
+        # beans of the group in the last fetch holding any
+        self.beans = 0
+        self.fetches = 0
+        self.bytes = 0
+        self.wire_bytes = 0.0
+        self.decode = 0.0
+        self.scrapes = 0
+        self.extract = 0.0
+        # series built from the group by the last scrape
+        self.series = 0
+
+
+class _Target(object):
+    __slots__ = ('groups', 'names')
+
+    def __init__(self):
+        # group -> _GroupCost
+        self.groups = {}
+        # bean name -> (group, read)
+        self.names = {}
+
+
+class BeanCostAccountant(object):
+    '''
+    What every MBean group of a target costs: the bytes of the /jmx responses, on the wire and
+    decompressed, the decode time, the extraction time and the series built from it. A group is
+    the catalog a collector dispatches the bean to (FSNamesystem, JvmMetrics, Regions...),
+    or for the beans no catalog reads the group of their ObjectName (see bean_group): fetched
+    and decoded for nothing, the first candidates for a ?qry= plan, a slower tier or the drop.
+
+    The bytes of a bean are measured in the body; the wire bytes and the decode time of a
+    response are split over its beans by bytes, and the extraction time of a scrape over its
+    catalogs by series.
+    '''
+
+    # /metrics/exporter, see exposition.ScrapeSelection
+    scrape_names = frozenset(['exporter'])
+
+    def __init__(self, metrics=False):
+        self._metrics = metrics
+        self._lock = threading.Lock()
+        # url -> _Target
+        self._targets = {}
+
+    def _classify(self, url, target, name):
+        entry = target.names.get(name)
+        if entry is None:
+            catalog = catalog_of(name, _catalogs.get(url, ()))
+            entry = (catalog, True) if catalog is not None else (bean_group(name), False)
+            if len(target.names) >= MAX_CLASSIFIED_BEANS:
+                target.names.clear()
+            target.names[name] = entry
+        return entry
+
+    def observe_fetch(self, url, body, beans, wire, decode):
+        sizes = _bean_sizes(body, beans)
+        total = float(sum(sizes)) or 1.0
+        with self._lock:
+            target = self._targets.get(url)
+            if target is None:
+                target = self._targets[url] = _Target()
+            fetched = {}
+            for bean, size in zip(beans, sizes):
+                group, read = self._classify(url, target, bean.get('name', ''))
+                cost = target.groups.get(group)
+                if cost is None:
+                    cost = target.groups[group] = _GroupCost(read)
+                if group not in fetched:
+                    fetched[group] = 0
+                    cost.fetches += 1
+                fetched[group] += 1
+                share = size / total
+                cost.bytes += size
+                cost.wire_bytes += wire * share
+                cost.decode += decode * share
+            for group, count in fetched.items():
+                target.groups[group].beans = count
+
+    def observe_scrape(self, url, series, extract):
+        total = float(sum(series.values())) or 1.0
+        with self._lock:
+            target = self._targets.get(url)
+            if target is None:
+                target = self._targets[url] = _Target()
+            for catalog, count in series.items():
+                cost = target.groups.get(catalog)
+                if cost is None:
+                    if not count:
+                        continue
+                    cost = target.groups[catalog] = _GroupCost(True)
+                cost.scrapes += 1
+                cost.series = count
+                cost.extract += extract * count / total
+
+    def _snapshot(self):
+        with self._lock:
+            return sorted((url, sorted((group, _copy(cost)) for group, cost in target.groups.items()))
+                          for url, target in self._targets.items())
+
+    def collect(self):
+        if not self._metrics:
+            return []
+        families = [
+            CounterMetricFamily("hadoop_exporter_mbean_bytes", "Decompressed /jmx bytes of the MBean group",
+                                labels=["url", "group"]),
+            CounterMetricFamily("hadoop_exporter_mbean_wire_bytes", "Bytes of the MBean group on the wire, split by bytes",
+                                labels=["url", "group"]),
+            CounterMetricFamily("hadoop_exporter_mbean_decode_seconds", "Decode time of the MBean group, split by bytes",
+                                labels=["url", "group"]),
+            CounterMetricFamily("hadoop_exporter_mbean_extract_seconds", "Extraction time of the MBean group, split by series",
+                                labels=["url", "group"]),
+            GaugeMetricFamily("hadoop_exporter_mbean_series", "Series the last scrape built from the MBean group, "
+                              "0 for the groups no catalog reads", labels=["url", "group"]),
+        ]
+        for url, groups in self._snapshot():
+            for group, cost in groups:
+                labels = [url, group]
+                families[0].add_metric(labels, cost.bytes)
+                families[1].add_metric(labels, cost.wire_bytes)
+                families[2].add_metric(labels, cost.decode)
+                families[3].add_metric(labels, cost.extract)
+                families[4].add_metric(labels, cost.series)
+        return families
+
+    def report(self, url=None):
+        '''
+        @param url: only the targets whose url contains it.
+        @return the groups of every target, the most bytes per fetch first.
+        '''
+        lines = []
+        for target, groups in self._snapshot():
+            if url and url not in target:
+                continue
+            lines.append("=== {0} ===".format(target))
+            lines.append("{0:<40} {1:>6} {2:>8} {3:>11} {4:>11} {5:>10} {6:>10} {7:>8}".format(
+                'group', 'beans', 'fetches', 'bytes/fetch', 'wire/fetch', 'decode ms', 'extract ms', 'series'))
+            groups.sort(key=lambda item: item[1].bytes / max(item[1].fetches, 1), reverse=True)
+            for group, cost in groups:
+                fetches, scrapes = max(cost.fetches, 1), max(cost.scrapes, 1)
+                lines.append("{0:<40} {1:>6} {2:>8} {3:>11.0f} {4:>11.0f} {5:>10.2f} {6:>10.2f} {7:>8}".format(
+                    group if cost.read else group + ' *', cost.beans, cost.fetches, cost.bytes / float(fetches),
+                    cost.wire_bytes / fetches, cost.decode * 1000 / fetches, cost.extract * 1000 / scrapes, cost.series))
+            lines.append("")
+        if not lines:
+            return "no target matches {0}\n".format(url) if url else "no bean fetched yet\n"
+        lines.append("per fetch and per scrape averages; * no catalog reads the group")
+        return "\n".join(lines) + "\n"
+
+
+def _copy(cost):
+    copy = _GroupCost(cost.read)
+    for name in _GroupCost.__slots__:
+        setattr(copy, name, getattr(cost, name))
+    return copy
+
+
+def handle(query):
+    '''
+    The /debug/beans endpoint of the exposition server: what every MBean group of every target
+    costs, ?url=<part of the jmx url> for some targets only.
+    @return (status code, body, content type).
+    '''
+    accountant = _accountant
+    if accountant is None:
+        return 404, "bean cost accounting is disabled\n", 'text/plain; charset=utf-8'
+    return 200, accountant.report(query.get('url', [None])[0]), 'text/plain; charset=utf-8'
+
+
+def main():
+    '''
+    Scrape a test fixture and print what its MBean groups cost:
+
+        python cmd/beancost.py [ROLE] [scrapes]
+    '''
+    import stress
+    # the module the collectors see, not this __main__
+    import beancost
+    from collectors import find_collector, load_collector
+    from prometheus_client.core import CollectorRegistry
+    from exposition import Encoder
+    role = sys.argv[1] if len(sys.argv) > 1 else 'NAMENODE'
+    scrapes = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    accountant = beancost.configure()
+    jmx, url = stress.serve_beans(stress.read_fixture(stress.FIXTURES[role]))
+    keyword, module_name, class_name = find_collector(role)
+    registry = CollectorRegistry()
+    registry.register(load_collector(module_name, class_name)('cluster_indata', url))
+    encoder = Encoder()
+    start = time.time()
+    for i in range(scrapes):
+        encoder.encode_text(registry.collect())
+    jmx.shutdown()
+    sys.stdout.write(accountant.report())
+    sys.stderr.write("{0} scrapes in {1:.2f}s\n".format(scrapes, time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
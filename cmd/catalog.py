@@ -0,0 +1,272 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import marshal
+import os
+import sys
+import threading
+import time
+import yaml
+
+from utils import get_module_logger
+from percentile import PercentilePlan, plan_groups
+
+logger = get_module_logger(__name__)
+
+# the libyaml binding is an order of magnitude faster on the big catalogs (hiveserver2 is 86KB),
+# fall back to the pure python loader when PyYAML was built without it.
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Every catalog directory, the parsed catalogs and their percentile plans are compiled into
+# one marshal file, so a restart costs one read instead of parsing YAML. Bump CACHE_VERSION
+# whenever the layout of the cache or of the derived plans changes.
+CACHE_FILE = "catalogs.cache"
+CACHE_VERSION = 2
+_CACHE_MAGIC = "hadoop_exporter.catalogs"
+# top level directories which never hold metric catalogs.
+_NOT_CATALOGS = ('cmd', 'config', 'rules', 'test', 'tiers')
+
+_lock = threading.RLock()
+# path name -> [catalog name]
+_file_lists = {}
+# (path name, catalog name) -> catalog dict
+_catalogs = {}
+# (path name, catalog name) -> PercentilePlan
+_plans = {}
+# the validated content of the cache file, None when missing or stale
+_cache = None
+_cache_checked = False
+
+
+def _get_root():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_catalog_path(path_name):
+    return os.path.join(_get_root(), path_name)
+
+
+def get_cache_path():
+    return os.path.join(_get_root(), CACHE_FILE)
+
+
+def get_catalog_dirs():
+    '''
+    @return the names of the top level directories holding *.json catalogs, e.g. namenode.
+    '''
+    root = _get_root()
+    dirs = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if name.startswith('.') or name in _NOT_CATALOGS or not os.path.isdir(path):
+            continue
+        if any(f.endswith('.json') for f in os.listdir(path)):
+            dirs.append(name)
+    return dirs
+
+
+def _list_catalogs(path_name):
+    json_path = get_catalog_path(path_name)
+    try:
+        files = os.listdir(json_path)
+    except OSError:
+        logger.info("No such file or directory: '%s'" % json_path)
+        return []
+    return [f.split(".json")[0] for f in files]
+
+
+def _get_source(path_name, file_name):
+    return os.path.join(get_catalog_path(path_name), "{0}.json".format(file_name))
+
+
+def _read_source(path_name, file_name):
+    '''
+    @return (catalog, (mtime, size, sha1)) of one catalog file, the stamp is None when unreadable.
+    '''
+    source = _get_source(path_name, file_name)
+    try:
+        st = os.stat(source)
+        with open(source, 'rb') as f:
+            data = f.read()
+        return yaml.load(data, Loader=_Loader), (st.st_mtime, st.st_size, hashlib.sha1(data).hexdigest())
+    except Exception as e:
+        logger.info("read metrics json file failed, error msg is: %s" % e)
+        return {}, None
+
+
+def _is_fresh(path_name, file_name, stamp):
+    try:
+        st = os.stat(_get_source(path_name, file_name))
+    except OSError:
+        return stamp is None
+    if stamp is None or st.st_size != stamp[1]:
+        return False
+    if st.st_mtime == stamp[0]:
+        return True
+    # touched (e.g. by a checkout) but maybe not modified, the content hash decides.
+    with open(_get_source(path_name, file_name), 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest() == stamp[2]
+
+
+def build_cache(cache_path=None):
+    '''
+    Compile all catalog directories into the cache file.
+    The file is replaced atomically, so concurrent exporters never read a partial cache.
+    @return the cache content.
+    '''
+    cache_path = cache_path or get_cache_path()
+    content = {'lists': {}, 'sources': {}, 'catalogs': {}, 'plans': {}}
+    for path_name in get_catalog_dirs():
+        names = _list_catalogs(path_name)
+        content['lists'][path_name] = names
+        for file_name in names:
+            key = (path_name, file_name)
+            catalog, stamp = _read_source(path_name, file_name)
+            content['sources'][key] = stamp
+            content['catalogs'][key] = catalog
+            content['plans'][key] = plan_groups(catalog)
+    header = (_CACHE_MAGIC, CACHE_VERSION, tuple(sys.version_info[:2]))
+    tmp_path = "{0}.{1}.tmp".format(cache_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        marshal.dump((header, content), f)
+    os.rename(tmp_path, cache_path)
+    return content
+
+
+def _rebuild_cache():
+    try:
+        build_cache()
+        logger.info("catalog cache rebuilt: {0}".format(get_cache_path()))
+    except Exception as e:
+        logger.info("write catalog cache failed, error msg is: %s" % e)
+
+
+def load_cache(cache_path=None):
+    '''
+    @return the cache content if the cache file exists and matches every catalog source, else None.
+    '''
+    try:
+        with open(cache_path or get_cache_path(), 'rb') as f:
+            header, content = marshal.loads(f.read())
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+    if header != (_CACHE_MAGIC, CACHE_VERSION, tuple(sys.version_info[:2])):
+        return None
+    for path_name, names in content['lists'].items():
+        if sorted(_list_catalogs(path_name)) != sorted(names):
+            return None
+    for (path_name, file_name), stamp in content['sources'].items():
+        if not _is_fresh(path_name, file_name, stamp):
+            return None
+    return content
+
+
+def _get_cache():
+    global _cache, _cache_checked
+    if not _cache_checked:
+        _cache_checked = True
+        _cache = load_cache()
+        if _cache is None:
+            # stale or missing: serve from the json sources and refresh the cache for the next start.
+            logger.info("catalog cache is stale or missing, reading the json catalogs")
+            # not a daemon: a short-lived process waits for the cache instead of killing the
+            # thread halfway at interpreter shutdown.
+            t = threading.Thread(target=_rebuild_cache, name="catalog-cache")
+            t.start()
+    return _cache
+
+
+def get_file_list(path_name):
+    '''
+    Same as utils.get_file_list, but the directory is only listed once per process.
+    @return a new list of catalog names, callers may extend it.
+    '''
+    with _lock:
+        if path_name not in _file_lists:
+            cache = _get_cache()
+            if cache is not None and path_name in cache['lists']:
+                _file_lists[path_name] = cache['lists'][path_name]
+            else:
+                _file_lists[path_name] = _list_catalogs(path_name)
+        return list(_file_lists[path_name])
+
+
+def read_catalog(path_name, file_name):
+    '''
+    Same as utils.read_json_file, but every catalog is parsed only once per process.
+    The returned dict is shared by all collectors and must be treated as read only.
+    '''
+    key = (path_name, file_name)
+    with _lock:
+        if key not in _catalogs:
+            cache = _get_cache()
+            if cache is not None and key in cache['catalogs']:
+                _catalogs[key] = cache['catalogs'][key]
+            else:
+                _catalogs[key] = _read_source(path_name, file_name)[0]
+        return _catalogs[key]
+
+
+def read_plan(path_name, file_name):
+    '''
+    @return the shared PercentilePlan of one catalog.
+    '''
+    key = (path_name, file_name)
+    with _lock:
+        if key not in _plans:
+            cache = _get_cache()
+            if cache is not None and key in cache['plans']:
+                _plans[key] = PercentilePlan(groups=cache['plans'][key])
+            else:
+                _plans[key] = PercentilePlan(read_catalog(path_name, file_name))
+        return _plans[key]
+
+
+def load_catalogs(path_name):
+    '''
+    @return {catalog name: catalog dict} of all catalogs in the directory.
+    '''
+    return dict((name, read_catalog(path_name, name)) for name in get_file_list(path_name))
+
+
+def clear():
+    '''
+    Forget every cached catalog, e.g. after the json files were edited.
+    '''
+    global _cache, _cache_checked
+    with _lock:
+        _file_lists.clear()
+        _catalogs.clear()
+        _plans.clear()
+        _cache = None
+        _cache_checked = False
+
+
+def main():
+    '''
+        python cmd/catalog.py build    # compile the catalog cache, e.g. while building the image
+        python cmd/catalog.py          # compare loading from the json sources and from the cache
+    '''
+    if sys.argv[1:] == ['build']:
+        content = build_cache()
+        print "{0}: {1} catalogs".format(get_cache_path(), len(content['catalogs']))
+        return
+    dirs = get_catalog_dirs()
+    for name, loader in (("yaml SafeLoader", yaml.SafeLoader), ("yaml " + _Loader.__name__, _Loader)):
+        start = time.time()
+        for path_name in dirs:
+            for file_name in _list_catalogs(path_name):
+                with open(_get_source(path_name, file_name), 'rb') as f:
+                    plan_groups(yaml.load(f, Loader=loader))
+        print "{0:<24} {1:>8.3f}s".format(name, time.time() - start)
+    build_cache()
+    start = time.time()
+    content = load_cache()
+    print "{0:<24} {1:>8.3f}s".format("cache (read + validate)", time.time() - start)
+    for (path_name, file_name), catalog in content['catalogs'].items():
+        assert catalog == _read_source(path_name, file_name)[0], (path_name, file_name)
+
+
+if __name__ == '__main__':
+    main()
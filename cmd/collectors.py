@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import importlib
+import subprocess
+import sys
+import time
+
+from utils import get_module_logger
+
+logger = get_module_logger(__name__)
+
+# package the collector modules live in, empty when this file is run as a script.
+_PACKAGE = __name__.rpartition('.')[0]
+
+# (role keyword in cluster_config.json, collector module, collector class), in discovery order.
+# A role matches when the keyword is part of the service name, e.g. HBASE_REGIONSERVER.
+COLLECTORS = (
+    ('NAMENODE', 'hdfs_namenode', 'NameNodeMetricCollector'),
+    ('DATANODE', 'hdfs_datanode', 'DataNodeMetricCollector'),
+    ('JOURNALNODE', 'hdfs_journalnode', 'JournalNodeMetricCollector'),
+    ('RESOURCEMANAGER', 'yarn_resourcemanager', 'ResourceManagerMetricCollector'),
+    ('NODEMANAGER', 'yarn_nodemanager', 'NodeManagerMetricCollector'),
+    ('HBASE_MASTER', 'hbase_master', 'HBaseMasterMetricCollector'),
+    ('HBASE_REGIONSERVER', 'hbase_regionserver', 'HBaseRegionServerMetricCollector'),
+    ('HISTORYSERVER', 'mapreduce_jobhistoryserver', 'MapReduceMetricCollector'),
+    ('HIVE_SERVER_INTERACTIVE', 'hive_server', 'HiveServerMetricCollector'),
+    ('HIVE_LLAP', 'hive_llap', 'HiveLlapDaemonMetricCollector'),
+)
+
+# collector module -> ((keyword argument of the collector, attribute of the parsed args), ...)
+COLLECTOR_OPTIONS = {
+    'hdfs_namenode': (('central_datanodes', 'datanode_central'), ('datanode_summary', 'datanode_summary'),
+                      ('fleet_top', 'fleet_top')),
+    'hdfs_datanode': (('central', 'datanode_central'), ('central_interval', 'datanode_interval')),
+    'yarn_resourcemanager': (('queue_depth', 'queue_depth'), ('queue_allowlist', 'queue_allowlist'),
+                             ('central_nodemanagers', 'nodemanager_central'), ('nodemanager_summary', 'nodemanager_summary'),
+                             ('fleet_top', 'fleet_top')),
+    'yarn_nodemanager': (('central', 'nodemanager_central'), ('central_interval', 'nodemanager_interval')),
+}
+
+
+def find_collector(service_name):
+    '''
+    @param service_name: service name discovered from cluster_config.json, e.g. "DATANODE".
+    @return the matching (keyword, module, class) entry of COLLECTORS or None.
+    '''
+    for entry in COLLECTORS:
+        if entry[0] in service_name:
+            return entry
+    return None
+
+
+def get_collector_options(module_name, args):
+    '''
+    @param args: the parsed command line, see utils.parse_args.
+    @return the keyword arguments of the collector taken from the command line.
+    '''
+    if args is None:
+        return {}
+    return dict((kwarg, getattr(args, attr)) for kwarg, attr in COLLECTOR_OPTIONS.get(module_name, ()))
+
+
+def load_collector(module_name, class_name):
+    '''
+    Import a collector module on first use, so that a host running only a DataNode never
+    imports (and never parses the catalogs of) the other nine collectors.
+    @return the collector class.
+    '''
+    name = '.'.join([_PACKAGE, module_name]) if _PACKAGE else module_name
+    start = time.time()
+    module = importlib.import_module(name)
+    logger.debug("imported collector module {0} in {1:.3f}s".format(name, time.time() - start))
+    return getattr(module, class_name)
+
+
+def _startup_cost(code):
+    # every case runs in a fresh interpreter, otherwise imports and catalogs are already warm.
+    cmd = [sys.executable, '-c', "import sys, time; t = time.time(); {0}; "
+           "sys.stdout.write(repr(time.time() - t))".format(code)]
+    return float(subprocess.check_output(cmd, cwd=sys.path[0]))
+
+
+def main():
+    '''
+    Startup-time benchmark: import and construct every collector eagerly (what the exporter
+    did before) versus lazily loading the collector of a single role.
+
+        python cmd/collectors.py [DATANODE HBASE_REGIONSERVER ...]
+    '''
+    roles = sys.argv[1:] or [entry[0] for entry in COLLECTORS]
+    rounds = 5
+    construct = "getattr(__import__('{0}'), '{1}')('bench', 'http://localhost/jmx')"
+    eager = "; ".join(construct.format(module, cls) for keyword, module, cls in COLLECTORS)
+    eager_cost = min(_startup_cost(eager) for i in range(rounds))
+    print "{0:<24} {1:>8.3f}s".format("all collectors (eager)", eager_cost)
+    for role in roles:
+        entry = find_collector(role)
+        if entry is None:
+            print "{0:<24} no collector".format(role)
+            continue
+        lazy = ("from collectors import load_collector; "
+                "load_collector('{0}', '{1}')('bench', 'http://localhost/jmx')").format(entry[1], entry[2])
+        print "{0:<24} {1:>8.3f}s".format(role, min(_startup_cost(lazy) for i in range(rounds)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import copy
+import threading
 import yaml
 import re
 import time
@@ -10,15 +12,71 @@ from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily, REG
 
 import utils
 from utils import get_module_logger
-from consul import Consul
+import catalog
+import tiers
+import throttle
+import sampler
+import labels
+import memory
+import profiler
+import tracing
+import beancost
+from labels import AttributePlan
 
 logger = get_module_logger(__name__)
 
+# after a full dump exceeded the payload limits, the catalogs are queried one by one for this
+# many seconds before the full dump is tried again.
+REDUCED_PLAN_RETRY = 600
+# the property keys a catalog name may appear under, e.g. Hadoop:service=NameNode,name=FSNamesystem,
+# Hadoop:service=HBase,name=RegionServer,sub=Server or kafka.producer:type=producer-metrics,client-id=x
+REDUCED_PLAN_PATTERNS = ('*:name={0}*,*', '*:sub={0}*,*', '*:type={0}*,*')
+# seconds the catalog -> family names learned from a full scrape are used to prune the
+# fetches of scrapes selecting some families (family[]= of the exposition server)
+CATALOG_FAMILIES_MAX_AGE = 600
+
+
+class _PollState(object):
+    '''
+    What a collector keeps from one scrape to the next: the last beans and their fetch time,
+    the tier scheduler, the reduced query plan and what selected scrapes fetch per catalog.
+    Shared by the concurrent scrapes of the collector and only touched under `lock`.
+    '''
+    __slots__ = ('lock', 'beans', 'time', 'tiers', 'reduced_plan', 'reduced_until',
+                 'catalog_families', 'catalog_families_time', 'catalog_patterns')
+
+    def __init__(self, scheduler):
+        self.lock = threading.Lock()
+        self.beans = None
+        self.time = 0
+        self.tiers = scheduler
+        self.reduced_plan = None
+        self.reduced_until = 0
+        # catalog -> names of the families built from its beans, learned by full scrapes
+        self.catalog_families = None
+        self.catalog_families_time = 0
+        # catalog -> the REDUCED_PLAN_PATTERNS which matched its beans
+        self.catalog_patterns = {}
+
 
 class MetricCol(object):
     '''
     MetricCol是所有MetricsCollector的超类，它构建了写通用的参数，例如：cluster、url、component、service等。
     '''
+    # family name -> bool of a scrape which selected some families, None for a full scrape
+    _selection = None
+    # the steps of a scrape traced as spans while tracing is enabled: method -> span name.
+    # Every _get_<group>_metrics(bean) method is traced too, as "extract <group>".
+    TRACED_STEPS = {
+        '_get_beans': 'beans',
+        '_setup_metrics_labels': 'index',
+        '_setup_labels': 'index',
+        '_get_metrics': 'extract',
+    }
+    _EXTRACT_METHOD = re.compile(r'^_get_(\w+)_metrics$')
+    # when the beans of a scrape were there, while the cost of the MBeans is accounted
+    _extract_start = None
+
     def __init__(self, cluster, url, component, service):
         '''
         @param cluster: 集群名称, 在配置文件配置或者通过命令行设置.
@@ -35,20 +93,89 @@ class MetricCol(object):
         self._prefix = 'hadoop_{0}_{1}'.format(component, service)
         # 获取以服务名命名的所有JSON文件列表，例如：namenode，会将namenode中的所有文件夹中的json文件加载
         # 获取到的是文件名
-        self._file_list = utils.get_file_list(service)
+        self._file_list = catalog.get_file_list(service)
         # 获取common目录中的所有json文件
-        self._common_file = utils.get_file_list("common")
+        self._common_file = catalog.get_file_list("common")
         # 整合所有json文件
         self._merge_list = self._file_list + self._common_file
         # 用于保存指标对象
         self._metrics = {}
         for i in range(len(self._file_list)):
             # 设置文件名，并读取对应的指标配置文件（JSON文件）
-            self._metrics.setdefault(self._file_list[i], utils.read_json_file(service, self._file_list[i]))
+            self._metrics.setdefault(self._file_list[i], catalog.read_catalog(service, self._file_list[i]))
+        # 预编译每个指标配置中的百分位直方图（_num_ops/_NNth_percentile, NumOps/NNthPercentile...）
+        self._percentiles = dict((name, catalog.read_plan(service, name)) for name in self._file_list)
+        # 抓取间隔(秒)，0表示每次collect都抓取；否则在间隔内重复使用上一次的beans
+        self._scrape_interval = 0
+        # 跨抓取保存的状态(上一次的beans、分级抓取、精简查询计划)，并发抓取共享，见_PollState
+        # 分级抓取(tiers/<service>.yaml)未启用时tiers为None，每次抓取完整的/jmx
+        self._poll = _PollState(tiers.get_scheduler(service, self._url))
+        # 本次抓取所用beans的抓取时间
+        self._beans_time = 0
+        # 关键master(NameNode、ResourceManager、HBase Master)在RPC队列饱和时降低抓取频率，未启用时为None
+        self._throttle = throttle.get_throttle(service)
+        # 单次/jmx响应的字节数、bean数上限，超出后中止并改为按指标分类逐个查询
+        utils.set_url_payload_limit(self._url, utils.get_payload_limit(service))
+        # 每秒采样少量易突增的指标(见sampler.py)，未启用时为None
+        self._sampler = sampler.get_sampler(cluster, self._url, self._prefix, service)
+        # 按服务抓取(/metrics/<name>、collect[]=<name>)时匹配的名称，例如：hdfs_namenode、namenode
+        self.scrape_names = frozenset(['{0}_{1}'.format(component, service), service,
+                                       type(self).__module__.rpartition('.')[2]])
+        if self._sampler is not None:
+            self._sampler.scrape_names = self.scrape_names
+        # 每个bean按名称中的指标分类计入成本(见beancost.py)
+        beancost.set_catalogs(self._url, self._merge_list)
 
     def collect(self):
         '''
-        所有的Collector都要实现collect方法.
+        Every scrape runs _collect on its own shallow copy of the collector: the families a
+        scrape builds on self (self._clear_init, self._hadoop_*_metrics...) are never seen by a
+        concurrent scrape, e.g. of a second Prometheus server. What outlives a scrape is kept
+        in self._poll, shared by the copies.
+        '''
+        return self._scrape(None)
+
+    def collect_families(self, match):
+        '''
+        A scrape of the families whose names match: only the catalogs holding such families
+        are fetched and parsed, see _get_selected_beans. Families which do not match may
+        still be returned and are dropped by the caller.
+        @param match: function(family name) returning whether the family is selected.
+        '''
+        return self._scrape(match)
+
+    def _scrape(self, selection):
+        scrape = copy.copy(self)
+        scrape._selection = selection
+        if beancost.enabled():
+            scrape._get_beans = scrape._timed_beans
+        if tracing.enabled():
+            scrape._trace_steps()
+        families = tracing.traced_scrape(type(self).__name__, scrape._collect())
+        return profiler.profiled(self, memory.tracked(self, families))
+
+    def _trace_steps(self):
+        '''
+        Replace the steps of this scrape copy by traced ones, see TRACED_STEPS.
+        '''
+        collector = type(self).__name__
+        for name in dir(type(self)):
+            step = self.TRACED_STEPS.get(name)
+            if step is None:
+                match = self._EXTRACT_METHOD.match(name)
+                if match is None:
+                    continue
+                step = 'extract ' + match.group(1)
+            setattr(self, name, tracing.traced(getattr(self, name), step, collector=collector))
+
+    def _timed_beans(self):
+        beans = MetricCol._get_beans(self)
+        self._extract_start = time.time()
+        return beans
+
+    def _collect(self):
+        '''
+        所有的Collector都要实现_collect方法.
 
         # 从URL/JMX读取数据
         metrics = get_metrics(self._base_url)
@@ -60,7 +187,173 @@ class MetricCol(object):
         # add metrics
         self._get_metrics(beans)
         '''
-        pass
+        return iter(())
+
+    def _get_beans(self):
+        '''
+        Scrape the beans of self._url. With a scrape interval the previous beans are served
+        again until the interval has elapsed, e.g. for the low-frequency NodeManager scrapes.
+        A throttled master is polled at most every throttle interval the same way.
+        Concurrent scrapes fetch one after the other; the second one usually gets the first
+        one's response from utils.get_metrics.
+        '''
+        poll = self._poll
+        if self._selection is not None:
+            beans = self._get_selected_beans()
+            if beans is not None:
+                return beans
+        with poll.lock:
+            interval = self._reuse_interval()
+            now = time.time()
+            if not interval or poll.beans is None or now - poll.time >= interval:
+                beans = self._fetch_beans()
+                if not beans:
+                    return beans
+                poll.beans, poll.time = beans, now
+            self._beans_time = poll.time
+            return poll.beans
+
+    def _reuse_interval(self):
+        interval = self._scrape_interval
+        if self._throttle is not None:
+            interval = max(interval, self._throttle.interval())
+        return interval
+
+    def _get_selected_beans(self):
+        '''
+        The beans of a scrape selecting some families: one ?qry= per catalog holding a
+        selected family, so the other MBeans are never requested. Which catalog builds which
+        families is learned from the last full scrape (see _catalog_families), and which of
+        REDUCED_PLAN_PATTERNS names a catalog from the first selected fetch of it.
+        @return the beans, or None when the full beans are needed: nothing is learned yet or
+                it is older than CATALOG_FAMILIES_MAX_AGE, or the last full beans are still
+                served anyway (scrape interval, throttled master).
+        '''
+        poll = self._poll
+        now = time.time()
+        with poll.lock:
+            if poll.catalog_families is None or now - poll.catalog_families_time >= CATALOG_FAMILIES_MAX_AGE:
+                return None
+            interval = self._reuse_interval()
+            if interval and poll.beans is not None and now - poll.time < interval:
+                return None
+            catalogs = [name for name in self._merge_list
+                        if any(self._selection(family) for family in poll.catalog_families.get(name, ()))]
+            known = dict((name, poll.catalog_patterns.get(name)) for name in catalogs)
+        beans, seen, learned = [], set(), {}
+        for name in catalogs:
+            patterns = known[name]
+            if patterns is None:
+                patterns = [pattern.format(name) for pattern in REDUCED_PLAN_PATTERNS]
+                learned[name] = []
+            for pattern in patterns:
+                try:
+                    result = utils.get_metrics(self._url, params={'qry': pattern})
+                except utils.PayloadTooLarge as e:
+                    logger.warning("{0}, leaving {1} out of the selected scrape".format(e, pattern))
+                    continue
+                if result and name in learned:
+                    learned[name].append(pattern)
+                for bean in result:
+                    if bean.get('name') not in seen:
+                        seen.add(bean.get('name'))
+                        beans.append(bean)
+        # a catalog none of the patterns matched is tried again next time
+        learned = dict((name, patterns) for name, patterns in learned.items() if patterns)
+        if learned:
+            with poll.lock:
+                poll.catalog_patterns.update(learned)
+        self._beans_time = now
+        return beans
+
+    def _catalog_families(self, metrics):
+        '''
+        Yield the families of every catalog, in self._merge_list order. A full scrape also
+        records which catalog built which families, for the scrapes selecting some families.
+        @param metrics: catalog -> {key: family}, e.g. self._hadoop_namenode_metrics.
+        '''
+        if self._selection is None:
+            learned = dict((name, frozenset(family.name for family in metrics[name].values()))
+                           for name in self._merge_list)
+            if any(learned.values()):
+                with self._poll.lock:
+                    self._poll.catalog_families, self._poll.catalog_families_time = learned, time.time()
+        if self._extract_start is not None:
+            series = dict((name, sum(len(family.samples) for family in metrics[name].values()))
+                          for name in self._merge_list)
+            beancost.observe_scrape(self._url, series, time.time() - self._extract_start)
+        for name in self._merge_list:
+            for family in metrics[name].values():
+                yield family
+
+    def _fetch_beans(self):
+        '''
+        The full dump of self._url, or the merged tier snapshots when tiered polling is enabled.
+        While throttled only the hot tier and the pressure MBeans are fetched. A response over
+        the payload limits falls back to the reduced query plan for REDUCED_PLAN_RETRY seconds.
+        '''
+        if time.time() < self._poll.reduced_until:
+            return self._fetch_reduced()
+        try:
+            return self._fetch_full()
+        except utils.PayloadTooLarge as e:
+            logger.warning("{0}, fetching the catalogs one by one for {1}s".format(e, REDUCED_PLAN_RETRY))
+            self._poll.reduced_until = time.time() + REDUCED_PLAN_RETRY
+            self._poll.reduced_plan = None
+            return self._fetch_reduced()
+
+    def _fetch_full(self):
+        poll = self._poll
+        if self._throttle is not None:
+            if poll.tiers is None:
+                # a single full dump tier, so that the hot set can be merged into the last dump
+                poll.tiers = tiers.TierScheduler(self._url, tiers.FULL_DUMP)
+            return poll.tiers.fetch(minimal=self._throttle.entries if self._throttle.level else None)
+        if poll.tiers is not None:
+            return poll.tiers.fetch()
+        return utils.get_metrics(self._url)
+
+    def _fetch_reduced(self):
+        '''
+        One ?qry= per catalog (and common catalog) instead of the full dump, so MBeans which
+        no catalog reads are never fetched and a runaway MBean only loses its own metrics.
+        The first round tries every property key a catalog may be named by and keeps the
+        patterns which matched; a pattern over the payload limits is left out of the plan.
+        '''
+        if self._poll.reduced_plan is None:
+            patterns = [pattern.format(name) for name in self._merge_list for pattern in REDUCED_PLAN_PATTERNS]
+            learning = True
+        else:
+            patterns, learning = self._poll.reduced_plan, False
+        beans, seen, plan = [], set(), []
+        for pattern in patterns:
+            try:
+                result = utils.get_metrics(self._url, params={'qry': pattern})
+            except utils.PayloadTooLarge as e:
+                logger.warning("{0}, leaving {1} out of the reduced plan".format(e, pattern))
+                continue
+            if result:
+                plan.append(pattern)
+            for bean in result:
+                if bean.get('name') not in seen:
+                    seen.add(bean.get('name'))
+                    beans.append(bean)
+        if learning and plan:
+            self._poll.reduced_plan = plan
+        return beans
+
+    def _observe_pressure(self, pressure):
+        '''
+        @param pressure: (RPC call queue length, RPC queue time in milliseconds) of the last beans.
+        @return the families of the throttle state, empty when throttling is disabled.
+        '''
+        if self._throttle is None:
+            return []
+        with self._poll.lock:
+            # a selected scrape may not have fetched the RPC beans at all
+            if self._selection is None:
+                self._throttle.observe(pressure, self._beans_time)
+            return self._throttle.metrics(self._prefix, self._cluster)
 
     def _setup_metrics_labels(self):
         pass
@@ -68,6 +361,100 @@ class MetricCol(object):
     def _get_metrics(self, metrics):
         pass
 
+    def _setup_percentile_labels(self, metrics, service, label, names=None):
+        '''
+        Create one HistogramMetricFamily per percentile group of the service catalog.
+        @param metrics: the per-service dict of metric families to fill, e.g. self._hadoop_hbase_metrics[service].
+        @param names: optional {group: (name, descriptions)}, defaults to the snake_case group name.
+        '''
+        for group in self._percentiles[service].histograms:
+            if names and group in names:
+                name, descriptions = names[group]
+            else:
+                name = "_".join([service.lower(), re.sub('([a-z0-9])([A-Z])', r'\1_\2', group).lower()])
+                descriptions = "The percentile of {0} of {1}".format(group, service)
+            metrics[group] = HistogramMetricFamily("_".join([self._prefix, name]),
+                                                   descriptions,
+                                                   labels=label)
+
+    def _get_percentile_metrics(self, metrics, service, bean, label):
+        for group, histogram in self._percentiles[service].histograms.items():
+            if group in metrics:
+                filled = histogram.fill(bean)
+                if filled is not None:
+                    metrics[group].add_metric(label, buckets=filled[0], sum_value=filled[1])
+
+def _jvm_attribute(metric):
+    '''
+    @return (family key, label suffix) of a JvmMetrics attribute, e.g. MemHeapUsedM -> (jvm_mem_used_mebibytes, (Heap,)).
+    '''
+    name = "_".join(["jvm", re.sub('([a-z0-9])([A-Z])', r'\1_\2', metric).lower()])
+    if 'Mem' in metric:
+        if "Used" in metric:
+            return "jvm_mem_used_mebibytes", (metric.split("Used")[0].split("Mem")[1],)
+        elif "Committed" in metric:
+            return "jvm_mem_committed_mebibytes", (metric.split("Committed")[0].split("Mem")[1],)
+        elif "Max" in metric:
+            if "Heap" in metric:
+                return "jvm_mem_max_mebibytes", (metric.split("Max")[0].split("Mem")[1],)
+            return "jvm_mem_max_mebibytes", ("max",)
+        return "".join([name, 'ebibytes']), ()
+    elif 'Gc' in metric:
+        if "GcCount" in metric:
+            return "jvm_gc_count", ("total" if "GcCount" == metric else metric.split("GcCount")[1],)
+        elif "GcTimeMillis" in metric:
+            return "jvm_gc_time_milliseconds", ("total" if "GcTimeMillis" == metric else metric.split("GcTimeMillis")[1],)
+        elif "ThresholdExceeded" in metric:
+            return "jvm_gc_exceeded_threshold_total", (metric.split("ThresholdExceeded")[0].split("GcNum")[1],)
+        return name, ()
+    elif 'Threads' in metric:
+        return "jvm_threads_state_total", (metric.split("Threads")[1],)
+    elif 'Log' in metric:
+        return "jvm_log_level_total", (metric.split("Log")[1],)
+    return name, ()
+
+
+def _rpc_attribute(metric):
+    if "NumOps" in metric:
+        return "MethodNumOps", (metric.split('NumOps')[0],)
+    elif "AvgTime" in metric:
+        return "MethodAvgTime", (metric.split('AvgTime')[0],)
+    return metric, ()
+
+
+def _rpc_detailed_attribute(metric):
+    if "NumOps" in metric:
+        return "NumOps", (metric.split('NumOps')[0],)
+    elif "AvgTime" in metric:
+        return "AvgTime", (metric.split("AvgTime")[0],)
+    # not a per-method attribute, no family
+    return None, ()
+
+
+def _ugi_attribute(metric):
+    for key in ('NumOps', 'AvgTime'):
+        if key in metric:
+            if 'Login' in metric:
+                return key, ('Login', metric.split('Login')[1].split(key)[0])
+            return key, (metric.split(key)[0],)
+    return metric, ()
+
+
+def _metric_system_attribute(metric):
+    for key in ('NumOps', 'AvgTime'):
+        if key in metric:
+            return key, (metric.split(key)[0],)
+    return metric, ()
+
+
+# the (family key, label suffix) of every common attribute, resolved once per process
+_JVM_PLAN = AttributePlan(_jvm_attribute)
+_RPC_PLAN = AttributePlan(_rpc_attribute)
+_RPC_DETAILED_PLAN = AttributePlan(_rpc_detailed_attribute)
+_UGI_PLAN = AttributePlan(_ugi_attribute)
+_METRICS_SYSTEM_PLAN = AttributePlan(_metric_system_attribute)
+
+
 def common_metrics_info(cluster, beans, component, service):
     '''
     为所有服务实现的处理相同的指标数据定义的闭包。
@@ -76,15 +463,18 @@ def common_metrics_info(cluster, beans, component, service):
     tmp_metrics = {}
     common_metrics = {}
     _cluster = cluster
+    # label tuples of the cluster, shared by every scrape, see labels.py
+    _labels = labels.get_label_sets(cluster)
     _prefix = 'hadoop_{0}_{1}'.format(component, service)
     # 读取common下的所有json指标配置
-    _metrics_type = utils.get_file_list("common")
+    # 指标配置在进程内只解析一次，见catalog.py
+    _metrics_type = catalog.get_file_list("common")
 
     for i in range(len(_metrics_type)):
         common_metrics.setdefault(_metrics_type[i], {})
         # 加载所有指标到字典
         # 这里取名为tmp，因为它总是会被添加到具体组件实现中
-        tmp_metrics.setdefault(_metrics_type[i], utils.read_json_file("common", _metrics_type[i]))
+        tmp_metrics.setdefault(_metrics_type[i], catalog.read_catalog("common", _metrics_type[i]))
 
 
     def setup_jvm_labels():
@@ -310,155 +700,51 @@ def common_metrics_info(cluster, beans, component, service):
 
     def get_jvm_metrics(bean):
         for metric in tmp_metrics['JvmMetrics']:
-            name = "_".join(["jvm", re.sub('([a-z0-9])([A-Z])', r'\1_\2', metric).lower()])
-            if 'Mem' in metric:
-                if "Used" in metric:
-                    key = "jvm_mem_used_mebibytes"
-                    mode = metric.split("Used")[0].split("Mem")[1]
-                    label = [_cluster, mode]
-                elif "Committed" in metric:
-                    key = "jvm_mem_committed_mebibytes"
-                    mode = metric.split("Committed")[0].split("Mem")[1]
-                    label = [_cluster, mode]
-                elif "Max" in metric:
-                    key = "jvm_mem_max_mebibytes"
-                    if "Heap" in metric:
-                        mode = metric.split("Max")[0].split("Mem")[1]
-                    else:
-                        mode = "max"
-                    label = [_cluster, mode]
-                else:
-                    key = "".join([name, 'ebibytes'])
-                    label = [_cluster]
-                
-            elif 'Gc' in metric:
-                if "GcCount" in metric:
-                    key = "jvm_gc_count"
-                    if "GcCount" == metric:
-                        typo = "total"
-                    else:
-                        typo = metric.split("GcCount")[1]
-                    label = [_cluster, typo]
-                elif "GcTimeMillis" in metric:
-                    key = "jvm_gc_time_milliseconds"
-                    if "GcTimeMillis" == metric:
-                        typo = "total"
-                    else:
-                        typo = metric.split("GcTimeMillis")[1]
-                    label = [_cluster, typo]
-                elif "ThresholdExceeded" in metric:
-                    key = "jvm_gc_exceeded_threshold_total"
-                    typo = metric.split("ThresholdExceeded")[0].split("GcNum")[1]
-                    label = [_cluster, typo]
-                else:
-                    key = name
-                    label = [_cluster]
-            elif 'Threads' in metric:
-                key = "jvm_threads_state_total"
-                state = metric.split("Threads")[1]
-                label = [_cluster, state]
-            elif 'Log' in metric:
-                key = "jvm_log_level_total"
-                level = metric.split("Log")[1]
-                label = [_cluster, level]
-            else:
-                key = name
-                label = [_cluster]
-            common_metrics['JvmMetrics'][key].add_metric(label,
+            key, suffix = _JVM_PLAN[metric]
+            common_metrics['JvmMetrics'][key].add_metric(_labels[suffix],
                                                          bean[metric] if metric in bean else 0)
         return common_metrics
 
     def get_os_metrics(bean):
         for metric in tmp_metrics['OperatingSystem']:
-            label = [_cluster]
-            common_metrics['OperatingSystem'][metric].add_metric(label,
+            common_metrics['OperatingSystem'][metric].add_metric(_labels.prefix,
                                                                  bean[metric] if metric in bean else 0)
         return common_metrics
 
     def get_rpc_metrics(bean):
-        rpc_tag = bean['tag.port']
+        rpc_labels = labels.get_label_sets(_cluster, bean['tag.port'])
         for metric in tmp_metrics['RpcActivity']:
-            if "NumOps" in metric:
-                method = metric.split('NumOps')[0]
-                label = [_cluster, rpc_tag, method]
-                key = "MethodNumOps"
-            elif "AvgTime" in metric:
-                method = metric.split('AvgTime')[0]
-                label = [_cluster, rpc_tag, method]
-                key = "MethodAvgTime"
-            else:
-                label = [_cluster, rpc_tag]
-                key = metric
-            common_metrics['RpcActivity'][key].add_metric(label,
+            key, suffix = _RPC_PLAN[metric]
+            common_metrics['RpcActivity'][key].add_metric(rpc_labels[suffix],
                                                           bean[metric] if metric in bean else 0)
         return common_metrics
 
     def get_rpc_detailed_metrics(bean):
-        detail_tag = bean['tag.port']
+        detail_labels = labels.get_label_sets(_cluster, bean['tag.port'])
         for metric in bean:
             if metric[0].isupper():
-                label = [_cluster, detail_tag]
-                if "NumOps" in metric:
-                    key = "NumOps"
-                    method = metric.split('NumOps')[0]
-                    label = [_cluster, detail_tag, method]
-                elif "AvgTime" in metric:
-                    key = "AvgTime"
-                    method = metric.split("AvgTime")[0]
-                    label = [_cluster, detail_tag, method]                    
-                else:
-                    pass
-                common_metrics['RpcDetailedActivity'][key].add_metric(label,
+                key, suffix = _RPC_DETAILED_PLAN[metric]
+                if key is None:
+                    continue
+                common_metrics['RpcDetailedActivity'][key].add_metric(detail_labels[suffix],
                                                                       bean[metric])
         return common_metrics
 
     def get_ugi_metrics(bean):
         for metric in tmp_metrics['UgiMetrics']:
-            if 'NumOps' in metric:
-                key = 'NumOps'
-                if 'Login' in metric:
-                    method = 'Login'
-                    state = metric.split('Login')[1].split('NumOps')[0]
-                    label = [_cluster, method, state]
-                else:
-                    method = metric.split('NumOps')[0]
-                    label = [_cluster, method]
-                # common_metrics['UgiMetrics'][key].add_metric(label, bean[metric] if metric in bean and bean[metric] else 0)
-            elif 'AvgTime' in metric:
-                key = 'AvgTime'
-                if 'Login' in metric:
-                    method = 'Login'
-                    state = metric.split('Login')[1].split('AvgTime')[0]
-                    label = [_cluster, method, state]
-                else:
-                    method = metric.split('AvgTime')[0]
-                    label = [_cluster, method]
-                # common_metrics['UgiMetrics'][key].add_metric(label, bean[metric] if metric in bean and bean[metric] else 0)
-            else:
-                key = metric
-                label = [_cluster]
-            common_metrics['UgiMetrics'][key].add_metric(label, bean[metric] if metric in bean and bean[metric] else 0)
+            key, suffix = _UGI_PLAN[metric]
+            common_metrics['UgiMetrics'][key].add_metric(_labels[suffix], bean[metric] if metric in bean and bean[metric] else 0)
         return common_metrics
 
     def get_metric_system_metrics(bean):
         for metric in tmp_metrics['MetricsSystem']:
-            if 'NumOps' in metric:
-                key = 'NumOps'
-                oper = metric.split('NumOps')[0]
-                label = [_cluster, oper]
-            elif 'AvgTime' in metric:
-                key = 'AvgTime'
-                oper = metric.split('AvgTime')[0]
-                label = [_cluster, oper]
-            else:
-                key = metric
-                label = [_cluster]
-            common_metrics['MetricsSystem'][key].add_metric(label, bean[metric] if metric in bean and bean[metric] else 0)
+            key, suffix = _METRICS_SYSTEM_PLAN[metric]
+            common_metrics['MetricsSystem'][key].add_metric(_labels[suffix], bean[metric] if metric in bean and bean[metric] else 0)
         return common_metrics
 
     def get_runtime_metrics(bean):
+        label = labels.get_label_sets(_cluster, bean['Name'].split("@")[1]).prefix
         for metric in tmp_metrics['Runtime']:
-            label = [_cluster, bean['Name'].split("@")[1]]
             common_metrics['Runtime'][metric].add_metric(label, bean[metric] if metric in bean and bean[metric] else 0)
         return common_metrics
 
@@ -491,8 +777,34 @@ def common_metrics_info(cluster, beans, component, service):
 
         return common_metrics
 
+    if tracing.enabled():
+        setup_labels = tracing.traced(setup_labels, 'index common', component=component)
+        get_jvm_metrics = tracing.traced(get_jvm_metrics, 'extract JvmMetrics')
+        get_os_metrics = tracing.traced(get_os_metrics, 'extract OperatingSystem')
+        get_rpc_metrics = tracing.traced(get_rpc_metrics, 'extract RpcActivity')
+        get_rpc_detailed_metrics = tracing.traced(get_rpc_detailed_metrics, 'extract RpcDetailedActivity')
+        get_ugi_metrics = tracing.traced(get_ugi_metrics, 'extract UgiMetrics')
+        get_metric_system_metrics = tracing.traced(get_metric_system_metrics, 'extract MetricsSystem')
+        get_runtime_metrics = tracing.traced(get_runtime_metrics, 'extract Runtime')
+
     return get_metrics
 
+def rpc_pressure(rpc_metrics):
+    '''
+    The RPC pressure signals among the families filled by get_rpc_metrics.
+    @param rpc_metrics: the RpcActivity families of common_metrics_info, e.g. common_metrics()['RpcActivity'].
+    @return (call queue length, RPC queue time in milliseconds), the largest over all RPC ports.
+    '''
+    queue_length, queue_time = 0, 0
+    if 'CallQueueLength' in rpc_metrics:
+        for sample in rpc_metrics['CallQueueLength'].samples:
+            queue_length = max(queue_length, sample.value)
+    if 'MethodAvgTime' in rpc_metrics:
+        for sample in rpc_metrics['MethodAvgTime'].samples:
+            if sample.labels.get('method') == 'RpcQueueTime':
+                queue_time = max(queue_time, sample.value)
+    return queue_length, queue_time
+
 def main():
     cluster = "cluster_indata"
     beans = utils.get_metrics("http://10.110.13.164:50070/jmx")
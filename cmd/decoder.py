@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import glob
+import json
+import os
+import sys
+import time
+
+# no logger here: utils decodes every response with this module and imports it first.
+
+# backends in order of preference, the first importable one is the default.
+BACKENDS = ('orjson', 'ujson', 'simdjson', 'json')
+
+
+def _load_orjson():
+    import orjson
+    return orjson.loads
+
+
+def _load_ujson():
+    import ujson
+    try:
+        # ujson 1.x rounds floats unless asked not to, the values must match the json module.
+        ujson.loads('1.0', precise_float=True)
+    except TypeError:
+        # ujson >= 2 has no precise_float and is always precise
+        return ujson.loads
+    return lambda data: ujson.loads(data, precise_float=True)
+
+
+def _load_simdjson():
+    import simdjson
+    return simdjson.loads
+
+
+def _load_json():
+    return json.loads
+
+
+_LOADERS = {
+    'orjson': _load_orjson,
+    'ujson': _load_ujson,
+    'simdjson': _load_simdjson,
+    'json': _load_json,
+}
+
+
+def available_backends():
+    '''
+    @return {backend name: loads function} of every importable backend.
+    '''
+    backends = {}
+    for name in BACKENDS:
+        try:
+            backends[name] = _LOADERS[name]()
+        except ImportError:
+            continue
+    return backends
+
+
+def _select(name=None):
+    backends = available_backends()
+    if name and name != 'auto':
+        if name not in backends:
+            raise ValueError("json decoder {0} is not installed, available: {1}".format(name, ", ".join(sorted(backends))))
+        return name, backends[name]
+    for name in BACKENDS:
+        if name in backends:
+            return name, backends[name]
+
+
+# selected once at import time, see set_backend
+BACKEND, _loads = _select()
+
+
+def set_backend(name):
+    '''
+    @param name: one of BACKENDS, or "auto" for the fastest installed one.
+    '''
+    global BACKEND, _loads
+    BACKEND, _loads = _select(name)
+
+
+def loads(data):
+    '''
+    Decode a JSON document straight from the raw response bytes, without decoding them to
+    text first as response.json() does.
+    @param data: the response body, bytes (str) encoded in UTF-8.
+    '''
+    return _loads(data)
+
+
+def main():
+    '''
+    Benchmark every installed backend on the test fixtures and check that they decode
+    to the same values:
+
+        python cmd/decoder.py [fixture.json ...]
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    files = sys.argv[1:] or sorted(glob.glob(os.path.join(root, 'test', '*', '*.json')))
+    backends = available_backends()
+    print "backends: {0} (default {1})".format(", ".join(n for n in BACKENDS if n in backends), BACKEND)
+    for path in files:
+        with open(path, 'rb') as f:
+            data = f.read()
+        expected = json.loads(data)
+        rounds = max(10, 2000000 // max(len(data), 1))
+        line = ["{0:<40} {1:>7}B".format(os.path.relpath(path, root), len(data))]
+        for name in BACKENDS:
+            if name not in backends:
+                continue
+            decode = backends[name]
+            assert decode(data) == expected, "{0} decodes {1} differently".format(name, path)
+            start = time.time()
+            for i in range(rounds):
+                decode(data)
+            line.append("{0} {1:.3f}ms".format(name, (time.time() - start) * 1000.0 / rounds))
+        print "  ".join(line)
+
+
+if __name__ == '__main__':
+    main()
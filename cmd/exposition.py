@@ -0,0 +1,964 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import fnmatch
+import math
+import os
+import Queue
+import re
+import select
+import socket
+import struct
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler
+from urllib import unquote
+from urlparse import parse_qs, urlparse
+
+from prometheus_client.core import REGISTRY, GaugeMetricFamily, CounterMetricFamily
+from prometheus_client.utils import floatToGoString
+
+import tracing
+from utils import get_module_logger
+
+logger = get_module_logger(__name__)
+
+
+CONTENT_TYPE_TEXT = 'text/plain; version=0.0.4; charset=utf-8'
+CONTENT_TYPE_OPENMETRICS = 'application/openmetrics-text; version=0.0.1; charset=utf-8'
+CONTENT_TYPE_PROTOBUF = 'application/vnd.google.protobuf; proto=io.prometheus.client.MetricFamily; encoding=delimited'
+
+# io.prometheus.client.MetricType
+PB_COUNTER, PB_GAUGE, PB_SUMMARY, PB_UNTYPED, PB_HISTOGRAM = 0, 1, 2, 3, 4
+PB_TYPES = {
+    'counter': PB_COUNTER,
+    'gauge': PB_GAUGE,
+    'summary': PB_SUMMARY,
+    'histogram': PB_HISTOGRAM,
+    'gaugehistogram': PB_HISTOGRAM,
+    'info': PB_GAUGE,
+    'stateset': PB_GAUGE,
+}
+
+# label values (cluster, host, method...) repeat across every family and every scrape,
+# so the escaped/encoded form of each one is kept, up to this many distinct values.
+MAX_CACHED_LABEL_VALUES = 100000
+
+# the exposition server, see ExpositionServer: worker threads, requests waiting for a worker,
+# renders of the registry running at once, and how long a rendered snapshot is served again.
+SERVER_WORKERS = 8
+SERVER_MAX_PENDING = 32
+SERVER_MAX_RENDERS = 2
+SNAPSHOT_MAX_AGE = 1.0
+# snapshots kept for distinct selections (/metrics/<name>, collect[]=, family[]=) and formats
+MAX_SNAPSHOTS = 64
+# what the collectors of the exporter itself answer to, e.g. /metrics/exporter
+EXPORTER_SCRAPE_NAME = 'exporter'
+# open connections, idle seconds before a keep-alive connection is closed, largest request head
+# and seconds a response may take to send.
+MAX_CONNECTIONS = 256
+KEEPALIVE_TIMEOUT = 120
+MAX_REQUEST_HEAD = 16 << 10
+SEND_TIMEOUT = 30
+
+
+def _escape_help(text, openmetrics=False):
+    text = text.replace('\\', r'\\').replace('\n', r'\n')
+    if openmetrics:
+        text = text.replace('"', r'\"')
+    return text
+
+
+def _escape_label_value(value):
+    if not isinstance(value, basestring):
+        value = unicode(value)
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _to_bytes(text):
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+    return text
+
+
+def _varint(value):
+    '''
+    protobuf base-128 varint, negative numbers are written as 10-byte two's complement.
+    '''
+    if value < 0:
+        value += 1 << 64
+    out = bytearray()
+    while True:
+        bits = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _pb_key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _pb_bytes(field, data):
+    return _pb_key(field, 2) + _varint(len(data)) + data
+
+
+def _pb_double(field, value):
+    return _pb_key(field, 1) + struct.pack('<d', float(value))
+
+
+def _pb_uint(field, value):
+    return _pb_key(field, 0) + _varint(int(value))
+
+
+def _pb_count(field, float_field, value):
+    '''
+    A histogram or summary count: the uint64 field when the value is a finite non-negative
+    integer, else the double float_field (cumulative_count_float, sample_count_float), e.g.
+    for the NaN or fractional buckets of a percentile histogram. A summary has no double
+    count, its count is left out then.
+    '''
+    value = float(value)
+    if value >= 0 and not math.isinf(value) and value == int(value):
+        return _pb_uint(field, value)
+    if float_field is None:
+        return b''
+    return _pb_double(float_field, value)
+
+
+def _parse_bound(value):
+    if value in ('+Inf', 'Inf', '+inf', 'inf'):
+        return float('inf')
+    return float(value)
+
+
+class _FamilyHeader(object):
+    '''
+    Everything about a metric family which does not change between scrapes: the exposed
+    name, the escaped HELP/TYPE lines for both text formats and the protobuf family prefix.
+    '''
+    __slots__ = ('name', 'type', 'text', 'openmetrics', 'pb_prefix', 'skip')
+
+    def __init__(self, metric):
+        mname = metric.name
+        mtype = metric.type
+        # Munging from OpenMetrics into Prometheus format, same as prometheus_client.
+        if mtype == 'counter':
+            mname = mname + '_total'
+        elif mtype == 'info':
+            mname = mname + '_info'
+            mtype = 'gauge'
+        elif mtype == 'stateset':
+            mtype = 'gauge'
+        elif mtype == 'gaugehistogram':
+            mtype = 'histogram'
+        elif mtype == 'unknown':
+            mtype = 'untyped'
+        self.name = mname
+        self.type = mtype
+        self.text = _to_bytes(u'# HELP {0} {1}\n# TYPE {0} {2}\n'.format(mname, _escape_help(metric.documentation), mtype))
+        om = u'# HELP {0} {1}\n# TYPE {0} {2}\n'.format(metric.name, _escape_help(metric.documentation, True), metric.type)
+        if metric.unit:
+            om += u'# UNIT {0} {1}\n'.format(metric.name, metric.unit)
+        self.openmetrics = _to_bytes(om)
+        self.pb_prefix = (_pb_bytes(1, _to_bytes(mname)) +
+                          _pb_bytes(2, _to_bytes(metric.documentation)) +
+                          _pb_uint(3, PB_TYPES.get(metric.type, PB_UNTYPED)))
+        # OpenMetrics-only samples which the 0.0.4 text format does not carry.
+        self.skip = frozenset([metric.name + suffix for suffix in ('_created', '_gsum', '_gcount')])
+
+
+class Encoder(object):
+    '''
+    Exposition encoder which writes metric families straight into a reused bytearray.
+
+    HELP/TYPE headers, sample name prefixes and escaped label pairs are computed once per
+    family (or label value) and kept across scrapes, so the steady state of a scrape is a
+    series of bytearray appends. One buffer is kept per thread, so a single Encoder may be
+    shared by the threads of the HTTP server.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._headers = {}
+        self._names = {}
+        self._label_names = {}
+        self._label_values = {}
+
+    def _buffer(self):
+        buf = getattr(self._local, 'buf', None)
+        if buf is None:
+            buf = self._local.buf = bytearray()
+        else:
+            del buf[:]
+        return buf
+
+    def _header(self, metric):
+        key = (metric.name, metric.type, metric.documentation, metric.unit)
+        header = self._headers.get(key)
+        if header is None:
+            header = _FamilyHeader(metric)
+            with self._lock:
+                self._headers[key] = header
+        return header
+
+    def _name(self, name):
+        encoded = self._names.get(name)
+        if encoded is None:
+            encoded = self._names[name] = _to_bytes(name)
+        return encoded
+
+    def _label_name(self, name):
+        encoded = self._label_names.get(name)
+        if encoded is None:
+            encoded = self._label_names[name] = _to_bytes(name) + b'="'
+        return encoded
+
+    def _label_value(self, value):
+        encoded = self._label_values.get(value)
+        if encoded is None:
+            encoded = _to_bytes(_escape_label_value(value)) + b'"'
+            if len(self._label_values) < MAX_CACHED_LABEL_VALUES:
+                self._label_values[value] = encoded
+        return encoded
+
+    def _write_sample(self, buf, sample, openmetrics):
+        buf += self._name(sample.name)
+        labels = sample.labels
+        if labels:
+            sep = b'{'
+            for k in sorted(labels):
+                buf += sep
+                buf += self._label_name(k)
+                buf += self._label_value(labels[k])
+                sep = b','
+            buf += b'}'
+        buf += b' '
+        buf += floatToGoString(sample.value)
+        if sample.timestamp is not None:
+            if openmetrics:
+                buf += _to_bytes(u' {0}'.format(sample.timestamp))
+            else:
+                buf += b' %d' % int(float(sample.timestamp) * 1000)
+        buf += b'\n'
+
+    def encode_text(self, families):
+        '''
+        Prometheus text format 0.0.4, byte-for-byte what prometheus_client.generate_latest writes.
+        '''
+        buf = self._buffer()
+        for metric in families:
+            header = self._header(metric)
+            buf += header.text
+            om_samples = None
+            for s in metric.samples:
+                if s.name in header.skip:
+                    om_samples = om_samples or {}
+                    om_samples.setdefault(s.name, []).append(s)
+                    continue
+                self._write_sample(buf, s, False)
+            if om_samples:
+                doc = _to_bytes(_escape_help(metric.documentation))
+                for name, samples in sorted(om_samples.items()):
+                    buf += b'# HELP ' + self._name(name) + b' ' + doc + b'\n'
+                    buf += b'# TYPE ' + self._name(name) + b' gauge\n'
+                    for s in samples:
+                        self._write_sample(buf, s, False)
+        return bytes(buf)
+
+    def encode_openmetrics(self, families):
+        buf = self._buffer()
+        for metric in families:
+            buf += self._header(metric).openmetrics
+            for s in metric.samples:
+                self._write_sample(buf, s, True)
+        buf += b'# EOF\n'
+        return bytes(buf)
+
+    def _pb_labels(self, labels, skip=None):
+        out = b''
+        for k in sorted(labels):
+            if k == skip:
+                continue
+            out += _pb_bytes(1, _pb_bytes(1, _to_bytes(k)) + _pb_bytes(2, _to_bytes(labels[k] if isinstance(labels[k], basestring) else unicode(labels[k]))))
+        return out
+
+    def _pb_metrics(self, metric, header):
+        '''
+        Regroup the flat samples of one family into io.prometheus.client.Metric messages.
+        '''
+        mtype = metric.type
+        if mtype in ('histogram', 'gaugehistogram', 'summary'):
+            groups, order = {}, []
+            for s in metric.samples:
+                key = tuple(sorted((k, v) for k, v in s.labels.items() if k not in ('le', 'quantile')))
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = {'labels': s.labels, 'points': [], 'count': 0, 'sum': 0.0, 'ts': s.timestamp}
+                    order.append(key)
+                if s.name.endswith('_bucket') or (mtype == 'summary' and s.name == metric.name):
+                    group['points'].append(s)
+                elif s.name.endswith('_count') or s.name.endswith('_gcount'):
+                    group['count'] = s.value
+                elif s.name.endswith('_sum') or s.name.endswith('_gsum'):
+                    group['sum'] = s.value
+            for key in order:
+                group = groups[key]
+                if mtype == 'summary':
+                    body = _pb_count(1, None, group['count']) + _pb_double(2, group['sum'])
+                    for s in group['points']:
+                        body += _pb_bytes(3, _pb_double(1, float(s.labels['quantile'])) + _pb_double(2, s.value))
+                    payload = self._pb_labels(group['labels'], 'quantile') + _pb_bytes(4, body)
+                else:
+                    body = _pb_count(1, 4, group['count']) + _pb_double(2, group['sum'])
+                    for s in group['points']:
+                        body += _pb_bytes(3, _pb_count(1, 4, s.value) + _pb_double(2, _parse_bound(s.labels['le'])))
+                    payload = self._pb_labels(group['labels'], 'le') + _pb_bytes(7, body)
+                if group['ts'] is not None:
+                    payload += _pb_uint(6, int(float(group['ts']) * 1000))
+                yield payload
+            return
+        field = {'counter': 3, 'gauge': 2, 'info': 2, 'stateset': 2}.get(mtype, 5)
+        for s in metric.samples:
+            if s.name in header.skip:
+                continue
+            if mtype == 'counter' and s.name != header.name:
+                continue
+            payload = self._pb_labels(s.labels) + _pb_bytes(field, _pb_double(1, s.value))
+            if s.timestamp is not None:
+                payload += _pb_uint(6, int(float(s.timestamp) * 1000))
+            yield payload
+
+    def encode_protobuf(self, families):
+        '''
+        Length-delimited io.prometheus.client.MetricFamily messages.
+        '''
+        buf = self._buffer()
+        for metric in families:
+            header = self._header(metric)
+            message = bytearray(header.pb_prefix)
+            for payload in self._pb_metrics(metric, header):
+                message += _pb_bytes(4, payload)
+            buf += _varint(len(message))
+            buf += message
+        return bytes(buf)
+
+    def encode(self, families, content_type):
+        if content_type == CONTENT_TYPE_PROTOBUF:
+            return self.encode_protobuf(families)
+        elif content_type == CONTENT_TYPE_OPENMETRICS:
+            return self.encode_openmetrics(families)
+        return self.encode_text(families)
+
+
+def choose_content_type(accept_header):
+    '''
+    Pick the exposition format from the Accept header of a scrape, honouring q-values.
+    Prometheus asks for protobuf only with `proto=io.prometheus.client.MetricFamily` and
+    `encoding=delimited`, everything else falls back to the 0.0.4 text format.
+    '''
+    if not accept_header:
+        return CONTENT_TYPE_TEXT
+    best, best_q = CONTENT_TYPE_TEXT, -1.0
+    for position, accepted in enumerate(accept_header.split(',')):
+        parts = [p.strip() for p in accepted.split(';')]
+        media = parts[0].lower()
+        params = {}
+        for p in parts[1:]:
+            if '=' in p:
+                k, v = p.split('=', 1)
+                params[k.strip().lower()] = v.strip()
+        try:
+            q = float(params.get('q', 1.0))
+        except ValueError:
+            q = 0.0
+        if media == 'application/vnd.google.protobuf':
+            if params.get('proto') != 'io.prometheus.client.MetricFamily' or params.get('encoding') != 'delimited':
+                continue
+            candidate = CONTENT_TYPE_PROTOBUF
+        elif media == 'application/openmetrics-text':
+            candidate = CONTENT_TYPE_OPENMETRICS
+        elif media in ('text/plain', 'text/*', '*/*'):
+            candidate = CONTENT_TYPE_TEXT
+        else:
+            continue
+        # on a tie the first listed type wins.
+        if q > best_q:
+            best, best_q = candidate, q
+    return best
+
+
+class ScrapeSelection(object):
+    '''
+    The part of the registry one scrape asks for: the collectors named by /metrics/<name> or
+    collect[]=<name>, matched against their scrape_names (e.g. namenode or hdfs_namenode), and
+    the families named by family[]=<name>, exact names or fnmatch patterns such as
+    hadoop_hdfs_namenode_rpc_*. A collector with collect_families only fetches and parses
+    what the selected families are built from.
+    '''
+    __slots__ = ('names', 'families', 'key', '_pattern')
+
+    def __init__(self, names=(), families=()):
+        self.names = frozenset(names)
+        self.families = tuple(sorted(set(families)))
+        self.key = (self.names, self.families)
+        self._pattern = re.compile('|'.join(fnmatch.translate(family) for family in self.families))
+
+    def match(self, name):
+        '''
+        @return whether the family name is selected.
+        '''
+        return not self.families or self._pattern.match(name) is not None
+
+    def collectors(self, registry):
+        '''
+        @return the collectors of the registry the selection names, all of them without names.
+        '''
+        # CollectorRegistry has no public list of its collectors: these are the private fields
+        # of the prometheus_client pinned in requirements.txt, check them on an upgrade.
+        with registry._lock:
+            collectors = list(registry._collector_to_names)
+        if not self.names:
+            return collectors
+        return [c for c in collectors if self.names.intersection(getattr(c, 'scrape_names', ()))]
+
+    def collect(self, registry):
+        for collector in self.collectors(registry):
+            if self.families and hasattr(collector, 'collect_families'):
+                families = collector.collect_families(self.match)
+            else:
+                families = collector.collect()
+            for family in families:
+                if self.match(family.name):
+                    yield family
+
+
+class _Flight(object):
+    '''
+    One render of the registry in one format, joined by the requests arriving meanwhile.
+    '''
+    __slots__ = ('done', 'body', 'error', 'time')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.body = None
+        self.error = None
+        self.time = None
+
+
+class SnapshotRenderer(object):
+    '''
+    Serve the registry from rendered snapshots: a snapshot younger than `max_age` seconds is
+    served as it is, requests arriving during a render wait for it, and at most `max_renders`
+    renders (one per format) run at a time. Beyond that a request is shed rather than queued.
+    '''
+
+    def __init__(self, registry=REGISTRY, max_age=SNAPSHOT_MAX_AGE, max_renders=SERVER_MAX_RENDERS):
+        self._registry = registry
+        self._encoder = Encoder()
+        self._max_age = max_age
+        self._max_renders = max_renders
+        self._lock = threading.Lock()
+        # content type -> _Flight, the last or the running render
+        self._flights = {}
+        self._renders = 0
+        # seconds of the last render, the Retry-After of a shed request
+        self.last_duration = 0.0
+
+    def render(self, content_type, selection=None):
+        '''
+        @param selection: the ScrapeSelection of the scrape, None for the whole registry.
+        @return the body in the content type, None when the render was shed.
+        @raise the error of the render.
+        '''
+        key = (content_type, selection.key if selection is not None else None)
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.done.is_set() and \
+                    (flight.error is not None or time.time() - flight.time >= self._max_age):
+                flight = None
+            leader = flight is None
+            if leader:
+                if self._renders >= self._max_renders:
+                    return None
+                self._renders += 1
+                if len(self._flights) >= MAX_SNAPSHOTS:
+                    for old in [k for k, f in self._flights.items() if f.done.is_set()]:
+                        del self._flights[old]
+                flight = self._flights[key] = _Flight()
+        scrape = {} if selection is None else {'collect': sorted(selection.names), 'family': list(selection.families)}
+        if not leader:
+            with tracing.span('shared render', 'render', content_type=content_type, **scrape):
+                flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.body
+        start = time.time()
+        try:
+            with tracing.span('render', 'render', content_type=content_type, **scrape) as span:
+                families = self._registry.collect() if selection is None else selection.collect(self._registry)
+                flight.body = self._encoder.encode(families, content_type)
+                span.set(bytes=len(flight.body))
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            flight.time = time.time()
+            self.last_duration = flight.time - start
+            with self._lock:
+                self._renders -= 1
+            flight.done.set()
+        return flight.body
+
+
+class _Connection(object):
+    __slots__ = ('sock', 'address', 'buf', 'active')
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.buf = b''
+        self.active = time.time()
+
+    def next_request(self):
+        '''
+        @return (method, path, version, headers) of the next complete request head in the
+                buffer, None until one has arrived.
+        @raise ValueError on a malformed request.
+        '''
+        end = self.buf.find(b'\r\n\r\n')
+        if end < 0:
+            if len(self.buf) > MAX_REQUEST_HEAD:
+                raise ValueError("request head over {0} bytes".format(MAX_REQUEST_HEAD))
+            return None
+        head, self.buf = self.buf[:end], self.buf[end + 4:]
+        lines = head.split(b'\r\n')
+        method, path, version = lines[0].split(b' ', 2)
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(b':')
+            headers[name.strip().lower()] = value.strip()
+        return method, path, version, headers
+
+
+class ExpositionServer(object):
+    '''
+    HTTP/1.1 front end of the registry with keep-alive and admission control, in place of the
+    thread per request of prometheus_client.start_http_server.
+
+    One thread waits with select() on the listening socket and on every idle keep-alive
+    connection; a complete request is handed to a fixed pool of `workers` threads through a
+    queue of at most `max_pending` requests. A full queue, or a scrape beyond the render limit
+    of the SnapshotRenderer, is answered at once with 503 and Retry-After, so scrapes piling
+    up behind slow collectors cost neither threads nor memory. /-/healthy and /-/ready are
+    answered without touching the collectors.
+
+    @param debug_handlers: {path: function(query) returning (code, body, content type)} of the
+                           /debug endpoints, called on a worker with the parsed query string.
+    '''
+
+    def __init__(self, port, addr='', registry=REGISTRY, path='/metrics', workers=SERVER_WORKERS,
+                 max_pending=SERVER_MAX_PENDING, max_renders=SERVER_MAX_RENDERS,
+                 snapshot_max_age=SNAPSHOT_MAX_AGE, ready=True, debug_handlers=None):
+        self._path = path
+        self._debug_handlers = dict(debug_handlers or {})
+        self._registry = registry
+        self._renderer = SnapshotRenderer(registry, snapshot_max_age, max_renders)
+        self.scrape_names = frozenset([EXPORTER_SCRAPE_NAME])
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((addr, port))
+        self._listener.listen(128)
+        self._listener.setblocking(0)
+        self.server_address = self._listener.getsockname()
+        self._queue = Queue.Queue(max_pending)
+        # connections handed back by the workers, picked up by the select loop
+        self._returned = []
+        self._returned_lock = threading.Lock()
+        self._wake_read, self._wake_write = os.pipe()
+        self._idle = {}
+        self._stopped = threading.Event()
+        self._ready = threading.Event()
+        if ready:
+            self._ready.set()
+        self._stats_lock = threading.Lock()
+        # (path, code) -> responses, reason -> requests shed
+        self._responses = {}
+        self._shed = {}
+        self._threads = [threading.Thread(target=self._serve, name="exposition-select")]
+        self._threads.extend(threading.Thread(target=self._work, name="exposition-worker-{0}".format(i))
+                             for i in range(workers))
+
+    def start(self):
+        for t in self._threads:
+            t.daemon = True
+            t.start()
+        return self
+
+    def set_ready(self, ready=True):
+        '''
+        /-/ready answers 503 until the exporter is ready, e.g. until its collectors are registered.
+        '''
+        if ready:
+            self._ready.set()
+        else:
+            self._ready.clear()
+
+    def shutdown(self):
+        self._stopped.set()
+        self._wake()
+        for i in range(len(self._threads) - 1):
+            try:
+                self._queue.put_nowait(None)
+            except Queue.Full:
+                break
+
+    def _wake(self):
+        try:
+            os.write(self._wake_write, b'x')
+        except OSError:
+            pass
+
+    def _serve(self):
+        last_sweep = time.time()
+        while not self._stopped.is_set():
+            with self._returned_lock:
+                returned, self._returned = self._returned, []
+            for conn in returned:
+                # a pipelined request may already be buffered
+                if not self._dispatch(conn):
+                    self._idle[conn.sock.fileno()] = conn
+            try:
+                readable = select.select([self._listener, self._wake_read] + [c.sock for c in self._idle.values()],
+                                         [], [], 1.0)[0]
+            except (select.error, socket.error, ValueError) as e:
+                logger.warning("error in func: _serve, select failed, error msg: %s" % e)
+                self._drop_closed()
+                continue
+            for sock in readable:
+                if sock is self._listener:
+                    self._accept()
+                elif sock is self._wake_read:
+                    os.read(self._wake_read, 4096)
+                else:
+                    self._receive(self._idle.get(sock.fileno()))
+            now = time.time()
+            if now - last_sweep >= 1.0:
+                last_sweep = now
+                for fd, conn in self._idle.items():
+                    if now - conn.active >= KEEPALIVE_TIMEOUT:
+                        del self._idle[fd]
+                        self._close(conn)
+        for conn in self._idle.values():
+            self._close(conn)
+        self._listener.close()
+
+    def _drop_closed(self):
+        for fd, conn in self._idle.items():
+            try:
+                conn.sock.fileno()
+            except socket.error:
+                del self._idle[fd]
+
+    def _accept(self):
+        while True:
+            try:
+                sock, address = self._listener.accept()
+            except socket.error:
+                return
+            sock.settimeout(SEND_TIMEOUT)
+            conn = _Connection(sock, address)
+            if len(self._idle) >= MAX_CONNECTIONS:
+                self._count_shed('connections')
+                self._respond(conn, 503, b'Too many connections.\n', keep_alive=False, retry_after=True)
+                self._close(conn)
+                continue
+            self._idle[sock.fileno()] = conn
+
+    def _receive(self, conn):
+        if conn is None:
+            return
+        try:
+            data = conn.sock.recv(65536)
+        except socket.error:
+            data = b''
+        if not data:
+            del self._idle[conn.sock.fileno()]
+            self._close(conn)
+            return
+        conn.buf += data
+        conn.active = time.time()
+        fd = conn.sock.fileno()
+        if self._dispatch(conn):
+            self._idle.pop(fd, None)
+
+    def _dispatch(self, conn):
+        '''
+        @return True when the connection left the select loop: a request went to the workers,
+                or the connection was closed.
+        '''
+        try:
+            request = conn.next_request()
+        except ValueError as e:
+            self._respond(conn, 400, b'Bad request.\n', keep_alive=False)
+            self._close(conn)
+            return True
+        if request is None:
+            return False
+        try:
+            self._queue.put_nowait((conn, request))
+        except Queue.Full:
+            self._count_shed('queue')
+            keep_alive = self._respond(conn, 503, b'Too many pending scrapes.\n', request=request, retry_after=True)
+            if not keep_alive:
+                self._close(conn)
+                return True
+            return self._dispatch(conn)
+        return True
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            conn, request = item
+            try:
+                keep_alive = self._handle(conn, request)
+            except Exception as e:
+                logger.warning("error in func: _work, serve request failed, error msg: %s" % e)
+                keep_alive = False
+            if keep_alive and not self._stopped.is_set():
+                conn.active = time.time()
+                with self._returned_lock:
+                    self._returned.append(conn)
+                self._wake()
+            else:
+                self._close(conn)
+
+    def _handle(self, conn, request):
+        '''
+        @return whether the connection is kept alive.
+        '''
+        method, path, version, headers = request
+        url = urlparse(path)
+        path = url.path
+        if method not in (b'GET', b'HEAD'):
+            return self._respond(conn, 405, b'Method not allowed.\n', request=request, keep_alive=False)
+        if path == '/-/healthy':
+            return self._respond(conn, 200, b'Healthy.\n', request=request)
+        if path == '/-/ready':
+            if self._ready.is_set():
+                return self._respond(conn, 200, b'Ready.\n', request=request)
+            return self._respond(conn, 503, b'Not ready.\n', request=request)
+        if path in self._debug_handlers:
+            code, body, content_type = self._debug_handlers[path](parse_qs(url.query))
+            return self._respond(conn, code, body, request=request, content_type=content_type)
+        if path in (self._path, '/'):
+            names = []
+        elif path.startswith(self._path + '/'):
+            names = [unquote(path[len(self._path) + 1:])]
+        else:
+            return self._respond(conn, 404, b'Not found.\n', request=request)
+        query = parse_qs(url.query)
+        names.extend(query.get('collect[]', ()))
+        selection = None
+        if names or query.get('family[]'):
+            selection = ScrapeSelection(names, query.get('family[]', ()))
+            if selection.names and not selection.collectors(self._registry):
+                if not self._ready.is_set():
+                    # the collectors are registered by the first discovery pass
+                    return self._respond(conn, 503, b'Not ready.\n', request=request, retry_after=True)
+                return self._respond(conn, 404, b'No such collector.\n', request=request)
+        content_type = choose_content_type(headers.get(b'accept'))
+        try:
+            body = self._renderer.render(content_type, selection)
+        except Exception as e:
+            logger.warning("error in func: _handle, render metrics failed, error msg: %s" % e)
+            return self._respond(conn, 500, b'Error generating metric output.\n', request=request)
+        if body is None:
+            self._count_shed('renders')
+            return self._respond(conn, 503, b'Too many scrapes in flight.\n', request=request, retry_after=True)
+        return self._respond(conn, 200, body, request=request, content_type=content_type)
+
+    def _respond(self, conn, code, body, request=None, keep_alive=None, retry_after=False,
+                 content_type='text/plain; charset=utf-8'):
+        '''
+        @return whether the connection is kept alive.
+        '''
+        if keep_alive is None:
+            method, path, version, headers = request
+            connection = headers.get(b'connection', b'').lower()
+            if version == b'HTTP/1.1':
+                keep_alive = connection != b'close'
+            else:
+                keep_alive = connection == b'keep-alive'
+        head = [b'HTTP/1.1 %d %s' % (code, BaseHTTPRequestHandler.responses.get(code, ('',))[0]),
+                b'Content-Type: ' + content_type,
+                b'Content-Length: %d' % len(body),
+                b'Connection: ' + (b'keep-alive' if keep_alive else b'close')]
+        if retry_after:
+            head.append(b'Retry-After: %d' % max(1, int(math.ceil(self._renderer.last_duration))))
+        payload = b'\r\n'.join(head) + b'\r\n\r\n'
+        if request is None or request[0] != b'HEAD':
+            payload += body
+        path = urlparse(request[1]).path if request else ''
+        served = path in (self._path, '/', '/-/healthy', '/-/ready') or path in self._debug_handlers
+        if not served and (code != 200 or not path.startswith(self._path + '/')):
+            # any path may be asked for, only the served ones are worth a series
+            path = 'other'
+        with self._stats_lock:
+            key = (path, code)
+            self._responses[key] = self._responses.get(key, 0) + 1
+        try:
+            conn.sock.sendall(payload)
+        except socket.error as e:
+            logger.info("send response to {0} failed, error msg: {1}".format(conn.address, e))
+            return False
+        return keep_alive
+
+    def _count_shed(self, reason):
+        with self._stats_lock:
+            self._shed[reason] = self._shed.get(reason, 0) + 1
+
+    def _close(self, conn):
+        try:
+            conn.sock.close()
+        except socket.error:
+            pass
+
+    def collect(self):
+        '''
+        The server's own metrics, when registered in a registry.
+        '''
+        with self._stats_lock:
+            responses, shed = dict(self._responses), dict(self._shed)
+        connections = GaugeMetricFamily("hadoop_exporter_http_idle_connections",
+                                        "Keep-alive connections waiting for their next request", labels=[])
+        connections.add_metric([], len(self._idle))
+        pending = GaugeMetricFamily("hadoop_exporter_http_pending_requests",
+                                    "Requests waiting for a worker", labels=[])
+        pending.add_metric([], self._queue.qsize())
+        requests_total = CounterMetricFamily("hadoop_exporter_http_responses",
+                                             "HTTP responses of the exporter by path and status code",
+                                             labels=["path", "code"])
+        for (path, code), count in sorted(responses.items()):
+            requests_total.add_metric([path, str(code)], count)
+        shed_total = CounterMetricFamily("hadoop_exporter_http_shed_requests",
+                                         "Requests answered with 503 by the admission control",
+                                         labels=["reason"])
+        for reason in ('connections', 'queue', 'renders'):
+            shed_total.add_metric([reason], shed.get(reason, 0))
+        return [connections, pending, requests_total, shed_total]
+
+
+def start_http_server(port, addr='', registry=REGISTRY, path='/metrics', **options):
+    '''
+    Drop-in replacement of prometheus_client.start_http_server which negotiates the
+    exposition format (text, OpenMetrics or delimited protobuf) with the scraper.
+    @param options: keyword arguments of ExpositionServer, e.g. workers or max_renders.
+    @return the started ExpositionServer.
+    '''
+    return ExpositionServer(port, addr, registry, path, **options).start()
+
+
+def _pb_read_varint(data, pos):
+    value, shift = 0, 0
+    while True:
+        byte = ord(data[pos])
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def _pb_decode(data):
+    '''
+    @return [(field, value)] of one protobuf message: ints for the varints, floats for the
+            doubles, bytes for the length-delimited fields. Only reads back encode_protobuf.
+    '''
+    fields, pos = [], 0
+    while pos < len(data):
+        key, pos = _pb_read_varint(data, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _pb_read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = struct.unpack('<d', data[pos:pos + 8])[0], pos + 8
+        else:
+            size, pos = _pb_read_varint(data, pos)
+            value, pos = data[pos:pos + size], pos + size
+        fields.append((field, value))
+    return fields
+
+
+def _pb_values(message):
+    '''
+    @return the values of one decoded MetricFamily in the order of its flat samples: gauge
+            values, or per histogram the buckets, then count and sum.
+    '''
+    values = []
+    for field, metric in message:
+        if field != 4:
+            continue
+        for kind, body in _pb_decode(metric):
+            if kind == 2:
+                values.append(dict(_pb_decode(body))[1])
+            elif kind == 7:
+                histogram = _pb_decode(body)
+                for bucket in [value for field, value in histogram if field == 3]:
+                    bucket = dict(_pb_decode(bucket))
+                    values.append(bucket.get(4, bucket.get(1)))
+                histogram = dict(histogram)
+                values.extend([histogram.get(4, histogram.get(1)), histogram[2]])
+    return values
+
+
+def _same(a, b):
+    return a == b or (math.isnan(a) and math.isnan(b))
+
+
+def main():
+    from prometheus_client import generate_latest
+    from prometheus_client.openmetrics.exposition import generate_latest as generate_openmetrics
+    from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily, CollectorRegistry
+
+    class _Collector(object):
+        def collect(self):
+            g = GaugeMetricFamily("hadoop_test_gauge", "Test \"gauge\"\nmetric", labels=["cluster", "host"])
+            g.add_metric(["cluster_indata", "node1.fqdn.com"], 1.0)
+            g.add_metric(["cluster_indata", 'node"2'], 2.5)
+            yield g
+            h = HistogramMetricFamily("hadoop_test_latency_microseconds", "Test histogram", labels=["cluster"])
+            h.add_metric(["cluster_indata"], buckets=[("0.5", 3.0), ("0.99", 7.0), ("+Inf", 10.0)], sum_value=12.0)
+            yield h
+            # a percentile histogram, see percentile.py: fractional and missing (NaN) latencies
+            p = HistogramMetricFamily("hadoop_test_percentile_microseconds", "Test percentile histogram", labels=["cluster"])
+            p.add_metric(["cluster_indata"], buckets=[("50", 12.5), ("99", float('nan')), ("+Inf", 20.0)], sum_value=1.5)
+            yield p
+
+    registry = CollectorRegistry()
+    registry.register(_Collector())
+    encoder = Encoder()
+    assert encoder.encode_text(registry.collect()) == generate_latest(registry)
+    assert encoder.encode_openmetrics(registry.collect()) == generate_openmetrics(registry)
+    data = encoder.encode_protobuf(registry.collect())
+    pos = 0
+    for family in registry.collect():
+        size, pos = _pb_read_varint(data, pos)
+        message = _pb_decode(data[pos:pos + size])
+        pos += size
+        assert dict(message)[1] == family.name, family.name
+        values = [s.value for s in family.samples if not s.name.endswith('_created')]
+        assert all(_same(a, b) for a, b in zip(_pb_values(message), values)), family.name
+        assert len(_pb_values(message)) == len(values), family.name
+    assert pos == len(data)
+    print encoder.encode_openmetrics(registry.collect())
+    print repr(data)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import bisect
+import heapq
+import json
+import random
+import sys
+import time
+from array import array
+from prometheus_client.core import SummaryMetricFamily, GaugeHistogramMetricFamily, GaugeMetricFamily
+from prometheus_client.samples import Sample
+from prometheus_client.utils import floatToGoString
+
+# numpy is optional: with it a fleet of thousands of hosts is summarized without a python loop,
+# without it the same numbers are computed in pure python.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# min, median, tail and max of the fleet
+DEFAULT_QUANTILES = (0.0, 0.5, 0.9, 0.99, 1.0)
+# number of outlier hosts (largest values) exported per metric
+DEFAULT_TOP = 5
+
+
+class NodeColumns(object):
+    '''
+    A fleet of nodes reported by a master in one bean attribute (e.g. NameNodeInfo.LiveNodes,
+    RMNMInfo.LiveNodeManagers), decoded once and turned into one column per attribute.
+    '''
+
+    def __init__(self, nodes, attributes, key=None):
+        '''
+        @param nodes: {node name: {attribute: value}} or [{attribute: value}], or its JSON encoding.
+        @param attributes: the numeric attributes to keep, missing values are 0.
+        @param key: for a list of nodes, the attribute holding the node name, e.g. HostName.
+        '''
+        if isinstance(nodes, basestring):
+            nodes = json.loads(nodes)
+        nodes = nodes or {}
+        if isinstance(nodes, dict):
+            self.names = sorted(nodes)
+            self.records = [nodes[name] for name in self.names]
+        else:
+            self.records = list(nodes)
+            self.names = [r.get(key, '') for r in self.records]
+        self.size = len(self.names)
+        self.columns = {}
+        for attr in attributes:
+            self.columns[attr] = array('d', [float(r.get(attr) or 0) for r in self.records])
+
+    def column(self, attr):
+        return self.columns.get(attr) or array('d', [0.0] * self.size)
+
+    def has(self, attr):
+        return any(attr in r for r in self.records)
+
+
+def quantiles(values, qs=DEFAULT_QUANTILES):
+    '''
+    Quantiles with linear interpolation between the closest ranks (numpy's default).
+    @param values: sorted sequence of numbers.
+    '''
+    n = len(values)
+    if not n:
+        return [0.0] * len(qs)
+    result = []
+    for q in qs:
+        pos = q * (n - 1)
+        lower = int(pos)
+        upper = min(lower + 1, n - 1)
+        result.append(values[lower] + (values[upper] - values[lower]) * (pos - lower))
+    return result
+
+
+def summarize(values, qs=DEFAULT_QUANTILES, buckets=(), top=0):
+    '''
+    The distribution of one metric over a fleet.
+    @param values: the value of every node, any sequence of numbers (array('d') is not copied by numpy).
+    @param buckets: sorted upper bounds of the histogram buckets, +Inf is implicit.
+    @param top: number of largest values to report.
+    @return (count, sum, [quantile values], [cumulative bucket counts], [(value, index)] of the top nodes).
+    '''
+    if numpy is not None and len(values):
+        if isinstance(values, array):
+            data = numpy.frombuffer(values, dtype=numpy.float64)
+        else:
+            data = numpy.asarray(values, dtype=numpy.float64)
+        ordered = numpy.sort(data)
+        result_q = [float(v) for v in numpy.percentile(ordered, [q * 100.0 for q in qs])]
+        counts = [int(c) for c in numpy.searchsorted(ordered, buckets, side='right')] if buckets else []
+        tops = []
+        if top:
+            n = min(top, len(data))
+            # stable on ties: the first node wins, as heapq.nlargest does
+            index = numpy.argsort(-data, kind='mergesort')[:n]
+            tops = [(float(data[i]), int(i)) for i in index]
+        return len(data), float(data.sum()), result_q, counts, tops
+    ordered = sorted(values)
+    counts = [bisect.bisect_right(ordered, bound) for bound in buckets]
+    tops = []
+    if top:
+        # (value, -index): on ties the first node wins
+        tops = [(float(v), -i) for v, i in heapq.nlargest(top, ((v, -i) for i, v in enumerate(values)))]
+    return len(ordered), float(sum(ordered)), quantiles(ordered, qs), counts, tops
+
+
+class FleetSummary(object):
+    '''
+    The distribution of one metric over all nodes of a fleet, exported instead of one series
+    per node: a summary (count, sum, quantiles), optionally a gauge histogram over the given
+    buckets and the top-N outlier hosts.
+    '''
+
+    def __init__(self, name, documentation, labels=None, qs=DEFAULT_QUANTILES, buckets=None, top=0):
+        self._labelnames = tuple(labels or [])
+        self._quantiles = qs
+        self._buckets = tuple(sorted(buckets or ()))
+        self._top = top
+        self.family = SummaryMetricFamily(name, documentation, labels=self._labelnames)
+        self.histogram = None
+        if self._buckets:
+            self.histogram = GaugeHistogramMetricFamily("_".join([name, 'distribution']),
+                                                        "{0} (number of nodes per bucket)".format(documentation),
+                                                        labels=self._labelnames)
+        self.outliers = None
+        if self._top:
+            self.outliers = GaugeMetricFamily("_".join([name, 'top']),
+                                              "{0} (the {1} largest nodes)".format(documentation, self._top),
+                                              labels=self._labelnames + ('host',))
+
+    def families(self):
+        return [f for f in (self.family, self.histogram, self.outliers) if f is not None]
+
+    def add(self, labels, values, hosts=None):
+        '''
+        @param values: the value of every node.
+        @param hosts: the node names, in the order of values, needed for the top-N outliers.
+        '''
+        labels = list(labels)
+        count, total, qvalues, counts, tops = summarize(values, self._quantiles, self._buckets,
+                                                        self._top if hosts is not None else 0)
+        self.family.add_metric(labels, count, total)
+        base = zip(self._labelnames, labels)
+        for q, value in zip(self._quantiles, qvalues):
+            self.family.samples.append(Sample(self.family.name, dict(base + [('quantile', floatToGoString(q))]), value))
+        if self.histogram is not None:
+            buckets = [(floatToGoString(b), c) for b, c in zip(self._buckets, counts)] + [("+Inf", count)]
+            self.histogram.add_metric(labels, buckets, total)
+        if self.outliers is not None:
+            for value, index in tops:
+                self.outliers.add_metric(labels + [hosts[index]], value)
+
+
+def main():
+    '''
+    Compare the numpy and the pure python backends on a synthetic fleet:
+
+        python cmd/fleet.py [hosts]
+    '''
+    global numpy
+    hosts = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    values = array('d', [random.lognormvariate(3, 1) for i in range(hosts)])
+    buckets = [2 ** i for i in range(12)]
+    results = {}
+    for backend in ('numpy', 'python'):
+        if backend == 'numpy' and numpy is None:
+            print "numpy is not installed"
+            continue
+        saved = numpy
+        if backend == 'python':
+            numpy = None
+        start = time.time()
+        for i in range(100):
+            results[backend] = summarize(values, DEFAULT_QUANTILES, buckets, DEFAULT_TOP)
+        print "{0:<8} {1:>8.3f}ms per metric over {2} hosts".format(backend, (time.time() - start) * 10, hosts)
+        numpy = saved
+    if len(results) == 2:
+        a, b = results['numpy'], results['python']
+        assert a[0] == b[0] and a[3] == b[3] and a[4] == b[4]
+        assert all(abs(x - y) < 1e-6 * max(1.0, abs(x)) for x, y in zip([a[1]] + a[2], [b[1]] + b[2]))
+        print "backends agree"
+
+
+if __name__ == '__main__':
+    main()
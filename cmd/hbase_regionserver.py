@@ -10,13 +10,39 @@ from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily, REG
 
 import utils
 from utils import get_module_logger
-from consul import Consul
 from common import MetricCol, common_metrics_info
+import labels
+from labels import AttributePlan
 
 logger = get_module_logger(__name__)
 
 
+def _templated_attribute(kind, marker, condition):
+    '''
+    @return the resolve function of an AttributePlan of the per region/table/user attributes,
+            e.g. Namespace_default_table_t1_region_abc_metric_storeCount -> (region_metric_storeCount, (abc,)).
+    '''
+    def resolve(metric):
+        if condition(metric):
+            value = metric.split("_metric_")[0].split(marker)[1]
+            return "".join([kind, metric.split(value)[-1]]), (value,)
+        return metric, ()
+    return resolve
+
+
+_TEMPLATED_PLANS = {
+    'Regions': AttributePlan(_templated_attribute("region", "region_", lambda m: "_region_" in m and 'metric' in m)),
+    'Tables': AttributePlan(_templated_attribute("table", "table_", lambda m: "_table_" in m and 'metric' in m)),
+    'Users': AttributePlan(_templated_attribute("User", "User_", lambda m: "User_" in m and '_metric_' in m)),
+}
+
+
 class HBaseRegionServerMetricCollector(MetricCol):
+
+    # per region/table/user catalogs are templates (e.g. table_metric_flushTime_num_ops),
+    # their percentiles stay per-attribute gauges.
+    TEMPLATED_SERVICES = ('Regions', 'Tables', 'Users')
+
     def __init__(self, cluster, url):
         MetricCol.__init__(self, cluster, url, "hbase", "regionserver")
         self._clear_init()
@@ -26,13 +52,13 @@ class HBaseRegionServerMetricCollector(MetricCol):
         for i in range(len(self._file_list)):
             self._hadoop_regionserver_metrics.setdefault(self._file_list[i], {})
 
-    def collect(self):
+    def _collect(self):
         self._clear_init()
         # Request data from ambari Collect Host API
         # Request exactly the System level information we need from node
         # beans returns a type of 'List'
         try:
-            beans = utils.get_metrics(self._url)
+            beans = self._get_beans()
         except:
             logger.info("Can't scrape metrics from url: {0}".format(self._url))
             pass
@@ -47,16 +73,16 @@ class HBaseRegionServerMetricCollector(MetricCol):
             common_metrics = common_metrics_info(self._cluster, beans, "hbase", "regionserver")
             self._hadoop_regionserver_metrics.update(common_metrics())
     
-            for i in range(len(self._merge_list)):
-                service = self._merge_list[i]
-                for metric in self._hadoop_regionserver_metrics[service]:
-                    yield self._hadoop_regionserver_metrics[service][metric]
+            for metric in self._catalog_families(self._hadoop_regionserver_metrics):
+                yield metric
 
     def _setup_labels(self, beans):
         for i in range(len(beans)):
             for service in self._metrics:
                 if service in beans[i]['name']:
                     for metric in self._metrics[service]:
+                        if service not in self.TEMPLATED_SERVICES and metric in self._percentiles[service]:
+                            continue
                         name = re.sub('[^a-z0-9A-Z]', '_', metric).lower()
                         if 'region_metric' in metric:
                             label = ['cluster', 'host', 'region']
@@ -69,75 +95,47 @@ class HBaseRegionServerMetricCollector(MetricCol):
                         self._hadoop_regionserver_metrics[service][metric] = GaugeMetricFamily("_".join([self._prefix, service.lower(), name]),
                                                                                                 self._metrics[service][metric],
                                                                                                 labels=label)
+                    if service not in self.TEMPLATED_SERVICES:
+                        self._setup_percentile_labels(self._hadoop_regionserver_metrics[service], service, ['cluster', 'host'])
 
-    def _get_regions_metrics(self, bean, service, host):
-        for metric in bean:
-            if metric in self._metrics[service]:
-                if "_region_" in metric and 'metric' in metric:
-                    region = metric.split("_metric_")[0].split("region_")[1]
-                    key = "".join(["region", metric.split(region)[-1]])
-                    self._hadoop_regionserver_metrics[service][key].add_metric([self._cluster, host, region], bean[metric])
-                elif metric in self._metrics[service]:
-                    self._hadoop_regionserver_metrics[service][metric].add_metric([self._cluster, host], bean[metric])
-                else:
-                    continue
-            else:
-                continue
-
-    def _get_tables_metrics(self, bean, service, host):
+    def _get_templated_metrics(self, bean, service, labels):
+        plan = _TEMPLATED_PLANS[service]
         for metric in bean:
             if metric in self._metrics[service]:
-                if "_table_" in metric and 'metric' in metric:
-                    table = metric.split("_metric_")[0].split("table_")[1]
-                    key = "".join(["table", metric.split(table)[-1]])
-                    self._hadoop_regionserver_metrics[service][key].add_metric([self._cluster, host, table], bean[metric])
-                elif metric in self._metrics[service]:
-                    self._hadoop_regionserver_metrics[service][metric].add_metric([self._cluster, host], bean[metric])
-                else:
-                    continue
-            else:
-                continue
+                key, suffix = plan[metric]
+                self._hadoop_regionserver_metrics[service][key].add_metric(labels[suffix], bean[metric])
 
-    def _get_users_metrics(self, bean, service, host):
+    def _get_other_metrics(self, bean, service, labels):
         for metric in bean:
-            if metric in self._metrics[service]:
-                if "User_" in metric and '_metric_' in metric:
-                    user = metric.split("_metric_")[0].split("User_")[1]
-                    key = "".join(["User", metric.split(user)[-1]])
-                    self._hadoop_regionserver_metrics[service][key].add_metric([self._cluster, host, user], bean[metric])
-                elif metric in self._metrics[service]:
-                    self._hadoop_regionserver_metrics[service][metric].add_metric([self._cluster, host], bean[metric])
-                else:
-                    continue
-            else:
+            if metric in self._percentiles[service]:
                 continue
-
-    def _get_other_metrics(self, bean, service, host):
-        for metric in bean:
-            if metric in self._metrics[service]:
-                self._hadoop_regionserver_metrics[service][metric].add_metric([self._cluster, host], bean[metric])
+            elif metric in self._metrics[service]:
+                self._hadoop_regionserver_metrics[service][metric].add_metric(labels.prefix, bean[metric])
             else:
                 continue
+        self._get_percentile_metrics(self._hadoop_regionserver_metrics[service], service, bean, labels.prefix)
 
     def _get_metrics(self, beans):
         
+        host = None
         for i in range(len(beans)):
             if 'tag.Hostname' in beans[i]:
                 host = beans[i]['tag.Hostname']
                 break
             else:
                 continue
+        if host is None:
+            # no metrics2 bean, e.g. a scrape selecting only families of other catalogs
+            return
 
+        # (cluster, host) and its region/table/user label tuples, kept across scrapes
+        host_labels = labels.get_label_sets(self._cluster, host)
         for i in range(len(beans)):
             for service in self._metrics:
-                if 'Regions' == service and 'sub={0}'.format(service) in beans[i]['name']:
-                    self._get_regions_metrics(beans[i], service, host)
-                elif 'Tables' == service and 'sub={0}'.format(service) in beans[i]['name']:
-                    self._get_tables_metrics(beans[i], service, host)
-                elif 'Users' == service and 'sub={0}'.format(service) in beans[i]['name']:
-                    self._get_users_metrics(beans[i], service, host)
+                if service in self.TEMPLATED_SERVICES and 'sub={0}'.format(service) in beans[i]['name']:
+                    self._get_templated_metrics(beans[i], service, host_labels)
                 elif 'sub={0}'.format(service) in beans[i]['name']:
-                    self._get_other_metrics(beans[i], service, host)
+                    self._get_other_metrics(beans[i], service, host_labels)
                 else:
                     continue
 
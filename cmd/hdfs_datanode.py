@@ -10,14 +10,20 @@ from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily, REG
 
 import utils
 from utils import get_module_logger
-from consul import Consul
 from common import MetricCol, common_metrics_info
 
 logger = get_module_logger(__name__)
 
 class DataNodeMetricCollector(MetricCol):
-    def __init__(self, cluster, url):
+    def __init__(self, cluster, url, central=False, central_interval=300):
+        '''
+        @param central: the NameNode exporter already derives the per-DataNode series from
+                        NameNodeInfo, so the DataNode itself is only scraped every
+                        central_interval seconds and the previous beans are served in between.
+        '''
         MetricCol.__init__(self, cluster, url, "hdfs", "datanode")
+        if central:
+            self._scrape_interval = central_interval
         self._clear_init()
 
     def _clear_init(self):
@@ -25,14 +31,14 @@ class DataNodeMetricCollector(MetricCol):
         for i in range(len(self._file_list)):
             self._hadoop_datanode_metrics.setdefault(self._file_list[i], {})
 
-    def collect(self):
+    def _collect(self):
         self._clear_init()
         # Request data from ambari Collect Host API
         # Request exactly the System level information we need from node
         # beans returns a type of 'List'
 
         try:
-            beans = utils.get_metrics(self._url)
+            beans = self._get_beans()
         except:
             logger.info("Can't scrape metrics from url: {0}".format(self._url))
             pass
@@ -47,10 +53,8 @@ class DataNodeMetricCollector(MetricCol):
             common_metrics = common_metrics_info(self._cluster, beans, "hdfs", "datanode")
             self._hadoop_datanode_metrics.update(common_metrics())
     
-            for i in range(len(self._merge_list)):
-                service = self._merge_list[i]
-                for metric in self._hadoop_datanode_metrics[service]:
-                    yield self._hadoop_datanode_metrics[service][metric]
+            for metric in self._catalog_families(self._hadoop_datanode_metrics):
+                yield metric
 
     def _setup_dninfo_labels(self):
         for metric in self._metrics['DataNodeInfo']:
@@ -251,7 +255,7 @@ def main():
         port = int(args.port)
         cluster = args.cluster
         v = args.datanode_url
-        REGISTRY.register(DataNodeMetricCollector(cluster, v))
+        REGISTRY.register(DataNodeMetricCollector(cluster, v, args.datanode_central, args.datanode_interval))
 
         start_http_server(port)
         # print("Polling %s. Serving at port: %s" % (args.address, port))
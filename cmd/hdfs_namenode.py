@@ -10,18 +10,38 @@ from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily, REG
 
 import utils
 from utils import get_module_logger
-from consul import Consul
-from common import MetricCol, common_metrics_info
+from common import MetricCol, common_metrics_info, rpc_pressure
+from fleet import NodeColumns, FleetSummary, DEFAULT_TOP
 
 logger = get_module_logger(__name__)
 
+# fetched on its own in central DataNode mode when the snapshot does not contain it
+NAMENODE_INFO_QUERY = "Hadoop:service=NameNode,name=NameNodeInfo"
+# histogram buckets of the DataNode distributions in summary mode
+DATANODE_SUMMARY_BUCKETS = {
+    'volfails': (0, 1, 2, 4, 8),
+    'xceiverCount': (16, 32, 64, 128, 256, 512, 1024, 2048, 4096),
+    'lastContact': (3, 10, 30, 60, 300, 600),
+}
+
 
 class NameNodeMetricCollector(MetricCol):
 
-    def __init__(self, cluster, url):
+    def __init__(self, cluster, url, central_datanodes=False, datanode_summary=False, fleet_top=DEFAULT_TOP):
+        '''
+        @param central_datanodes: export the DataNodes reported in NameNodeInfo (LiveNodes,
+                                  DeadNodes, DecomNodes), so the DataNodes can be scraped rarely.
+        @param datanode_summary: in central mode, export the distribution over all DataNodes
+                                 (quantiles, histogram and the fleet_top largest hosts) instead
+                                 of one series per DataNode.
+        '''
         # 手动调用父类初始化，传入cluster名称、jmx url、组件名称、服务名称
         # 注意：服务名称应与JSON配置的文件夹名称保持一致
         MetricCol.__init__(self, cluster, url, "hdfs", "namenode")
+        self._central_datanodes = central_datanodes
+        self._datanode_summary = datanode_summary
+        self._fleet_top = fleet_top
+        self._namenode_info = None
         self._clear_init()
 
     def _clear_init(self):
@@ -30,13 +50,13 @@ class NameNodeMetricCollector(MetricCol):
             # 读取JSON配置文件，设置每个导出指标对象
             self._hadoop_namenode_metrics.setdefault(self._file_list[i], {})
 
-    def collect(self):
+    def _collect(self):
         self._clear_init()
         # 发送HTTP请求从JMX URL中获取指标数据。
         # 获取JMX中对应bean JSON数组。
         try:
             # 发起HTTP请求JMX JSON数据
-            beans = utils.get_metrics(self._url)
+            beans = self._get_beans()
         except:
             logger.info("Can't scrape metrics from url: {0}".format(self._url))
             pass
@@ -53,10 +73,12 @@ class NameNodeMetricCollector(MetricCol):
     
             # 遍历每一个指标分类（包含NameNode以及Common的指标分类）
             # 返回每一个指标和标签
-            for i in range(len(self._merge_list)):
-                service = self._merge_list[i]
-                for metric in self._hadoop_namenode_metrics[service]:
-                    yield self._hadoop_namenode_metrics[service][metric]
+            for metric in self._catalog_families(self._hadoop_namenode_metrics):
+                yield metric
+
+            # 根据RPC队列压力调整抓取频率(见throttle.py)，并导出当前的限流级别
+            for metric in self._observe_pressure(rpc_pressure(self._hadoop_namenode_metrics['RpcActivity'])):
+                yield metric
 
     def _setup_nnactivity_labels(self):
         # 记录是否已处理（1表示需要处理，0表示无需处理）
@@ -235,6 +257,51 @@ class NameNodeMetricCollector(MetricCol):
             if 'RetryCache' in beans[i]['name']:
                 self._setup_retrycache_labels()
 
+        self._namenode_info = None
+        if self._central_datanodes:
+            self._namenode_info = self._find_namenode_info(beans)
+            if self._namenode_info is not None:
+                self._setup_namenode_info_labels()
+
+    def _find_namenode_info(self, beans):
+        for bean in beans:
+            if 'NameNodeInfo' in bean['name']:
+                return bean
+        # e.g. the NameNode is scraped through a ?qry= restricted url
+        try:
+            beans = utils.get_metrics(self._url, params={'qry': NAMENODE_INFO_QUERY})
+        except utils.PayloadTooLarge as e:
+            logger.warning("{0}, no per-DataNode metrics".format(e))
+            return None
+        return beans[0] if beans else None
+
+    def _setup_namenode_info_labels(self):
+        metrics = self._hadoop_namenode_metrics['NameNodeInfo']
+        self._datanode_summaries = {}
+        for metric in self._metrics['NameNodeInfo']:
+            snake_case = re.sub('([a-z0-9])([A-Z])', r'\1_\2', metric).lower()
+            if self._datanode_summary:
+                summary = FleetSummary("_".join([self._prefix, 'datanodes', snake_case]),
+                                       self._metrics['NameNodeInfo'][metric],
+                                       labels=["cluster"],
+                                       buckets=DATANODE_SUMMARY_BUCKETS.get(metric),
+                                       top=self._fleet_top)
+                self._datanode_summaries[metric] = summary
+                for family in summary.families():
+                    metrics[family.name] = family
+            else:
+                metrics[metric] = GaugeMetricFamily("_".join([self._prefix, 'datanode', snake_case]),
+                                                    self._metrics['NameNodeInfo'][metric],
+                                                    labels=["cluster", "host"])
+        if self._datanode_summary:
+            metrics['state'] = GaugeMetricFamily("_".join([self._prefix, 'datanodes_state']),
+                                                 "Number of DataNodes in each admin state, dead DataNodes are Dead",
+                                                 labels=["cluster", "state"])
+        else:
+            metrics['state'] = GaugeMetricFamily("_".join([self._prefix, 'datanode_state']),
+                                                 "Admin state of the DataNode, dead DataNodes are Dead",
+                                                 labels=["cluster", "host", "state"])
+
 
     def _get_nnactivity_metrics(self, bean):
         # 遍历对应分类的所有指标
@@ -356,6 +423,47 @@ class NameNodeMetricCollector(MetricCol):
                 self._get_fsnamesystem_state_metrics(beans[i])
             if 'RetryCache' in beans[i]['name']:
                 self._get_retrycache_metrics(beans[i])
+        if self._namenode_info is not None:
+            self._get_namenode_info_metrics(self._namenode_info)
+
+    def _get_namenode_info_metrics(self, bean):
+        # LiveNodes/DeadNodes/DecomNodes are JSON strings covering every DataNode, each is decoded once.
+        live_attrs = [metric for metric in self._metrics['NameNodeInfo'] if 'underReplicatedBlocks' != metric]
+        live = NodeColumns(bean.get('LiveNodes'), live_attrs)
+        dead = NodeColumns(bean.get('DeadNodes'), ['lastContact'])
+        decom = NodeColumns(bean.get('DecomNodes'), ['underReplicatedBlocks'])
+        metrics = self._hadoop_namenode_metrics['NameNodeInfo']
+        states = [r.get('adminState', 'In Service') for r in live.records] + ['Dead'] * dead.size
+
+        for metric in self._metrics['NameNodeInfo']:
+            nodes = decom if 'underReplicatedBlocks' == metric else live
+            # e.g. xceiverCount is only reported by newer NameNodes
+            if not nodes.has(metric):
+                continue
+            if self._datanode_summary:
+                values, names = nodes.column(metric), nodes.names
+                if 'lastContact' == metric:
+                    # the same DataNodes as the per-host series: the dead ones too
+                    values, names = values + dead.column(metric), names + dead.names
+                self._datanode_summaries[metric].add([self._cluster], values, names)
+                continue
+            values = nodes.column(metric)
+            for j in range(nodes.size):
+                metrics[metric].add_metric([self._cluster, nodes.names[j]], values[j])
+            if 'lastContact' == metric:
+                values = dead.column(metric)
+                for j in range(dead.size):
+                    metrics[metric].add_metric([self._cluster, dead.names[j]], values[j])
+
+        if self._datanode_summary:
+            counts = {}
+            for state in states:
+                counts[state] = counts.get(state, 0) + 1
+            for state in sorted(counts):
+                metrics['state'].add_metric([self._cluster, state], counts[state])
+        else:
+            for host, state in zip(live.names + dead.names, states):
+                metrics['state'].add_metric([self._cluster, host, state], 1)
                     
 
 
@@ -365,7 +473,7 @@ def main():
         port = int(args.port)
         cluster = args.cluster
         v = args.namenode_url
-        REGISTRY.register(NameNodeMetricCollector(cluster, v))
+        REGISTRY.register(NameNodeMetricCollector(cluster, v, args.datanode_central, args.datanode_summary, args.fleet_top))
 
         start_http_server(port)
         # print("Polling %s. Serving at port: %s" % (args.address, port))
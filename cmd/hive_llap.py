@@ -10,7 +10,6 @@ from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily, REG
 
 import utils
 from utils import get_module_logger
-from consul import Consul
 from common import MetricCol, common_metrics_info
 
 logger = get_module_logger(__name__)
@@ -26,14 +25,14 @@ class HiveLlapDaemonMetricCollector(MetricCol):
         for i in range(len(self._file_list)):
             self._hadoop_llapdaemon_metrics.setdefault(self._file_list[i], {})
 
-    def collect(self):
+    def _collect(self):
         self._clear_init()
         # Request data from ambari Collect Host API
         # Request exactly the System level information we need from node
         # beans returns a type of 'List'
 
         try:
-            beans = utils.get_metrics(self._url)
+            beans = self._get_beans()
         except:
             logger.info("Can't scrape metrics from url: {0}".format(self._url))
             pass
@@ -48,14 +47,14 @@ class HiveLlapDaemonMetricCollector(MetricCol):
             common_metrics = common_metrics_info(self._cluster, beans, "hive", "llapdaemon")
             self._hadoop_llapdaemon_metrics.update(common_metrics())
     
-            for i in range(len(self._merge_list)):
-                service = self._merge_list[i]
-                for metric in self._hadoop_llapdaemon_metrics[service]:
-                    yield self._hadoop_llapdaemon_metrics[service][metric]
+            for metric in self._catalog_families(self._hadoop_llapdaemon_metrics):
+                yield metric
 
     def _setup_executor_labels(self, bean, service):
         for metric in self._metrics[service]:
-            if metric in bean:
+            if metric in self._percentiles[service]:
+                continue
+            elif metric in bean:
                 if "ExecutorThread" in metric:
                     label = ['cluster', 'host', 'cpu']
                 else:
@@ -66,6 +65,7 @@ class HiveLlapDaemonMetricCollector(MetricCol):
                                                                                       labels=label)
             else:
                 continue
+        self._setup_percentile_labels(self._hadoop_llapdaemon_metrics[service], service, ['cluster', 'host'])
 
     def _setup_other_labels(self, bean, service):
         label = ["cluster", "host"]
@@ -91,7 +91,9 @@ class HiveLlapDaemonMetricCollector(MetricCol):
 
     def _get_executor_metrics(self, bean, service, host):
         for metric in bean:
-            if metric in self._metrics[service]:
+            if metric in self._percentiles[service]:
+                continue
+            elif metric in self._metrics[service]:
                 if "ExecutorThread" in metric:
                     cpu = "".join(['cpu', metric.split("_")[1]])
                     self._hadoop_llapdaemon_metrics[service][metric].add_metric([self._cluster, host, cpu], bean[metric])
@@ -99,6 +101,7 @@ class HiveLlapDaemonMetricCollector(MetricCol):
                     self._hadoop_llapdaemon_metrics[service][metric].add_metric([self._cluster, host], bean[metric])
             else:
                 continue
+        self._get_percentile_metrics(self._hadoop_llapdaemon_metrics[service], service, bean, [self._cluster, host])
 
     def _get_other_metrics(self, bean, service, host):
         for metric in bean:
@@ -9,8 +9,8 @@ from prometheus_client import start_http_server
 from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily, REGISTRY
 
 import utils
+import tracing
 from utils import get_module_logger
-from consul import Consul
 from common import MetricCol, common_metrics_info
 
 logger = get_module_logger(__name__)
@@ -27,7 +27,7 @@ class HiveServerMetricCollector(MetricCol):
         for i in range(len(self._file_list)):
             self._hadoop_hiveserver2_metrics.setdefault(self._file_list[i], {})
 
-    def collect(self):
+    def _collect(self):
         self._clear_init()
         # Request data from ambari Collect Host API
         # Request exactly the System level information we need from node
@@ -36,10 +36,11 @@ class HiveServerMetricCollector(MetricCol):
             count = 0
             # In case no metrics we need in the jmx url, a time sleep and while-loop was set here to wait for the KEY metrics
             while count < 5:
-                beans = utils.get_metrics(self._url)
+                beans = self._get_beans()
                 if 'init_total_count_tables' not in beans:
                     count += 1
-                    time.sleep(1)
+                    with tracing.span('retry wait', collector=type(self).__name__, attempt=count):
+                        time.sleep(1)
                     continue
                 else:
                     break
@@ -58,10 +59,8 @@ class HiveServerMetricCollector(MetricCol):
             common_metrics = common_metrics_info(self._cluster, beans, "hive", "hiveserver2")
             self._hadoop_hiveserver2_metrics.update(common_metrics())
 
-            for i in range(len(self._merge_list)):
-                service = self._merge_list[i]
-                for metric in self._hadoop_hiveserver2_metrics[service]:
-                    yield self._hadoop_hiveserver2_metrics[service][metric]
+            for metric in self._catalog_families(self._hadoop_hiveserver2_metrics):
+                yield metric
 
     def _setup_node_labels(self, bean, service):
         label = ["cluster", "host", "client_id", "node_id"]
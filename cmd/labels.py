@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+
+from utils import get_module_logger
+
+logger = get_module_logger(__name__)
+
+# distinct label values kept by intern_value; values beyond it are used as they are
+MAX_INTERNED_VALUES = 100000
+# label tuples kept per LabelSets and attributes kept per AttributePlan. A RegionServer
+# names its regions in the attribute names, so these follow region splits and moves: a full
+# cache is dropped and rebuilt rather than grown forever.
+MAX_LABEL_SETS = 50000
+MAX_PLANNED_ATTRIBUTES = 50000
+
+# value -> the same value, the one copy shared by every label set
+_values = {}
+# prefix tuple -> LabelSets, shared by the collectors and scrapes of the same target
+_label_sets = {}
+
+
+def intern_value(value):
+    '''
+    @return the one shared copy of a label value. Unlike intern() this works for the unicode
+            strings of the decoded beans too.
+    '''
+    interned = _values.get(value)
+    if interned is None:
+        if len(_values) >= MAX_INTERNED_VALUES:
+            return value
+        interned = _values.setdefault(value, value)
+    return interned
+
+
+def get_label_sets(*prefix):
+    '''
+    @param prefix: the constant label values of a target, e.g. (cluster,) or (cluster, host).
+    @return the LabelSets of the prefix, the same object on every scrape.
+    '''
+    sets = _label_sets.get(prefix)
+    if sets is None:
+        sets = _label_sets.setdefault(prefix, LabelSets(*prefix))
+    return sets
+
+
+class LabelSets(dict):
+    '''
+    The label value tuples of one target. The constant prefix is a preallocated tuple and
+    every prefix + suffix tuple is built once, with interned values, then looked up on every
+    later scrape. The suffixes come from an AttributePlan, so a hit allocates nothing:
+
+        rpc_labels = get_label_sets(cluster, tag)
+        key, suffix = plan[metric]                         # ("MethodNumOps", ("SendHeartbeat",))
+        family.add_metric(rpc_labels[suffix], value)       # (cluster, tag, "SendHeartbeat")
+        family.add_metric(rpc_labels.prefix, value)        # (cluster, tag)
+    '''
+    __slots__ = ('prefix',)
+
+    def __init__(self, *prefix):
+        dict.__init__(self)
+        self.prefix = tuple(intern_value(value) for value in prefix)
+
+    def __missing__(self, suffix):
+        if len(self) >= MAX_LABEL_SETS:
+            self.clear()
+        labels = self[suffix] = self.prefix + tuple(intern_value(value) for value in suffix)
+        return labels
+
+
+class AttributePlan(dict):
+    '''
+    attribute name -> (family key, label suffix), resolved once per attribute instead of
+    splitting the attribute name on every scrape, e.g. for JvmMetrics:
+
+        "MemHeapUsedM" -> ("jvm_mem_used_mebibytes", ("Heap",))
+
+    @param resolve: function(attribute) returning (key, suffix), suffix an iterable of label values.
+    '''
+    __slots__ = ('_resolve',)
+
+    def __init__(self, resolve):
+        dict.__init__(self)
+        self._resolve = resolve
+
+    def __missing__(self, attribute):
+        key, suffix = self._resolve(attribute)
+        if len(self) >= MAX_PLANNED_ATTRIBUTES:
+            self.clear()
+        entry = self[attribute] = (key, tuple(intern_value(value) for value in suffix))
+        return entry
+
+
+def main():
+    '''
+    Compare building fresh label lists with the cached label tuples, e.g. for the
+    RpcDetailedActivity families of a NameNode:
+
+        python cmd/labels.py [methods] [scrapes]
+    '''
+    methods = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    scrapes = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    attributes = ["Method{0}NumOps".format(i) for i in range(methods)]
+    cluster = u"cluster_indata"
+    start = time.time()
+    previous = kept = []
+    for i in range(scrapes):
+        previous, kept = kept, []
+        for metric in attributes:
+            kept.append([cluster, u"8020", metric.split('NumOps')[0]])
+    print "lists:  {0:.3f}s, {1} new label objects per scrape".format(time.time() - start, _new_objects(previous, kept))
+    plan = AttributePlan(lambda metric: ("NumOps", (metric.split('NumOps')[0],)))
+    start = time.time()
+    previous = kept = []
+    for i in range(scrapes):
+        previous, kept = kept, []
+        labels = get_label_sets(cluster, u"8020")
+        for metric in attributes:
+            key, suffix = plan[metric]
+            kept.append(labels[suffix])
+    print "tuples: {0:.3f}s, {1} new label objects per scrape".format(time.time() - start, _new_objects(previous, kept))
+
+
+def _new_objects(previous, current):
+    # the label sequences and values of a scrape which the previous scrape did not already hold
+    def objects(label_sets):
+        return set(id(labels) for labels in label_sets) | set(id(value) for labels in label_sets for value in labels)
+    return len(objects(current) - objects(previous))
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,6 @@ from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily, REG
 
 import utils
 from utils import get_module_logger
-from consul import Consul
 from common import MetricCol, common_metrics_info
 
 logger = get_module_logger(__name__)
@@ -26,14 +25,14 @@ class MapReduceMetricCollector(MetricCol):
         # for i in range(len(self._file_list)):
         #     self._hadoop_jobhistoryserver_metrics.setdefault(self._file_list[i], {})
 
-    def collect(self):
+    def _collect(self):
         self._clear_init()
         # Request data from ambari Collect Host API
         # Request exactly the System level information we need from node
         # beans returns a type of 'List'
 
         try:
-            beans = utils.get_metrics(self._url)
+            beans = self._get_beans()
         except:
             logger.info("Can't scrape metrics from url: {0}".format(self._url))
             pass
@@ -48,10 +47,8 @@ class MapReduceMetricCollector(MetricCol):
             common_metrics = common_metrics_info(self._cluster, beans, "mapreduce", "jobhistoryserver")
             self._hadoop_jobhistoryserver_metrics.update(common_metrics())
     
-            for i in range(len(self._merge_list)):
-                service = self._merge_list[i]
-                for metric in self._hadoop_jobhistoryserver_metrics[service]:
-                    yield self._hadoop_jobhistoryserver_metrics[service][metric]
+            for metric in self._catalog_families(self._hadoop_jobhistoryserver_metrics):
+                yield metric
 
 
 
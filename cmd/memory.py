@@ -0,0 +1,305 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import gc
+import os
+import resource
+import sys
+import threading
+import time
+from prometheus_client.core import GaugeMetricFamily
+
+from utils import get_module_logger
+
+logger = get_module_logger(__name__)
+
+# frames kept per traced allocation and allocation sites (or types) reported per collector
+TRACEMALLOC_FRAMES = 1
+DEFAULT_TOP = 10
+BACKENDS = ('auto', 'tracemalloc', 'gc')
+
+# the MemoryTracker of --debug-memory; without it tracked() hands back the scrape's own generator
+_tracker = None
+
+
+def configure(backend='auto', top=DEFAULT_TOP):
+    '''
+    Enable allocation tracking of every collector scrape.
+    @param backend: tracemalloc (Python >= 3.4 or the pytracemalloc build), gc (type counts of
+                    the objects tracked by the garbage collector), or auto for the first available.
+    @return the MemoryTracker.
+    '''
+    global _tracker
+    _tracker = MemoryTracker(backend, top)
+    logger.info("tracking the allocations of every scrape with {0}".format(_tracker.backend.name))
+    return _tracker
+
+
+def tracked(collector, families):
+    '''
+    @param families: the families generator of one scrape of the collector.
+    @return the generator itself, or one measured before and after while tracking is enabled.
+    '''
+    tracker = _tracker
+    if tracker is None:
+        return families
+    return tracker.track(type(collector).__name__, families)
+
+
+def _page_size():
+    try:
+        return os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return 4096
+
+_PAGE_SIZE = _page_size()
+
+
+def resident_bytes():
+    '''
+    @return the resident set size of the process, its peak (ru_maxrss) where /proc is missing.
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (IOError, ValueError, IndexError):
+        # kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _TracemallocBackend(object):
+    '''
+    Allocation sites (file:line) of the Python heap, from tracemalloc snapshots.
+    '''
+    name = 'tracemalloc'
+
+    def __init__(self):
+        import tracemalloc
+        self._tracemalloc = tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    def current(self):
+        return self._tracemalloc.get_traced_memory()[0]
+
+    def snapshot(self, previous=None):
+        # the traces of the snapshots themselves are left out
+        snapshot = self._tracemalloc.take_snapshot()
+        return snapshot.filter_traces([self._tracemalloc.Filter(False, self._tracemalloc.__file__)])
+
+    def compare(self, before, after, top):
+        '''
+        @return (bytes retained, [(site, bytes, allocations)] of the `top` largest sites).
+        '''
+        stats = after.compare_to(before, 'lineno')
+        retained = sum(stat.size_diff for stat in stats)
+        sites = [(str(stat.traceback[0]), stat.size_diff, stat.count_diff)
+                 for stat in stats[:top] if stat.size_diff]
+        return retained, sites
+
+
+class _GcBackend(object):
+    '''
+    Count and size (sys.getsizeof) per type of the objects tracked by the garbage collector,
+    the closest Python 2 gets to tracemalloc: dicts and lists of the decoded beans, metric
+    families, log records... Strings and numbers are not tracked by the collector and only
+    show up in the resident size.
+    '''
+    name = 'gc'
+
+    def current(self):
+        return resident_bytes()
+
+    def snapshot(self, previous=None):
+        '''
+        @param previous: the snapshot taken before, left out of this one.
+        '''
+        gc.collect()
+        counts, sizes = {}, {}
+        skip = set([id(counts), id(sizes)])
+        skip.add(id(skip))
+        if previous is not None:
+            skip.update(id(obj) for obj in previous)
+            skip.add(id(previous))
+        for obj in gc.get_objects():
+            if id(obj) in skip:
+                continue
+            kind = type(obj)
+            counts[kind] = counts.get(kind, 0) + 1
+            sizes[kind] = sizes.get(kind, 0) + sys.getsizeof(obj, 0)
+        return counts, sizes
+
+    def compare(self, before, after, top):
+        counts_before, sizes_before = before
+        counts_after, sizes_after = after
+        diffs = []
+        for kind in set(sizes_before) | set(sizes_after):
+            size = sizes_after.get(kind, 0) - sizes_before.get(kind, 0)
+            count = counts_after.get(kind, 0) - counts_before.get(kind, 0)
+            if size or count:
+                diffs.append((getattr(kind, '__module__', '') + '.' + kind.__name__, size, count))
+        diffs.sort(key=lambda diff: abs(diff[1]), reverse=True)
+        return sum(diff[1] for diff in diffs), diffs[:top]
+
+
+def _select_backend(name):
+    if name in ('auto', 'tracemalloc'):
+        try:
+            return _TracemallocBackend()
+        except ImportError:
+            if name == 'tracemalloc':
+                raise ValueError("tracemalloc is not available on Python {0}, use gc".format(sys.version.split()[0]))
+    if name in ('auto', 'gc'):
+        return _GcBackend()
+    raise ValueError("memory backend must be one of {0}".format(", ".join(BACKENDS)))
+
+
+class _CollectorMemory(object):
+    __slots__ = ('scrapes', 'retained', 'retained_total', 'peak', 'sites', 'time')
+
+    def __init__(self):
+        self.scrapes = 0
+        self.retained = 0
+        self.retained_total = 0
+        self.peak = 0
+        self.sites = []
+        self.time = 0
+
+
+class MemoryTracker(object):
+    '''
+    Snapshot the allocations before and after every collector scrape and keep, per collector
+    class, the bytes the last scrape left allocated, their sum over all scrapes and the top
+    allocation sites of the last scrape. The peak of a scrape is the largest memory seen at
+    any family it yielded: traced bytes with tracemalloc, the resident size with gc.
+
+    The families of a scrape are all built between the two snapshots and count as retained; a
+    leak is a retained total which keeps growing. The snapshots are global to the process, so
+    the tracked scrapes of all collectors run one at a time, while the renders do not: the lock
+    is released before the first family is returned.
+    '''
+
+    # /metrics/exporter, see exposition.ScrapeSelection
+    scrape_names = frozenset(['exporter'])
+
+    def __init__(self, backend='auto', top=DEFAULT_TOP):
+        self.backend = _select_backend(backend)
+        self._top = top
+        self._scrape_lock = threading.RLock()
+        self._lock = threading.Lock()
+        # collector class -> _CollectorMemory
+        self._collectors = {}
+
+    def track(self, name, families):
+        '''
+        Build every family of the scrape between two snapshots, then return them. No lock is
+        held while the caller consumes the families, nor by a generator dropped halfway.
+        '''
+        with self._scrape_lock:
+            before = self.backend.snapshot()
+            peak = self.backend.current()
+            built = []
+            for family in families:
+                peak = max(peak, self.backend.current())
+                built.append(family)
+            after = self.backend.snapshot(before)
+            retained, sites = self.backend.compare(before, after, self._top)
+            peak = max(peak, self.backend.current())
+        with self._lock:
+            stats = self._collectors.get(name)
+            if stats is None:
+                stats = self._collectors[name] = _CollectorMemory()
+            stats.scrapes += 1
+            stats.retained = retained
+            stats.retained_total += retained
+            stats.peak = peak
+            stats.sites = sites
+            stats.time = time.time()
+        for family in built:
+            yield family
+
+    def collect(self):
+        with self._lock:
+            collectors = sorted(self._collectors.items())
+        peak = GaugeMetricFamily("hadoop_exporter_scrape_peak_memory_bytes",
+                                 "Largest {0} memory of the process during the last scrape of the collector".format(
+                                     'traced' if self.backend.name == 'tracemalloc' else 'resident'),
+                                 labels=["collector"])
+        retained = GaugeMetricFamily("hadoop_exporter_scrape_retained_bytes",
+                                     "Bytes the last scrape of the collector left allocated, its families included",
+                                     labels=["collector"])
+        total = GaugeMetricFamily("hadoop_exporter_scrape_retained_total_bytes",
+                                  "Bytes left allocated by all scrapes of the collector since tracking began, "
+                                  "growing steadily on a leak",
+                                  labels=["collector"])
+        for name, stats in collectors:
+            peak.add_metric([name], stats.peak)
+            retained.add_metric([name], stats.retained)
+            total.add_metric([name], stats.retained_total)
+        return [peak, retained, total]
+
+    def report(self):
+        with self._lock:
+            collectors = sorted((name, stats.scrapes, stats.retained, stats.retained_total, stats.peak, list(stats.sites))
+                                for name, stats in self._collectors.items())
+        lines = ["backend: {0}, resident: {1}".format(self.backend.name, _format_bytes(resident_bytes()))]
+        if not collectors:
+            lines.append("no scrape tracked yet")
+        for name, scrapes, last, total, peak, sites in collectors:
+            lines.append("")
+            lines.append("=== {0}: {1} scrapes, last retained {2}, retained in total {3}, peak {4} ===".format(
+                name, scrapes, _format_bytes(last), _format_bytes(total), _format_bytes(peak)))
+            for site, size, count in sites:
+                lines.append("{0:>12} {1:>+9} {2}".format(_format_bytes(size), count, site))
+        return "\n".join(lines) + "\n"
+
+
+def _format_bytes(value):
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(value) < 1024:
+            return "{0:.0f}{1}".format(value, unit) if unit == 'B' else "{0:.1f}{1}".format(value, unit)
+        value /= 1024.0
+    return "{0:.1f}GiB".format(value)
+
+
+def handle(query):
+    '''
+    The /debug/memory endpoint of the exposition server: the allocations of the last scrape
+    of every collector.
+    @return (status code, body, content type).
+    '''
+    tracker = _tracker
+    if tracker is None:
+        return 404, "allocation tracking is disabled\n", 'text/plain; charset=utf-8'
+    return 200, tracker.report(), 'text/plain; charset=utf-8'
+
+
+def main():
+    '''
+    Track the scrapes of a test fixture and print the report:
+
+        python cmd/memory.py [ROLE] [scrapes] [backend]
+    '''
+    import stress
+    # the module the collectors see, not this __main__
+    import memory
+    from collectors import find_collector, load_collector
+    from prometheus_client.core import CollectorRegistry
+    from exposition import Encoder
+    role = sys.argv[1] if len(sys.argv) > 1 else 'NAMENODE'
+    scrapes = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    tracker = memory.configure(sys.argv[3] if len(sys.argv) > 3 else 'auto')
+    jmx, url = stress.serve_beans(stress.read_fixture(stress.FIXTURES[role]))
+    keyword, module_name, class_name = find_collector(role)
+    registry = CollectorRegistry()
+    registry.register(load_collector(module_name, class_name)('cluster_indata', url))
+    encoder = Encoder()
+    for i in range(scrapes):
+        encoder.encode_text(registry.collect())
+    jmx.shutdown()
+    sys.stdout.write(tracker.report())
+
+
+if __name__ == '__main__':
+    main()
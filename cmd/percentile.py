@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+from collections import OrderedDict
+
+
+# HBase metrics2 histograms, e.g. TotalCallTime_num_ops, TotalCallTime_99.9th_percentile
+HBASE_PERCENTILE = re.compile(r'^(?P<group>.+)_(?P<percent>\d+(?:\.\d+)?)th_percentile$')
+HBASE_COUNT = '_num_ops'
+# Hadoop MutableQuantiles, e.g. Syncs60sNumOps, Syncs60s99thPercentileLatencyMicros
+HADOOP_PERCENTILE = re.compile(r'^(?P<group>.+?)(?P<percent>\d+(?:\.\d+)?)thPercentile\w*$')
+HADOOP_COUNT = 'NumOps'
+# HBase metrics2 statistics reported next to the percentiles, e.g. TotalCallTime_mean
+HBASE_STAT = re.compile(r'^.+_(?P<stat>min|max|mean|median)$')
+
+
+class PercentileHistogram(object):
+    '''
+    One group of percentile attributes (plus its operation counter) which is exported as a
+    prometheus histogram: every percentile becomes a bucket whose `le` is the quantile, and
+    the counter becomes the +Inf bucket.
+    '''
+    __slots__ = ('group', 'count_attr', 'bounds', 'attrs', '_local')
+
+    def __init__(self, group, count_attr, percentiles):
+        self.group = group
+        self.count_attr = count_attr
+        percentiles = sorted(percentiles, key=lambda p: float(p[0]))
+        # bucket bounds are kept in the same format the collectors always exposed, e.g. '0.999'
+        self.bounds = tuple(str(float(p) / 100.0) for p, attr in percentiles)
+        self.attrs = tuple(attr for p, attr in percentiles)
+        # the bucket array of each thread, refilled by every fill()
+        self._local = threading.local()
+
+    def fill(self, bean):
+        '''
+        @param bean: the MBean (dict) of one scrape.
+        @return (buckets, sum_value) ready for HistogramMetricFamily.add_metric, None when the
+                bean has no operation counter. Percentiles the bean lacks have no bucket. The
+                buckets are reused by the next fill() of the same thread.
+        '''
+        if self.count_attr not in bean:
+            return None
+        buckets = getattr(self._local, 'buckets', None)
+        if buckets is None:
+            buckets = self._local.buckets = [[bound, 0] for bound in self.bounds] + [["+Inf", 0]]
+        sum_value = 0.0
+        missing = False
+        for i, attr in enumerate(self.attrs):
+            if attr in bean:
+                value = bean[attr] or 0
+                sum_value += value
+            else:
+                value = None
+                missing = True
+            buckets[i][1] = value
+        buckets[-1][1] = bean[self.count_attr] or 0
+        if missing:
+            return [bucket for bucket in buckets if bucket[1] is not None], sum_value
+        return buckets, sum_value
+
+
+def plan_groups(catalog):
+    '''
+    @param catalog: one metric catalog (dict of attribute name -> description).
+    @return (groups, stats): a tuple of (group, count attribute, ((percent, attribute), ...)) in
+            catalog order and a tuple of (attribute, statistic) of the min/max/mean/median
+            attributes. Only plain tuples and strings, so the result can be stored in the
+            catalog cache.
+    '''
+    groups = OrderedDict()
+    stats = []
+    for metric in catalog or {}:
+        match = HBASE_STAT.match(metric)
+        if match:
+            stats.append((metric, match.group('stat')))
+            continue
+        match = HBASE_PERCENTILE.match(metric)
+        count_suffix = HBASE_COUNT
+        if not match:
+            match = HADOOP_PERCENTILE.match(metric)
+            count_suffix = HADOOP_COUNT
+        if not match:
+            continue
+        group = match.group('group')
+        groups.setdefault(group, (count_suffix, []))[1].append((match.group('percent'), metric))
+    return (tuple((group, "".join([group, count_suffix]), tuple(percentiles))
+                  for group, (count_suffix, percentiles) in groups.items()),
+            tuple(stats))
+
+
+class PercentilePlan(object):
+    '''
+    Compiled view of one metric catalog: which attributes form percentile histograms and which
+    are their min/max/mean/median statistics. Built once from the catalog keys so that a scrape
+    never splits or searches attribute names.
+    '''
+
+    def __init__(self, catalog=None, groups=None):
+        '''
+        @param catalog: the metric catalog to compile.
+        @param groups: or the already compiled plan_groups(catalog), e.g. from the catalog cache.
+        '''
+        if groups is None:
+            groups, stats = plan_groups(catalog)
+        else:
+            groups, stats = groups
+        # group name -> PercentileHistogram, in catalog order
+        self.histograms = OrderedDict()
+        # attribute name -> group name, for every attribute folded into a histogram
+        self.members = {}
+        for group, count_attr, percentiles in groups:
+            self.histograms[group] = PercentileHistogram(group, count_attr, percentiles)
+            self.members[count_attr] = group
+            for percent, metric in percentiles:
+                self.members[metric] = group
+        # attribute name -> min, max, mean or median, for the statistics exported as gauges
+        self.stats = dict(stats)
+
+    def __contains__(self, metric):
+        return metric in self.members
+
+    def __nonzero__(self):
+        return bool(self.histograms)
+
+
+def compile_plans(metrics):
+    '''
+    @param metrics: {catalog name: catalog dict}, e.g. MetricCol._metrics.
+    @return {catalog name: PercentilePlan}.
+    '''
+    return dict((service, PercentilePlan(catalog)) for service, catalog in metrics.items())
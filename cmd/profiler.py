@@ -0,0 +1,259 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from StringIO import StringIO
+
+from utils import get_module_logger
+
+logger = get_module_logger(__name__)
+
+# longest profile a request may ask for, and the default one
+MAX_PROFILE_SECONDS = 300
+DEFAULT_PROFILE_SECONDS = 30
+# seconds between two stack samples of the collapsed format
+SAMPLE_INTERVAL = 0.005
+# functions of a pstats section, the most expensive first
+PSTATS_LINES = 40
+FORMATS = ('collapsed', 'pstats')
+
+# the running ProfileSession, set by run() for its duration only
+_session = None
+_session_lock = threading.Lock()
+
+
+class ProfileBusy(Exception):
+    pass
+
+
+def profiled(collector, families):
+    '''
+    @param families: the families generator of one scrape of the collector.
+    @return the generator itself, or one timed by cProfile while a pstats session runs.
+    '''
+    session = _session
+    if session is None or session.format != 'pstats':
+        return families
+    return session.profile(type(collector).__name__, families)
+
+
+class ProfileSession(object):
+    '''
+    One profile of the live exporter over `seconds`, in one of FORMATS:
+
+    collapsed: every SAMPLE_INTERVAL the stacks of all threads are sampled with
+               sys._current_frames(); the stacks inside a collector scrape are rooted at the
+               collector class, those of the jmx samplers at Sampler and of the exposition
+               server at render. The output is the collapsed-stack input of flamegraph.pl.
+               With all=1 the other threads are kept too, rooted at their thread name.
+    pstats:    every scrape of a collector runs under its own cProfile.Profile; the output is
+               one pstats report per collector class, sorted by cumulative time.
+
+    Nothing runs outside a session: the sampler thread only lives while it lasts.
+    '''
+
+    def __init__(self, seconds=DEFAULT_PROFILE_SECONDS, format='collapsed', all_threads=False,
+                 interval=SAMPLE_INTERVAL):
+        if format not in FORMATS:
+            raise ValueError("format must be one of {0}".format(", ".join(FORMATS)))
+        self.seconds = min(max(float(seconds), 0.0), MAX_PROFILE_SECONDS)
+        self.format = format
+        self._all_threads = all_threads
+        self._interval = interval
+        self._lock = threading.Lock()
+        # collapsed stack -> samples
+        self._stacks = {}
+        # collector class -> [cProfile.Profile of one scrape]
+        self._profiles = {}
+        self._stopped = threading.Event()
+
+    def run(self):
+        '''
+        Profile for self.seconds, one session at a time.
+        @return the report.
+        @raise ProfileBusy when another session is running.
+        '''
+        global _session
+        with _session_lock:
+            if _session is not None:
+                raise ProfileBusy("a profile is already running")
+            _session = self
+        logger.info("profiling for {0:g}s, {1}".format(self.seconds, self.format))
+        sampler = None
+        try:
+            if self.format == 'collapsed':
+                sampler = threading.Thread(target=self._sample, name="profile-sampler")
+                sampler.daemon = True
+                sampler.start()
+            self._stopped.wait(self.seconds)
+        finally:
+            self._stopped.set()
+            with _session_lock:
+                _session = None
+            if sampler is not None:
+                sampler.join()
+        return self.report()
+
+    def profile(self, name, families):
+        profile = cProfile.Profile()
+        try:
+            while True:
+                profile.enable()
+                try:
+                    family = next(families)
+                except StopIteration:
+                    break
+                finally:
+                    profile.disable()
+                yield family
+        finally:
+            with self._lock:
+                self._profiles.setdefault(name, []).append(profile)
+
+    def _sample(self):
+        own = threading.current_thread().ident
+        collectors = _collector_codes()
+        while not self._stopped.is_set():
+            names = dict((t.ident, t.name) for t in threading.enumerate())
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack = _collapse(frame, names.get(ident, ''), collectors, self._all_threads)
+                if stack is not None:
+                    self._stacks[stack] = self._stacks.get(stack, 0) + 1
+            del frames
+            self._stopped.wait(self._interval)
+
+    def report(self):
+        if self.format == 'collapsed':
+            return "".join("{0} {1}\n".format(stack, count) for stack, count in sorted(self._stacks.items()))
+        out = StringIO()
+        with self._lock:
+            profiles = dict((name, list(items)) for name, items in self._profiles.items())
+        if not profiles:
+            out.write("no scrape ran in {0:g}s\n".format(self.seconds))
+        for name in sorted(profiles):
+            out.write("=== {0}: {1} scrapes in {2:g}s ===\n".format(name, len(profiles[name]), self.seconds))
+            stats = pstats.Stats(profiles[name][0], stream=out)
+            for profile in profiles[name][1:]:
+                stats.add(profile)
+            stats.sort_stats('cumulative').print_stats(PSTATS_LINES)
+        return out.getvalue()
+
+
+def _collector_codes():
+    '''
+    @return {code object of a collector's _collect: collector class name}, what roots a
+            sampled stack at its collector without reading the locals of another thread.
+    '''
+    codes = {}
+    for module in sys.modules.values():
+        base = getattr(module, 'MetricCol', None)
+        if not isinstance(base, type):
+            continue
+        pending = list(base.__subclasses__())
+        while pending:
+            cls = pending.pop()
+            pending.extend(cls.__subclasses__())
+            method = cls.__dict__.get('_collect')
+            if method is not None:
+                codes[method.__code__] = cls.__name__
+    return codes
+
+
+def _frame_name(code):
+    return "{0}:{1}".format(os.path.basename(code.co_filename), code.co_name)
+
+
+def _collapse(frame, thread_name, collectors, all_threads):
+    '''
+    @return "root;outermost frame;...;innermost frame" of a thread's stack, None when the
+            thread is outside the scrape pipeline and not all threads are kept.
+    '''
+    names = []
+    root = None
+    while frame is not None:
+        code = frame.f_code
+        names.append(_frame_name(code))
+        if code in collectors:
+            # the outermost collector wins, e.g. the scrape rather than a nested helper
+            root = collectors[code]
+        elif root is None and code.co_name == 'render' and 'exposition' in code.co_filename:
+            root = 'render'
+        frame = frame.f_back
+    if root is None:
+        if thread_name.startswith('sampler-'):
+            root = 'Sampler'
+        elif all_threads:
+            root = re.sub(r'-?\d+$', '', thread_name) or 'thread'
+        else:
+            return None
+    names.append(root)
+    names.reverse()
+    return ";".join(names)
+
+
+def handle(query):
+    '''
+    The /debug/profile endpoint of the exposition server: ?seconds=N&format=collapsed|pstats&all=1.
+    @param query: the parsed query string, {name: [values]}.
+    @return (status code, body, content type).
+    '''
+    try:
+        session = ProfileSession(seconds=query.get('seconds', [DEFAULT_PROFILE_SECONDS])[0],
+                                 format=query.get('format', ['collapsed'])[0],
+                                 all_threads=query.get('all', ['0'])[0] in ('1', 'true'))
+    except ValueError as e:
+        return 400, "{0}\n".format(e), 'text/plain; charset=utf-8'
+    try:
+        return 200, session.run(), 'text/plain; charset=utf-8'
+    except ProfileBusy as e:
+        return 409, "{0}\n".format(e), 'text/plain; charset=utf-8'
+
+
+def main():
+    '''
+    Profile scrapes of the test fixtures and print the report:
+
+        python cmd/profiler.py [collapsed|pstats] [seconds] [ROLE]
+    '''
+    import stress
+    # the module the collectors see, not this __main__
+    from profiler import ProfileSession
+    from collectors import find_collector, load_collector
+    from prometheus_client.core import CollectorRegistry
+    from exposition import Encoder
+    format = sys.argv[1] if len(sys.argv) > 1 else 'collapsed'
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    role = sys.argv[3] if len(sys.argv) > 3 else 'NAMENODE'
+    jmx, url = stress.serve_beans(stress.read_fixture(stress.FIXTURES[role]))
+    keyword, module_name, class_name = find_collector(role)
+    registry = CollectorRegistry()
+    registry.register(load_collector(module_name, class_name)('cluster_indata', url))
+    encoder = Encoder()
+    stop = threading.Event()
+
+    def scrape():
+        while not stop.is_set():
+            encoder.encode_text(registry.collect())
+    scraper = threading.Thread(target=scrape)
+    scraper.daemon = True
+    scraper.start()
+    start = time.time()
+    report = ProfileSession(seconds, format).run()
+    stop.set()
+    scraper.join()
+    jmx.shutdown()
+    sys.stdout.write(report)
+    sys.stderr.write("profiled {0:.1f}s\n".format(time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import yaml
+from prometheus_client.core import GaugeMetricFamily
+
+from utils import get_module_logger
+from common import MetricCol, common_metrics_info
+
+logger = get_module_logger(__name__)
+
+
+# python2's sre can not compile a pattern with more than 100 groups, so the rules of
+# one service are packed into as few alternations as that limit allows.
+MAX_GROUPS_PER_AUTOMATON = 99
+# attributes names are bounded per daemon, this only guards against pathological payloads.
+MAX_CACHED_ATTRIBUTES = 200000
+
+_NAMED_GROUP = re.compile(r'\(\?P<([A-Za-z_][A-Za-z0-9_]*)>')
+_GROUP = re.compile(r'(?<!\\)\((?!\?)|\(\?P<')
+_INVALID_NAME = re.compile(r'[^a-zA-Z0-9_:]')
+
+
+def get_rules_path():
+    path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(os.path.dirname(path), "rules")
+
+
+def read_rules_file(file_name):
+    '''
+    read one rules file in the rules directory.
+    '''
+    try:
+        with open(os.path.join(get_rules_path(), file_name), 'r') as f:
+            return yaml.safe_load(f) or {}
+    except Exception as e:
+        logger.info("read rules file failed, error msg is: %s" % e)
+        return {}
+
+
+def get_rules_index():
+    '''
+    @return a dict of {role: rules file content}, where role is the service name discovered
+            from cluster_config.json (e.g. APP_TIMELINE_SERVER).
+    '''
+    index = {}
+    try:
+        files = os.listdir(get_rules_path())
+    except OSError:
+        return index
+    for file_name in sorted(files):
+        if not file_name.endswith(('.yaml', '.yml')):
+            continue
+        config = read_rules_file(file_name)
+        try:
+            check_rules(config.get('rules'))
+        except ValueError as e:
+            logger.error("rules file {0} rejected: {1}".format(file_name, e))
+            continue
+        for role in config.get('roles', []):
+            index[role] = config
+    return index
+
+
+def check_rules(rules):
+    '''
+    Rules producing the same metric name must produce the same label names, as all samples of
+    a family share its labels.
+    @raise ValueError naming the first two rules which disagree.
+    '''
+    seen = {}
+    for i, rule in enumerate(rules or []):
+        label_names = tuple(sorted(rule.get('labels') or {}))
+        first, first_labels = seen.setdefault(rule['name'], (i, label_names))
+        if first_labels != label_names:
+            raise ValueError("rules {0} and {1} both produce {2}, with the labels ({3}) and ({4})".format(
+                first, i, rule['name'], ", ".join(first_labels), ", ".join(label_names)))
+
+
+class _Rule(object):
+    __slots__ = ('index', 'pattern', 'name', 'help', 'label_names', 'label_values', 'factor', 'lowercase')
+
+    def __init__(self, index, rule, lowercase):
+        self.index = index
+        self.pattern = rule['pattern']
+        self.name = rule['name']
+        self.help = rule.get('help', "Metric matched by rule {0}".format(rule['pattern']))
+        labels = rule.get('labels') or {}
+        self.label_names = tuple(sorted(labels))
+        self.label_values = tuple(labels[k] for k in self.label_names)
+        self.factor = float(rule.get('valueFactor', 1.0))
+        self.lowercase = lowercase
+
+    def groups(self):
+        return len(_GROUP.findall(self.pattern)) + 1
+
+    def regex(self):
+        # prefix the named groups with the rule index so that every rule may use the same names.
+        prefix = 'r{0}_'.format(self.index)
+        body = _NAMED_GROUP.sub(lambda m: '(?P<{0}{1}>'.format(prefix, m.group(1)), self.pattern)
+        return '(?P<r{0}>{1})'.format(self.index, body)
+
+    def expand(self, match):
+        prefix = 'r{0}_'.format(self.index)
+        groups = dict((k[len(prefix):], v or '') for k, v in match.groupdict().items() if k.startswith(prefix))
+        name = _INVALID_NAME.sub('_', self.name.format(**groups))
+        if self.lowercase:
+            name = re.sub('([a-z0-9])([A-Z])', r'\1_\2', name).lower()
+        values = tuple(v.format(**groups) for v in self.label_values)
+        return name, values
+
+
+class RuleSet(object):
+    '''
+    Declarative rules, in the spirit of jmx_exporter, compiled into a single alternation.
+
+    Every rule is a regular expression matched against "<MBean name>::<attribute>", e.g.
+    "Hadoop:service=ApplicationHistoryServer,name=TimelineDataManagerMetrics::GetEntitiesOps".
+    The first rule that matches wins; its named groups may be used in `name` and `labels`
+    as "{group}". The outcome for each (MBean, attribute) pair is cached, so after the first
+    scrape every attribute costs one dict lookup. Rules sharing a name must share their label
+    names, see check_rules.
+    '''
+
+    def __init__(self, rules, lowercase=True):
+        check_rules(rules)
+        self._rules = [_Rule(i, rule, lowercase) for i, rule in enumerate(rules or [])]
+        self._automata = []
+        self._cache = {}
+        batch, groups = [], 0
+        for rule in self._rules:
+            if batch and groups + rule.groups() > MAX_GROUPS_PER_AUTOMATON:
+                self._automata.append(self._compile(batch))
+                batch, groups = [], 0
+            batch.append(rule)
+            groups += rule.groups()
+        if batch:
+            self._automata.append(self._compile(batch))
+
+    def _compile(self, rules):
+        return re.compile('^(?:{0})$'.format('|'.join(rule.regex() for rule in rules)))
+
+    def match(self, bean_name, attribute):
+        '''
+        @return (rule, metric name, label values) or None if no rule matches.
+        '''
+        key = (bean_name, attribute)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        result = None
+        subject = "::".join([bean_name, attribute])
+        for automaton in self._automata:
+            m = automaton.match(subject)
+            if m:
+                rule = self._rules[int(m.lastgroup[1:])]
+                name, values = rule.expand(m)
+                result = (rule, name, values)
+                break
+        if len(self._cache) < MAX_CACHED_ATTRIBUTES:
+            self._cache[key] = result
+        return result
+
+
+class RuleMetricCollector(MetricCol):
+    '''
+    Collector of a service described by a rules file only, no python code needed.
+    The rules file is a YAML document in the rules directory:
+
+        roles: [APP_TIMELINE_SERVER]
+        component: yarn
+        service: applicationhistoryserver
+        rules:
+          - pattern: 'Hadoop:service=ApplicationHistoryServer,name=TimelineDataManagerMetrics::(?P<op>\w+)TimeAvgTime'
+            name: timeline_method_avg_time_milliseconds
+            help: Average turn around time of the method in milliseconds.
+            labels:
+              method: '{op}'
+    '''
+
+    def __init__(self, cluster, url, config):
+        MetricCol.__init__(self, cluster, url, config['component'], config['service'])
+        self._service = config['service']
+        self._rules = RuleSet(config.get('rules'), config.get('lowercaseOutputName', True))
+        # names templated by different rules (e.g. "{op}_total") which met with other label names
+        self._conflicts = set()
+
+    def _collect(self):
+        try:
+            beans = self._get_beans()
+        except:
+            logger.info("Can't scrape metrics from url: {0}".format(self._url))
+        else:
+            for metric in self._get_metrics(beans).values():
+                yield metric
+
+            common_metrics = common_metrics_info(self._cluster, beans, self._component, self._service)
+            for service, metrics in common_metrics().items():
+                for metric in metrics:
+                    yield metrics[metric]
+
+    def _get_metrics(self, beans):
+        families = {}
+        # metric name -> label names of its family
+        label_names = {}
+        for bean in beans:
+            bean_name = bean['name']
+            for attribute, value in bean.items():
+                if isinstance(value, bool):
+                    value = float(value)
+                elif not isinstance(value, (int, long, float)):
+                    continue
+                matched = self._rules.match(bean_name, attribute)
+                if matched is None:
+                    continue
+                rule, name, label_values = matched
+                family = families.get(name)
+                if family is None:
+                    family = families[name] = GaugeMetricFamily("_".join([self._prefix, name]),
+                                                                rule.help,
+                                                                labels=("cluster",) + rule.label_names)
+                    label_names[name] = rule.label_names
+                elif label_names[name] != rule.label_names:
+                    if name not in self._conflicts:
+                        self._conflicts.add(name)
+                        logger.warning("{0} is produced with the labels ({1}) and ({2}), the samples with ({2}) are dropped".format(
+                            name, ", ".join(label_names[name]), ", ".join(rule.label_names)))
+                    continue
+                family.add_metric((self._cluster,) + label_values, value * rule.factor)
+        return families
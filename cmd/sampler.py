@@ -0,0 +1,218 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import math
+import re
+import sys
+import threading
+import time
+from array import array
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+
+import utils
+from utils import get_module_logger
+from fleet import quantiles
+
+logger = get_module_logger(__name__)
+
+NAN = float('nan')
+
+# gauges which spike between two scrapes, sampled by default once sampling is enabled:
+# service -> ["<ObjectName pattern>::<attribute>"], fetched with ?get=
+DEFAULT_SAMPLES = {
+    'namenode': ['Hadoop:service=NameNode,name=RpcActivityForPort*::CallQueueLength',
+                 'Hadoop:service=NameNode,name=FSNamesystem::PendingReplicationBlocks'],
+    'resourcemanager': ['Hadoop:service=ResourceManager,name=RpcActivityForPort*::CallQueueLength'],
+    'nodemanager': ['Hadoop:service=NodeManager,name=NodeManagerMetrics::ContainersRunning'],
+    'llapdaemon': ['Hadoop:service=LlapDaemon,name=LlapDaemonExecutorMetrics*::ExecutorNumQueuedRequests'],
+}
+
+# the sampling settings, None while sampling is disabled
+_settings = None
+
+
+def configure(period=1.0, window=30.0, samples=None):
+    '''
+    Enable sub-scrape sampling for the collectors created afterwards.
+    @param period: seconds between two samples.
+    @param window: seconds of samples the gauges are computed over, usually the scrape interval.
+    @param samples: {service: [entry]} replacing DEFAULT_SAMPLES of these services.
+    '''
+    global _settings
+    entries = dict(DEFAULT_SAMPLES)
+    entries.update(samples or {})
+    _settings = {'period': period, 'window': window, 'entries': entries}
+
+
+def parse_sample(value):
+    '''
+    @param value: "<service>=<ObjectName pattern>::<attribute>" of the command line.
+    @return (service, entry).
+    '''
+    service, entry = value.split('=', 1)
+    if '::' not in entry:
+        raise ValueError("expected <service>=<ObjectName pattern>::<attribute>: {0}".format(value))
+    return service.strip(), entry.strip()
+
+
+def get_sampler(cluster, url, prefix, service):
+    '''
+    @return a started Sampler registered in the default registry, or None when sampling is
+            disabled or nothing is sampled for the service.
+    '''
+    if _settings is None or not _settings['entries'].get(service):
+        return None
+    sampler = Sampler(cluster, url, prefix, _settings['entries'][service],
+                      period=_settings['period'], window=_settings['window'])
+    sampler.start()
+    logger.info("sampling {0} every {1}s: {2}".format(url, _settings['period'], ", ".join(_settings['entries'][service])))
+    return sampler
+
+
+class SampleRing(object):
+    '''
+    The last `capacity` samples of many series taken at the same instants: one array('d') of
+    timestamps and one per series, written in place; a series missing from a sample is NaN.
+    '''
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d', [0.0] * capacity)
+        self.columns = {}
+        self._head = 0
+        self.size = 0
+
+    def append(self, timestamp, values):
+        '''
+        @param values: {series key: value} of one sample.
+        '''
+        slot = self._head
+        self.times[slot] = timestamp
+        for key, column in self.columns.items():
+            column[slot] = values.get(key, NAN)
+        for key in values:
+            if key not in self.columns:
+                column = self.columns[key] = array('d', [NAN] * self.capacity)
+                column[slot] = values[key]
+        self._head = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def since(self, start):
+        '''
+        @return {series key: [values sampled at or after start]}, NaN samples left out.
+        '''
+        # the ring fills slot 0 first, so the written slots are always 0 .. size-1
+        slots = [i for i in range(self.size) if self.times[i] >= start]
+        result = {}
+        for key, column in self.columns.items():
+            values = [column[i] for i in slots if not math.isnan(column[i])]
+            if values:
+                result[key] = values
+        return result
+
+
+class Sampler(object):
+    '''
+    Sample a few spiky gauges every `period` seconds with attribute-level ?get= fetches, between
+    the Prometheus scrapes. At scrape time the samples of the last `window` seconds are exported
+    per attribute as <prefix>_sampled_<attribute>_max_over_interval, _min and _p99.
+    '''
+
+    def __init__(self, cluster, url, prefix, entries, period=1.0, window=30.0, registry=REGISTRY):
+        self._cluster = cluster
+        self._url = url
+        self._prefix = prefix
+        self._entries = list(entries)
+        self._period = float(period)
+        self._window = float(window)
+        # two spare slots, so a full window is still available while the next sample is taken
+        self._ring = SampleRing(int(math.ceil(self._window / self._period)) + 2)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if registry is not None:
+            registry.register(self)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampler-{0}".format(self._url))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        next_time = time.time()
+        while not self._stop.is_set():
+            self.sample()
+            # a fixed schedule: a slow fetch delays this sample, not every following one
+            next_time = max(next_time + self._period, time.time())
+            self._stop.wait(next_time - time.time())
+
+    def sample(self, now=None):
+        values = {}
+        for entry in self._entries:
+            attribute = entry.rsplit('::', 1)[1]
+            try:
+                # no coalescing: a fetch shared with the previous second would repeat its value
+                beans = utils.fetch_metrics(self._url, params={'get': entry})
+            except Exception as e:
+                logger.info("sampling {0} failed, error msg: {1}".format(entry, e))
+                continue
+            for bean in beans:
+                value = bean.get(attribute)
+                if isinstance(value, (int, long, float)):
+                    values[(bean.get('name'), attribute)] = float(value)
+        with self._lock:
+            self._ring.append(time.time() if now is None else now, values)
+
+    def collect(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            series = self._ring.since(now - self._window)
+        families = {}
+        for (mbean, attribute), values in sorted(series.items()):
+            if attribute not in families:
+                name = "_".join([self._prefix, "sampled", re.sub('([a-z0-9])([A-Z])', r'\1_\2', attribute).lower()])
+                families[attribute] = [
+                    GaugeMetricFamily("_".join([name, "max_over_interval"]),
+                                      "Largest {0} sampled every {1:g}s over the last {2:g}s".format(attribute, self._period, self._window),
+                                      labels=["cluster", "mbean"]),
+                    GaugeMetricFamily("_".join([name, "min"]),
+                                      "Smallest {0} sampled every {1:g}s over the last {2:g}s".format(attribute, self._period, self._window),
+                                      labels=["cluster", "mbean"]),
+                    GaugeMetricFamily("_".join([name, "p99"]),
+                                      "99th percentile of {0} sampled every {1:g}s over the last {2:g}s".format(attribute, self._period, self._window),
+                                      labels=["cluster", "mbean"]),
+                ]
+            values.sort()
+            label = [self._cluster, mbean]
+            largest, smallest, p99 = families[attribute]
+            largest.add_metric(label, values[-1])
+            smallest.add_metric(label, values[0])
+            p99.add_metric(label, quantiles(values, (0.99,))[0])
+        for attribute in sorted(families):
+            for family in families[attribute]:
+                yield family
+
+
+def main():
+    '''
+    Sample a live JMX url and print the gauges of every window:
+
+        python cmd/sampler.py http://host:9870/jmx 'Hadoop:service=NameNode,name=RpcActivityForPort*::CallQueueLength' [seconds]
+    '''
+    from prometheus_client.core import CollectorRegistry
+    from prometheus_client import generate_latest
+    url, entry = sys.argv[1], sys.argv[2]
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    registry = CollectorRegistry()
+    sampler = Sampler('cluster', url, 'hadoop', [entry], period=1.0, window=seconds, registry=registry)
+    sampler.start()
+    time.sleep(seconds)
+    sampler.stop()
+    sys.stdout.write(generate_latest(registry))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+
+import utils
+from utils import get_module_logger
+
+logger = get_module_logger(__name__)
+
+
+class ExporterMetricCollector(object):
+    '''
+    Metrics of the exporter itself, one series per scraped jmx url: payload sizes, the
+    responses aborted by the payload limits and the gzip transfer of the responses.
+    '''
+
+    # /metrics/exporter, see exposition.ScrapeSelection
+    scrape_names = frozenset(['exporter'])
+
+    def __init__(self, prefix="hadoop_exporter"):
+        self._prefix = prefix
+
+    def collect(self):
+        stats = utils.get_payload_stats()
+        payload_bytes = GaugeMetricFamily("_".join([self._prefix, "payload_bytes"]),
+                                          "Size of the last full /jmx response in bytes",
+                                          labels=["url"])
+        payload_beans = GaugeMetricFamily("_".join([self._prefix, "payload_beans"]),
+                                          "Number of beans of the last full /jmx response",
+                                          labels=["url"])
+        received = CounterMetricFamily("_".join([self._prefix, "payload_received_bytes"]),
+                                       "Bytes received from the jmx url, including aborted responses",
+                                       labels=["url"])
+        aborts = CounterMetricFamily("_".join([self._prefix, "payload_aborts"]),
+                                     "Responses aborted by the payload limits",
+                                     labels=["url", "limit"])
+        for url in sorted(stats):
+            payload_bytes.add_metric([url], stats[url]['bytes'])
+            payload_beans.add_metric([url], stats[url]['beans'])
+            received.add_metric([url], stats[url]['bytes_total'])
+            for limit in ('bytes', 'beans'):
+                aborts.add_metric([url, limit], stats[url]['aborts'].get(limit, 0))
+        for metric in (payload_bytes, payload_beans, received, aborts):
+            yield metric
+        for metric in self._compression_metrics():
+            yield metric
+
+    def _compression_metrics(self):
+        stats = utils.get_compression_stats()
+        enabled = GaugeMetricFamily("_".join([self._prefix, "gzip_enabled"]),
+                                    "Whether the jmx url is asked for gzip responses and compresses them (1) or not (0)",
+                                    labels=["url"])
+        ratio = GaugeMetricFamily("_".join([self._prefix, "gzip_compression_ratio"]),
+                                  "Decompressed bytes per byte on the wire of the gzip full dumps, moving average",
+                                  labels=["url"])
+        rate = GaugeMetricFamily("_".join([self._prefix, "transfer_bytes_per_second"]),
+                                 "Bytes per second on the wire while receiving the full dumps, moving average",
+                                 labels=["url"])
+        wire = CounterMetricFamily("_".join([self._prefix, "payload_wire_bytes"]),
+                                   "Bytes received on the wire from the jmx url, before decompression",
+                                   labels=["url"])
+        decode = CounterMetricFamily("_".join([self._prefix, "gzip_decode_seconds"]),
+                                     "Seconds spent decompressing gzip responses of the jmx url",
+                                     labels=["url"])
+        for url in sorted(stats):
+            enabled.add_metric([url], 1 if stats[url]['enabled'] else 0)
+            if stats[url]['ratio'] is not None:
+                ratio.add_metric([url], stats[url]['ratio'])
+            if stats[url]['rate'] is not None:
+                rate.add_metric([url], stats[url]['rate'])
+            wire.add_metric([url], stats[url]['wire_bytes_total'])
+            decode.add_metric([url], stats[url]['decode_seconds_total'])
+        return [enabled, ratio, rate, wire, decode]
@@ -0,0 +1,213 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import fnmatch
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from urlparse import parse_qs, urlparse
+
+import requests
+from prometheus_client.core import CollectorRegistry
+
+import utils
+from utils import get_module_logger
+from collectors import find_collector, load_collector
+from exposition import Encoder, start_http_server
+
+logger = get_module_logger(__name__)
+
+# role -> fixture directory under test/, served as the /jmx of the role
+FIXTURES = {
+    'NAMENODE': 'namenode',
+    'DATANODE': 'datanode',
+    'JOURNALNODE': 'journalnode',
+    'HBASE_MASTER': 'hbase',
+    'HBASE_REGIONSERVER': 'regionserver',
+    'HISTORYSERVER': 'jobhistoryserver',
+    'RESOURCEMANAGER': 'yarn',
+    'NODEMANAGER': 'nodemanager',
+}
+# role -> options of its collector, so that the state kept across scrapes is exercised too:
+# the queue index of the whole hierarchy and the per-NodeManager columns of RMNMInfo
+OPTIONS = {
+    'RESOURCEMANAGER': {'queue_depth': None, 'central_nodemanagers': True},
+}
+# series computed from the clock, e.g. the age of a NodeManager health report, differ between
+# any two scrapes: their values are left out of the comparison
+_CLOCK_SERIES = re.compile(r'^(hadoop_\w+_age_seconds(?:_\w+)?(?:\{.*\})?) \S+$', re.M)
+
+
+def stable(body):
+    '''
+    @return the exposition text without the values of the series computed from the clock.
+    '''
+    return _CLOCK_SERIES.sub(r'\1', body)
+
+
+def read_fixture(name):
+    '''
+    @return the beans of every test/<name>/*.json file, a file holds {"beans": [...]} or one bean.
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    beans = []
+    for path in sorted(glob.glob(os.path.join(root, 'test', name, '*.json'))):
+        with open(path, 'rb') as f:
+            content = json.load(f)
+        beans.extend(content['beans'] if 'beans' in content else [content])
+    return beans
+
+
+def _properties(name):
+    domain, _, keys = name.partition(':')
+    return domain, dict(key.split('=', 1) for key in keys.split(',') if '=' in key)
+
+
+def match_object_name(name, pattern):
+    '''
+    @return whether the ObjectName matches the pattern of a ?qry=, as the JMX servlet matches
+            it: wildcards in the domain and the values, a trailing ",*" allows more properties.
+    '''
+    domain, properties = _properties(name)
+    pattern_domain, pattern_properties = _properties(pattern)
+    if not fnmatch.fnmatchcase(domain, pattern_domain):
+        return False
+    if not pattern.endswith(',*') and set(properties) != set(pattern_properties):
+        return False
+    return all(key in properties and fnmatch.fnmatchcase(properties[key], value)
+               for key, value in pattern_properties.items())
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve_beans(beans):
+    '''
+    Serve the beans as the /jmx servlet of a daemon on a free local port, ?qry= included.
+    @return (server, jmx url).
+    '''
+    full = json.dumps({'beans': beans})
+
+    class JmxHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query).get('qry')
+            body = full
+            if query:
+                body = json.dumps({'beans': [bean for bean in beans if match_object_name(bean['name'], query[0])]})
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            return
+
+    httpd = _ThreadingHTTPServer(('127.0.0.1', 0), JmxHandler)
+    t = threading.Thread(target=httpd.serve_forever)
+    t.daemon = True
+    t.start()
+    return httpd, 'http://127.0.0.1:{0}/jmx'.format(httpd.server_address[1])
+
+
+def stress(scrape, threads, scrapes):
+    '''
+    Call scrape() from `threads` threads, `scrapes` times each, and compare every result with
+    a scrape taken alone.
+    @return (mismatching results, results, seconds).
+    '''
+    expected = scrape()
+    errors, done = [0], [0]
+    lock = threading.Lock()
+
+    def run():
+        for i in range(scrapes):
+            try:
+                same = scrape() == expected
+            except Exception as e:
+                logger.warning("scrape failed, error msg: {0}".format(e))
+                same = False
+            with lock:
+                done[0] += 1
+                errors[0] += 0 if same else 1
+
+    workers = [threading.Thread(target=run) for i in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return errors[0], done[0], time.time() - start
+
+
+def _http_scrape(url):
+    local = threading.local()
+
+    def scrape():
+        # one keep-alive connection per thread, as a Prometheus server keeps
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        response = session.get(url)
+        return response.status_code, stable(response.content)
+    return scrape
+
+
+def run(threads, scrapes, roles=None):
+    '''
+    Hammer one exporter with parallel scrapes of every fixture role, first rendering the
+    registry from every thread, then through the exposition server, and check that every
+    response is identical to a scrape taken alone.
+    @return the roles which failed: a response differed or a scrape alone rendered no series.
+    '''
+    # every scrape fetches the /jmx itself, so that the scrapes of a collector really overlap
+    utils.set_coalesce_window(0)
+    failed = []
+    for role in roles or sorted(FIXTURES):
+        jmx, jmx_url = serve_beans(read_fixture(FIXTURES[role]))
+        keyword, module_name, class_name = find_collector(role)
+        registry = CollectorRegistry()
+        registry.register(load_collector(module_name, class_name)('cluster_indata', jmx_url, **OPTIONS.get(role, {})))
+        # the collectors themselves: every thread renders the registry, nothing is shared
+        encoder = Encoder()
+        scrape = lambda: stable(encoder.encode_text(registry.collect()))
+        if 'cluster="cluster_indata"' not in scrape():
+            # identical empty scrapes would pass unnoticed
+            print "{0:<18} renders no series".format(role)
+            failed.append(role)
+        errors, done, seconds = stress(scrape, threads, scrapes)
+        print "{0:<18} collect {1:>5} scrapes from {2} threads in {3:.2f}s, {4} differ".format(role, done, threads, seconds, errors)
+        # the exposition server in front of them, with keep-alive and shared snapshots
+        exporter = start_http_server(0, addr='127.0.0.1', registry=registry, max_pending=threads)
+        url = 'http://127.0.0.1:{0}/metrics'.format(exporter.server_address[1])
+        http_errors, done, seconds = stress(_http_scrape(url), threads, scrapes)
+        print "{0:<18} http    {1:>5} scrapes from {2} threads in {3:.2f}s, {4} differ".format(role, done, threads, seconds, http_errors)
+        exporter.shutdown()
+        jmx.shutdown()
+        if (errors or http_errors) and role not in failed:
+            failed.append(role)
+    return failed
+
+
+def main():
+    '''
+        python cmd/stress.py [threads] [scrapes per thread] [ROLE ...]
+
+    Exits with 1 when a role fails, see run. test/test_stress.py runs it on every fixture.
+    '''
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    scrapes = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    sys.exit(1 if run(threads, scrapes, sys.argv[3:]) else 0)
+
+
+if __name__ == '__main__':
+    main()
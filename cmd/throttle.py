@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import sys
+from prometheus_client.core import GaugeMetricFamily
+
+from utils import get_module_logger
+
+logger = get_module_logger(__name__)
+
+# throttle levels
+NORMAL, ELEVATED, SATURATED = 0, 1, 2
+LEVEL_NAMES = ('normal', 'elevated', 'saturated')
+# the saturated thresholds are SATURATION_FACTOR times the elevated ones
+SATURATION_FACTOR = 10
+# the poll interval of the saturated level is SATURATED_BACKOFF times the elevated one
+SATURATED_BACKOFF = 4
+# a level is left after this many consecutive fresh snapshots below its thresholds
+RECOVERY_SNAPSHOTS = 3
+
+# the critical masters whose RPC queue is watched -> the MBeans still polled while throttled,
+# so that the pressure signals keep being read and the throttle can recover.
+PRESSURE_ENTRIES = {
+    'namenode': ('Hadoop:service=NameNode,name=RpcActivityForPort*',),
+    'resourcemanager': ('Hadoop:service=ResourceManager,name=RpcActivityForPort*',),
+    'master': ('Hadoop:service=HBase,name=Master,sub=IPC',),
+}
+
+# the throttle settings, None while load-aware throttling is disabled
+_settings = None
+
+
+def configure(interval=60, queue_length=100, queue_time=100):
+    '''
+    Enable load-aware throttling for the critical masters created afterwards.
+    @param interval: poll interval in seconds of the elevated level.
+    @param queue_length: RPC call queue length of the elevated level.
+    @param queue_time: average RPC queue time in milliseconds of the elevated level.
+    '''
+    global _settings
+    _settings = {'interval': interval, 'queue_length': queue_length, 'queue_time': queue_time}
+
+
+def disable():
+    global _settings
+    _settings = None
+
+
+def get_throttle(service):
+    '''
+    @param service: service name of the collector, e.g. namenode.
+    @return a Throttle, or None when throttling is disabled or the service is not a critical master.
+    '''
+    if _settings is None or service not in PRESSURE_ENTRIES:
+        return None
+    return Throttle(service, PRESSURE_ENTRIES[service], **_settings)
+
+
+class Throttle(object):
+    '''
+    Back off from a master whose RPC queue is saturated. Every fresh snapshot reports its
+    pressure (call queue length, queue time); crossing the thresholds raises the level at once,
+    while a level is only left after RECOVERY_SNAPSHOTS calm snapshots in a row.
+
+    Above the normal level the beans are polled at most every `interval` seconds (SATURATED_BACKOFF
+    times longer when saturated), and only the hot tier plus the pressure MBeans are fetched
+    instead of the full dump. The previous values of every other bean are served in between.
+    '''
+
+    def __init__(self, service, entries, interval=60, queue_length=100, queue_time=100):
+        self._service = service
+        self.entries = list(entries)
+        self._interval = interval
+        self._thresholds = ((queue_length, queue_time),
+                            (queue_length * SATURATION_FACTOR, queue_time * SATURATION_FACTOR))
+        self.level = NORMAL
+        self._calm = 0
+        # time of the last observed snapshot, the same snapshot is only observed once
+        self._observed = None
+        self.pressure = (0, 0)
+
+    def interval(self):
+        '''
+        @return the minimum seconds between two polls, 0 when not throttled.
+        '''
+        if self.level == NORMAL:
+            return 0
+        if self.level == SATURATED:
+            return self._interval * SATURATED_BACKOFF
+        return self._interval
+
+    def _target(self, queue_length, queue_time):
+        level = NORMAL
+        for i, (max_length, max_time) in enumerate(self._thresholds):
+            if queue_length >= max_length or queue_time >= max_time:
+                level = i + 1
+        return level
+
+    def observe(self, pressure, snapshot_time):
+        '''
+        @param pressure: (call queue length, queue time in milliseconds) of the snapshot.
+        @param snapshot_time: when the snapshot was fetched.
+        '''
+        if snapshot_time == self._observed:
+            return
+        self._observed = snapshot_time
+        self.pressure = pressure
+        target = self._target(*pressure)
+        if target > self.level:
+            self.level, self._calm = target, 0
+            logger.warning("{0} RPC queue {1} (length {2}, {3}ms), polling every {4}s".format(
+                self._service, LEVEL_NAMES[target], pressure[0], pressure[1], self.interval()))
+        elif target < self.level:
+            self._calm += 1
+            if self._calm >= RECOVERY_SNAPSHOTS:
+                self.level, self._calm = self.level - 1, 0
+                logger.warning("{0} RPC queue back to {1} (length {2}, {3}ms)".format(self._service, LEVEL_NAMES[self.level],
+                                                                                      pressure[0], pressure[1]))
+        else:
+            self._calm = 0
+
+    def metrics(self, prefix, cluster):
+        '''
+        @return the families of the throttle state.
+        '''
+        level = GaugeMetricFamily("_".join([prefix, "exporter_throttle_level"]),
+                                  "Load-aware throttle level of the exporter (0 normal, 1 elevated, 2 saturated)",
+                                  labels=["cluster"])
+        level.add_metric([cluster], self.level)
+        interval = GaugeMetricFamily("_".join([prefix, "exporter_poll_interval_seconds"]),
+                                     "Minimum seconds between two polls of the throttled exporter (0 when not throttled)",
+                                     labels=["cluster"])
+        interval.add_metric([cluster], self.interval())
+        return [level, interval]
+
+
+def main():
+    '''
+    Replay a pressure series (call queue length, queue time in ms per snapshot) through a throttle:
+
+        python cmd/throttle.py 10,1 150,20 2000,900 300,50 20,5 20,5 20,5 20,5 20,5 20,5
+    '''
+    throttle = Throttle('namenode', PRESSURE_ENTRIES['namenode'])
+    for i, arg in enumerate(sys.argv[1:]):
+        pressure = tuple(float(v) for v in arg.split(','))
+        throttle.observe(pressure, i)
+        print "{0:<16} {1:<10} poll every {2}s".format(arg, LEVEL_NAMES[throttle.level], throttle.interval())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import yaml
+
+import utils
+from utils import get_module_logger
+
+logger = get_module_logger(__name__)
+
+# separator of an attribute entry, the same as the ?get= query of the JMX servlet
+ATTRIBUTE_SEPARATOR = "::"
+
+# a tier config without tiers: the full dump on every poll
+FULL_DUMP = {'default': 'full', 'tiers': {'full': {'interval': 0}}}
+
+# the directory holding the tier files, None while tiered polling is disabled
+_tiers_path = None
+
+
+def get_default_tiers_path():
+    path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(os.path.dirname(path), "tiers")
+
+
+def set_tiers_path(path):
+    '''
+    Enable tiered polling for the collectors created afterwards.
+    @param path: directory of the tier files (<service>.yaml), None disables tiered polling.
+    '''
+    global _tiers_path
+    _tiers_path = path
+
+
+def read_tiers_file(service, path=None):
+    '''
+    @return the content of <path>/<service>.yaml, or None when the service has no tier file.
+    '''
+    file_name = os.path.join(path or get_default_tiers_path(), "{0}.yaml".format(service))
+    if not os.path.exists(file_name):
+        return None
+    try:
+        with open(file_name, 'r') as f:
+            return yaml.safe_load(f) or {}
+    except Exception as e:
+        logger.info("read tiers file failed, error msg is: %s" % e)
+        return None
+
+
+def get_scheduler(service, url):
+    '''
+    @param service: service name of the collector, e.g. namenode.
+    @return a TierScheduler of the url, or None when tiered polling is disabled or the service
+            has no tier file; the collector then fetches the full dump on every scrape.
+    '''
+    if _tiers_path is None:
+        return None
+    config = read_tiers_file(service, _tiers_path)
+    if not config:
+        return None
+    try:
+        scheduler = TierScheduler(url, config)
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning("invalid tiers file of {0}, error msg is: {1}".format(service, e))
+        return None
+    logger.info("tiered polling of {0}: {1}".format(url, scheduler))
+    return scheduler
+
+
+class _Tier(object):
+    __slots__ = ('name', 'interval', 'entries', 'beans', 'time')
+
+    def __init__(self, name, interval, entries):
+        self.name = name
+        self.interval = float(interval)
+        # None for the default tier, which is the full dump of the url
+        self.entries = entries
+        self.beans = []
+        self.time = 0
+
+    def is_due(self, now):
+        return not self.time or now - self.time >= self.interval
+
+    def fetch(self, url):
+        '''
+        @return (beans, complete): complete is False when nothing came back, i.e. the service is
+                down. A single entry may match nothing, e.g. a bean of another Hadoop version.
+        '''
+        if self.entries is None:
+            beans = utils.get_metrics(url)
+            return beans, bool(beans)
+        beans = []
+        for entry in self.entries:
+            if ATTRIBUTE_SEPARATOR in entry:
+                params = {'get': entry}
+            else:
+                params = {'qry': entry}
+            beans.extend(utils.get_metrics(url, params=params))
+        return beans, bool(beans) or not self.entries
+
+
+class TierScheduler(object):
+    '''
+    Poll the beans of one JMX url at per-tier intervals instead of a full dump per scrape.
+
+    A tier file (tiers/<service>.yaml) maps MBeans and single attributes to tiers:
+
+        default: static
+        tiers:
+          hot:
+            interval: 5
+            beans:
+              - 'Hadoop:service=NameNode,name=FSNamesystem'
+              - 'Hadoop:service=NameNode,name=RpcActivityForPort*::CallQueueLength'
+          static:
+            interval: 600
+
+    An entry is an ObjectName pattern fetched with ?qry=<entry>, or "<pattern>::<attribute>"
+    fetched with ?get=<entry>. The default tier has no entries: it is the full dump.
+
+    On every scrape the due tiers are fetched and all tier snapshots are merged into one view,
+    attribute by attribute, the most recent fetch winning. When a due tier comes back empty
+    the full dump is fetched at once, so a restarted or unreachable service is never served
+    from stale snapshots.
+    '''
+
+    def __init__(self, url, config):
+        self._url = url
+        tiers = config['tiers']
+        default = config.get('default', 'normal')
+        if default not in tiers:
+            raise ValueError("default tier {0} is not defined".format(default))
+        self._tiers = []
+        for name in sorted(tiers, key=lambda n: float(tiers[n]['interval'])):
+            entries = None if name == default else list(tiers[name].get('beans') or [])
+            self._tiers.append(_Tier(name, tiers[name]['interval'], entries))
+        self._default = [t for t in self._tiers if t.entries is None][0]
+        # the hot tier plus the pressure MBeans of a throttled master
+        self._minimal = None
+        self._view = []
+
+    def __str__(self):
+        return ", ".join("{0} every {1:g}s ({2})".format(t.name, t.interval,
+                                                         "full dump" if t.entries is None else
+                                                         "{0} entries".format(len(t.entries)))
+                         for t in self._tiers)
+
+    def fetch(self, now=None, minimal=None):
+        '''
+        @param minimal: the entries of a throttled master (see throttle.py), fetched together with
+                        the hot tier while every other tier and the full dump wait.
+        @return the merged beans of all tiers, [] when the full dump failed.
+        '''
+        now = time.time() if now is None else now
+        if minimal is not None and self._default.time:
+            view = self._fetch_minimal(now, minimal)
+            if view:
+                return view
+        fetched = False
+        for tier in self._tiers:
+            if tier is self._default or not tier.is_due(now):
+                continue
+            tier.beans, complete = tier.fetch(self._url)
+            tier.time = now
+            fetched = True
+            if not complete:
+                logger.warning("tier {0} of {1} came back empty, fetching the full dump".format(tier.name, self._url))
+                self._default.time = 0
+        if self._default.is_due(now):
+            self._default.beans, complete = self._default.fetch(self._url)
+            if not complete:
+                # the service is down: forget every snapshot and retry all tiers next time.
+                for tier in self._sources():
+                    tier.beans, tier.time = [], 0
+                self._view = []
+                return []
+            self._default.time = now
+            fetched = True
+        if fetched:
+            self._view = self._merge()
+        return self._view
+
+    def _sources(self):
+        return self._tiers + ([self._minimal] if self._minimal is not None else [])
+
+    def _fetch_minimal(self, now, entries):
+        hot = [t for t in self._tiers if t is not self._default][:1]
+        if self._minimal is None:
+            self._minimal = _Tier('minimal', 0, [])
+        self._minimal.entries = (hot[0].entries if hot else []) + list(entries)
+        self._minimal.beans, complete = self._minimal.fetch(self._url)
+        if not complete:
+            # maybe down: the full dump decides
+            self._minimal.time = self._default.time = 0
+            return []
+        self._minimal.time = now
+        self._view = self._merge()
+        return self._view
+
+    def _merge(self):
+        if not any(t.beans for t in self._sources() if t is not self._default):
+            return self._default.beans
+        # the order of the full dump is kept, beans missing from it are appended.
+        merged = {}
+        order = [bean.get('name') for bean in self._default.beans]
+        # on the same scrape an explicit entry is newer than the full dump
+        for tier in sorted(self._sources(), key=lambda t: (t.time, t.entries is not None)):
+            for bean in tier.beans:
+                name = bean.get('name')
+                current = merged.get(name)
+                if current is None:
+                    merged[name] = dict(bean)
+                    if tier is not self._default:
+                        order.append(name)
+                else:
+                    current.update(bean)
+        seen = set()
+        view = []
+        for name in order:
+            if name not in seen:
+                seen.add(name)
+                view.append(merged[name])
+        return view
+
+
+def main():
+    '''
+    Compare tiered polling with a full dump per scrape on a live JMX url:
+
+        python cmd/tiers.py namenode http://host:9870/jmx [scrapes] [scrape interval]
+    '''
+    service, url = sys.argv[1], sys.argv[2]
+    scrapes = int(sys.argv[3]) if len(sys.argv) > 3 else 12
+    interval = float(sys.argv[4]) if len(sys.argv) > 4 else 5
+    scheduler = TierScheduler(url, read_tiers_file(service))
+    print scheduler
+    requests = [0]
+
+    def counting(url, params=None):
+        requests[0] += 1
+        return utils.fetch_metrics(url, params=params)
+    utils.get_metrics = counting
+    start = time.time()
+    for i in range(scrapes):
+        beans = scheduler.fetch(now=start + i * interval)
+    print "tiered: {0} requests, {1:.3f}s, {2} beans".format(requests[0], time.time() - start, len(beans))
+    start = time.time()
+    for i in range(scrapes):
+        beans = utils.fetch_metrics(url)
+    print "full:   {0} requests, {1:.3f}s, {2} beans".format(scrapes, time.time() - start, len(beans))
+
+
+if __name__ == '__main__':
+    main()
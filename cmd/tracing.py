@@ -0,0 +1,290 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import Queue
+import sys
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+# no logger here: utils traces every fetch with this module and imports it first.
+
+# events kept in memory for /debug/trace, the oldest are dropped first
+TRACE_BUFFER_EVENTS = 200000
+# events waiting for the file writer; when it falls behind, events are dropped, not the scrapes
+TRACE_QUEUE_SIZE = 10000
+# size and number of rotated trace files
+TRACE_FILE_BYTES = 64 << 20
+TRACE_FILE_BACKUPS = 3
+DEFAULT_TRACE_SECONDS = 60
+
+# the Tracer of --debug-trace or --trace-file. Without it span() returns _NO_SPAN, after the
+# caller has built its arguments: four spans per /jmx fetch, one per render.
+_tracer = None
+
+
+def configure(path=None, max_bytes=TRACE_FILE_BYTES, backups=TRACE_FILE_BACKUPS, buffer_events=TRACE_BUFFER_EVENTS):
+    '''
+    Enable tracing: every span is kept in memory for /debug/trace and, with a path, written
+    to rotating trace files.
+    @return the Tracer.
+    '''
+    global _tracer
+    _tracer = Tracer(path, max_bytes, backups, buffer_events)
+    return _tracer
+
+
+def disable():
+    global _tracer
+    _tracer = None
+
+
+def enabled():
+    return _tracer is not None
+
+
+class _NoSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span(object):
+    __slots__ = ('_tracer', '_name', '_category', '_args', '_start')
+
+    def __init__(self, tracer, name, category, args):
+        self._tracer = tracer
+        self._name = name
+        self._category = category
+        self._args = args
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if kind is not None:
+            self._args['error'] = kind.__name__
+        self._tracer.record(self._name, self._category, self._start, time.time(), self._args)
+        return False
+
+    def set(self, **args):
+        '''
+        Add arguments known only at the end of the span, e.g. the bytes of a response.
+        '''
+        self._args.update(args)
+
+
+def span(name, category='scrape', **args):
+    '''
+    with tracing.span('fetch', 'fetch', url=url) as s:
+        ...
+        s.set(beans=len(beans))
+
+    @return a span recorded when the block ends, a shared no-op while tracing is disabled.
+    '''
+    tracer = _tracer
+    if tracer is None:
+        return _NO_SPAN
+    return _Span(tracer, name, category, args)
+
+
+def traced(function, name, category='scrape', **args):
+    '''
+    @return the function, traced as one span per call. A call on a bean (a dict with a name)
+            records the MBean too.
+    '''
+    def call(*positional, **keywords):
+        span_args = dict(args)
+        if positional and isinstance(positional[0], dict) and 'name' in positional[0]:
+            span_args['mbean'] = positional[0]['name']
+        with span(name, category, **span_args):
+            return function(*positional, **keywords)
+    return call
+
+
+def traced_scrape(collector, families):
+    '''
+    @param families: the families generator of one scrape of the collector.
+    @return the generator itself, or one traced from its first family to its end while tracing
+            is enabled. The render between two families is part of the span.
+    '''
+    tracer = _tracer
+    if tracer is None:
+        return families
+    return _traced_families(tracer, collector, families)
+
+
+def _traced_families(tracer, collector, families):
+    start = time.time()
+    count = 0
+    error = None
+    try:
+        for family in families:
+            count += 1
+            yield family
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        args = {'collector': collector, 'families': count}
+        if error is not None:
+            args['error'] = error
+        tracer.record('scrape ' + collector, 'scrape', start, time.time(), args)
+
+
+class _TraceFileHandler(RotatingFileHandler):
+    '''
+    Rotating files in the JSON array format of the trace-event format: every file starts with
+    "[" and every event ends with ",", the closing "]" is optional for Chrome and Perfetto.
+    A new file repeats the thread names first, so that every file opens on its own.
+    @param header: function returning the events a new file starts with.
+    '''
+
+    def __init__(self, path, max_bytes, backups, header):
+        self._header = header
+        RotatingFileHandler.__init__(self, path, maxBytes=max_bytes, backupCount=backups)
+
+    def _open(self):
+        stream = RotatingFileHandler._open(self)
+        if not os.path.getsize(self.baseFilename):
+            stream.write("[\n")
+            for event in self._header():
+                stream.write(json.dumps(event) + ",\n")
+        return stream
+
+
+class Tracer(object):
+    '''
+    Spans of the scrape pipeline in the Chrome trace-event format ("X" complete events, one
+    track per thread), readable by chrome://tracing and https://ui.perfetto.dev. The spans
+    come from every thread: discovery, the scrapes and their fetches, the jmx samplers and
+    the renders of the exposition server.
+    '''
+
+    def __init__(self, path=None, max_bytes=TRACE_FILE_BYTES, backups=TRACE_FILE_BACKUPS,
+                 buffer_events=TRACE_BUFFER_EVENTS):
+        self._pid = os.getpid()
+        self._events = deque(maxlen=buffer_events)
+        self._lock = threading.Lock()
+        # thread id -> thread name, the thread_name metadata of the tracks
+        self._threads = {}
+        self.dropped = 0
+        self._queue = None
+        if path:
+            self._handler = _TraceFileHandler(path, max_bytes, backups, self._thread_events)
+            self._queue = Queue.Queue(TRACE_QUEUE_SIZE)
+            writer = threading.Thread(target=self._write, name="trace-writer")
+            writer.daemon = True
+            writer.start()
+
+    def record(self, name, category, start, end, args):
+        thread = threading.current_thread()
+        tid = thread.ident
+        event = {'name': name, 'cat': category, 'ph': 'X', 'pid': self._pid, 'tid': tid,
+                 'ts': int(start * 1000000), 'dur': int((end - start) * 1000000), 'args': args}
+        with self._lock:
+            self._events.append(event)
+            # a thread id may be reused by a later thread
+            new_thread = self._threads.get(tid) != thread.name
+            if new_thread:
+                self._threads[tid] = thread.name
+        if self._queue is not None:
+            if new_thread:
+                self._put(self._thread_event(tid, thread.name))
+            self._put(event)
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except Queue.Full:
+            self.dropped += 1
+
+    def _thread_event(self, tid, name):
+        return {'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid, 'args': {'name': name}}
+
+    def _thread_events(self):
+        with self._lock:
+            threads = sorted(self._threads.items())
+        return [self._thread_event(tid, name) for tid, name in threads]
+
+    def _write(self):
+        while True:
+            event = self._queue.get()
+            try:
+                self._handler.handle(logging.makeLogRecord({'msg': json.dumps(event) + ','}))
+            except Exception as e:
+                sys.stderr.write("writing the trace failed: {0}\n".format(e))
+
+    def events(self, seconds=None):
+        '''
+        @return the trace of the last `seconds` (all kept events without), as a JSON object.
+        '''
+        since = int((time.time() - seconds) * 1000000) if seconds is not None else None
+        with self._lock:
+            events = [event for event in self._events if since is None or event['ts'] >= since]
+        return {'traceEvents': self._thread_events() + events, 'displayTimeUnit': 'ms'}
+
+
+def handle(query):
+    '''
+    The /debug/trace endpoint of the exposition server: ?seconds=N of spans (default 60) as
+    trace-event JSON, to open in chrome://tracing or https://ui.perfetto.dev.
+    @return (status code, body, content type).
+    '''
+    tracer = _tracer
+    if tracer is None:
+        return 404, "tracing is disabled\n", 'text/plain; charset=utf-8'
+    try:
+        seconds = float(query.get('seconds', [DEFAULT_TRACE_SECONDS])[0])
+    except ValueError:
+        return 400, "seconds must be a number\n", 'text/plain; charset=utf-8'
+    return 200, json.dumps(tracer.events(seconds)), 'application/json'
+
+
+def main():
+    '''
+    Trace parallel scrapes of a test fixture through the exposition server and print the trace,
+    to open in chrome://tracing or https://ui.perfetto.dev:
+
+        python cmd/tracing.py [ROLE] [threads] [scrapes per thread] > trace.json
+    '''
+    import stress
+    # the module the collectors see, not this __main__
+    import tracing
+    from collectors import find_collector, load_collector
+    from prometheus_client.core import CollectorRegistry
+    from exposition import start_http_server
+    role = sys.argv[1] if len(sys.argv) > 1 else 'NAMENODE'
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    scrapes = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    tracer = tracing.configure()
+    jmx, url = stress.serve_beans(stress.read_fixture(stress.FIXTURES[role]))
+    keyword, module_name, class_name = find_collector(role)
+    registry = CollectorRegistry()
+    registry.register(load_collector(module_name, class_name)('cluster_indata', url))
+    exporter = start_http_server(0, addr='127.0.0.1', registry=registry, max_pending=threads)
+    errors, done, seconds = stress.stress(stress._http_scrape('http://127.0.0.1:{0}/metrics'.format(
+        exporter.server_address[1])), threads, scrapes)
+    exporter.shutdown()
+    jmx.shutdown()
+    trace = tracer.events()
+    sys.stdout.write(json.dumps(trace))
+    sys.stderr.write("{0} scrapes in {1:.2f}s, {2} events\n".format(done, seconds, len(trace['traceEvents'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,11 +7,161 @@ import socket
 import requests
 import argparse
 import logging
+import threading
+import time
+import atexit
+import Queue
+import json
 import yaml
+import zlib
+import decoder
+import tracing
+import beancost
 from subprocess import Popen, PIPE
 
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
+from requests.packages.urllib3.exceptions import HTTPError as Urllib3Error
+
+
+# log records are formatted on the calling thread and written by one listener thread, so a
+# slow disk or terminal never stalls a scrape. The queue is bounded; when it is full the
+# record is dropped rather than blocking the caller.
+LOG_QUEUE_SIZE = 10000
+# identical messages (same logger, level and text, e.g. the same failing url) are written at
+# most once per LOG_REPEAT_INTERVAL seconds; the next one reports how many were suppressed.
+LOG_REPEAT_INTERVAL = 60
+LOG_REPEAT_MAX_KEYS = 10000
+
+_log_lock = threading.Lock()
+_log_handlers = []
+_log_queue_handler = None
+_module_loggers = []
+_log_level = logging.INFO
+
+
+class _RepeatFilter(logging.Filter):
+    '''
+    Deduplicate and rate limit identical messages. Every scrape of an unreachable target logs
+    the same warning, which would otherwise flood the log while a rack is down.
+    '''
+
+    def __init__(self, interval=LOG_REPEAT_INTERVAL, max_keys=LOG_REPEAT_MAX_KEYS):
+        logging.Filter.__init__(self)
+        self._interval = interval
+        self._max_keys = max_keys
+        # (logger, level, message) -> [time of the last written record, suppressed count]
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.getMessage())
+        now = record.created
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is not None and now - seen[0] < self._interval:
+                seen[1] += 1
+                return False
+            if seen is None and len(self._seen) >= self._max_keys:
+                # forget the targets which went quiet, keep memory bounded
+                expired = [k for k, v in self._seen.items() if now - v[0] >= self._interval]
+                for k in expired or self._seen.keys():
+                    del self._seen[k]
+            suppressed, elapsed = (seen[1], now - seen[0]) if seen is not None else (0, 0)
+            self._seen[key] = [now, 0]
+        if suppressed:
+            record.msg = "{0} (repeated {1} times in the last {2:.0f}s)".format(record.getMessage(), suppressed, elapsed)
+            record.args = None
+        return True
+
+
+class _QueueHandler(logging.Handler):
+    '''
+    python2 counterpart of logging.handlers.QueueHandler.
+    '''
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.dropped = 0
+
+    def prepare(self, record):
+        # merge the arguments and the traceback now, the record is formatted on another thread.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class _QueueListener(threading.Thread):
+    '''
+    python2 counterpart of logging.handlers.QueueListener: the only writer of the log handlers.
+    '''
+    _sentinel = None
+
+    def __init__(self, queue, handlers):
+        threading.Thread.__init__(self, name="log-listener")
+        self.daemon = True
+        self.queue = queue
+        self.handlers = handlers
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is self._sentinel:
+                break
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def stop(self):
+        self.queue.put(self._sentinel)
+        self.join(5)
+        for handler in self.handlers:
+            handler.flush()
+
+
+def _get_log_handler():
+    '''
+    all module loggers share one queue handler; a single listener thread owns the file handler
+    and the stream handler, instead of every module opening hadoop_exporter.log.
+    '''
+    global _log_queue_handler
+    with _log_lock:
+        if _log_queue_handler is None:
+            # 设置日志文件handler，并设置记录级别
+            path = os.path.dirname(os.path.abspath(__file__))
+            par_path = os.path.dirname(path)
+            fh = logging.FileHandler(os.path.join(par_path, "hadoop_exporter.log"))
+            fh.setLevel(logging.DEBUG)
+
+            # 设置终端输出handler，并设置记录级别
+            sh = logging.StreamHandler()
+            sh.setLevel(logging.INFO)
+
+            # 设置日志格式
+            fmt = logging.Formatter(fmt='%(asctime)s %(filename)s[line:%(lineno)d]-[%(levelname)s]: %(message)s')
+            fh.setFormatter(fmt)
+            sh.setFormatter(fmt)
+            _log_handlers.extend([fh, sh])
+
+            queue = Queue.Queue(LOG_QUEUE_SIZE)
+            listener = _QueueListener(queue, _log_handlers)
+            listener.start()
+            atexit.register(listener.stop)
+            _log_queue_handler = _QueueHandler(queue)
+            _log_queue_handler.addFilter(_RepeatFilter())
+        return _log_queue_handler
 
 
 def get_module_logger(mod_name):
@@ -21,52 +171,435 @@ def get_module_logger(mod_name):
     @return logger.
     '''
     logger = logging.getLogger(mod_name)
-    logger.setLevel(logging.DEBUG)
-    # 设置日志文件handler，并设置记录级别
-    path = os.path.dirname(os.path.abspath(__file__))
-    par_path = os.path.dirname(path)
-    fh = logging.FileHandler(os.path.join(par_path, "hadoop_exporter.log"))
-    fh.setLevel(logging.INFO)
-
-    # 设置终端输出handler，并设置记录级别
-    sh = logging.StreamHandler()
-    sh.setLevel(logging.INFO)
-
-    # 设置日志格式
-    fmt = logging.Formatter(fmt='%(asctime)s %(filename)s[line:%(lineno)d]-[%(levelname)s]: %(message)s')
-    fh.setFormatter(fmt)
-    sh.setFormatter(fmt)
-
-    # 添加handler到logger对象
-    logger.addHandler(fh)
-    logger.addHandler(sh)
+    logger.setLevel(_log_level)
+    # 添加handler到logger对象, 重复调用时不会重复添加
+    handler = _get_log_handler()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+        _module_loggers.append(logger)
     return logger
 
+
+def set_log_level(level):
+    '''
+    @param level: e.g. "DEBUG", "INFO" or logging.WARNING, applied to every module logger.
+    '''
+    global _log_level
+    if not isinstance(level, int):
+        level = getattr(logging, str(level).upper())
+    _log_level = level
+    for logger in _module_loggers:
+        logger.setLevel(level)
+
 logger = get_module_logger(__name__)
 
-def get_metrics(url):
+# concurrent fetches of the same (url, query) wait on one in-flight request, and a fetch which
+# completed less than COALESCE_WINDOW seconds ago is shared as well; 0 only joins in-flight fetches.
+COALESCE_WINDOW = 1.0
+# completed fetches are pruned from the flight table beyond this many keys
+COALESCE_MAX_KEYS = 256
+
+_flights_lock = threading.Lock()
+# (url, query) -> _Flight
+_flights = {}
+
+
+class _Flight(object):
+    '''
+    One upstream fetch and every caller waiting for it.
+    '''
+    __slots__ = ('done', 'result', 'error', 'time')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = []
+        self.error = None
+        self.time = None
+
+
+# (max bytes, max beans) of one /jmx response, 0 is no limit. A RegionServer with a region
+# explosion or a HiveServer2 with thousands of kafka topic beans is aborted at the limit
+# instead of buffering hundreds of MB; see MetricCol._fetch_reduced for the fallback.
+PAYLOAD_LIMIT = (128 << 20, 0)
+PAYLOAD_CHUNK_SIZE = 64 << 10
+_BEAN_MARKER = '"modelerType"'
+# what reading, inflating and decoding a streamed body may raise besides PayloadTooLarge
+_READ_ERRORS = (requests.exceptions.RequestException, Urllib3Error, socket.error, zlib.error, ValueError)
+# service -> (max bytes, max beans)
+_service_payload_limits = {}
+# url -> (max bytes, max beans)
+_url_payload_limits = {}
+_payload_stats_lock = threading.Lock()
+# url -> payload statistics, see get_payload_stats
+_payload_stats = {}
+
+# gzip transfer of the /jmx responses: "auto" asks an endpoint for gzip while the transfer time it
+# saves is larger than the CPU spent decompressing, "always" and "never" skip the measurements.
+COMPRESSION = 'auto'
+COMPRESSION_MODES = ('auto', 'always', 'never')
+# while gzip is off for an endpoint, every GZIP_PROBE_INTERVAL-th fetch asks for it again so
+# that its ratio and decode cost stay current.
+GZIP_PROBE_INTERVAL = 10
+# weight of the latest fetch in the moving averages of an endpoint
+GZIP_SMOOTHING = 0.3
+_compression_lock = threading.Lock()
+# url -> _Compression
+_compression = {}
+
+
+def set_coalesce_window(seconds):
+    global COALESCE_WINDOW
+    COALESCE_WINDOW = seconds
+
+
+def get_metrics(url, params=None):
+    '''
+    Single-flight wrapper of fetch_metrics: when two Prometheus servers scrape at the same time,
+    or one jmx url is discovered under two roles, the daemon still serves one request.
+    The returned beans are shared by all callers and must be treated as read only.
+    :param url: The jmx url, e.g. http://host1:50070/jmx,http://host1:8088/jmx, http://host2:19888/jmx...
+    :param params: optional query of the jmx servlet, e.g. {"qry": "Hadoop:service=NameNode,name=NameNodeInfo"}.
+    :return a list of all beans scraped in the jmx url.
+    :raise PayloadTooLarge when the response exceeds the payload limits of the url.
+    '''
+    key = (url, tuple(sorted(params.items())) if params else ())
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is None or (flight.done.is_set() and time.time() - flight.time >= COALESCE_WINDOW):
+            if len(_flights) >= COALESCE_MAX_KEYS:
+                now = time.time()
+                for k, f in _flights.items():
+                    if f.done.is_set() and now - f.time >= COALESCE_WINDOW:
+                        del _flights[k]
+            flight = _flights[key] = _Flight()
+            leader = True
+        else:
+            leader = False
+    if not leader:
+        with tracing.span('coalesced fetch', 'fetch', url=url):
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+    try:
+        flight.result = fetch_metrics(url, params)
+    except PayloadTooLarge as e:
+        flight.error = e
+        raise
+    finally:
+        flight.time = time.time()
+        flight.done.set()
+        if not flight.result:
+            # a failure is shared with the waiting callers only, the next caller retries.
+            with _flights_lock:
+                if _flights.get(key) is flight:
+                    del _flights[key]
+    return flight.result
+
+
+class PayloadTooLarge(Exception):
+    '''
+    A /jmx response exceeded the byte or bean limit of its url and was aborted.
+    '''
+
+    def __init__(self, url, limit, value):
+        Exception.__init__(self, "{0}: response aborted after {1} {2}".format(url, value, limit))
+        self.url = url
+        # "bytes" or "beans"
+        self.limit = limit
+        self.value = value
+
+
+def parse_size(value):
+    '''
+    @param value: a number of bytes with an optional K, M or G suffix, e.g. "64M".
+    '''
+    value = str(value).strip().upper().rstrip('B')
+    for suffix, factor in (('K', 1 << 10), ('M', 1 << 20), ('G', 1 << 30)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(value)
+
+
+def parse_payload_limit(value):
+    '''
+    @param value: "<service>=<bytes>[:<beans>]" of the command line, e.g. "regionserver=64M:20000".
+    @return (service, (max bytes, max beans)), 0 is no limit.
+    '''
+    service, limit = value.split('=', 1)
+    max_bytes, _, max_beans = limit.partition(':')
+    return service.strip(), (parse_size(max_bytes) if max_bytes else 0, int(max_beans or 0))
+
+
+def set_payload_limits(default, services=None):
+    '''
+    @param default: (max bytes, max beans) of every service, 0 is no limit.
+    @param services: {service: (max bytes, max beans)} overriding the default, e.g. for regionserver.
+    '''
+    global PAYLOAD_LIMIT
+    PAYLOAD_LIMIT = tuple(default)
+    _service_payload_limits.clear()
+    _service_payload_limits.update(services or {})
+
+
+def get_payload_limit(service):
+    return _service_payload_limits.get(service, PAYLOAD_LIMIT)
+
+
+def set_url_payload_limit(url, limit):
+    '''
+    @param limit: (max bytes, max beans) applied to every fetch of the url.
+    '''
+    _url_payload_limits[url] = tuple(limit)
+
+
+def get_payload_stats():
+    '''
+    @return {url: {"bytes": size of the last full dump, "beans": beans of the last full dump,
+             "bytes_total": all bytes received, "aborts": {limit: count}}}.
+    '''
+    with _payload_stats_lock:
+        return dict((url, dict(stats, aborts=dict(stats['aborts']))) for url, stats in _payload_stats.items())
+
+
+def set_compression(mode):
+    '''
+    @param mode: one of COMPRESSION_MODES.
+    '''
+    global COMPRESSION
+    if mode not in COMPRESSION_MODES:
+        raise ValueError("unknown compression mode {0}, expected one of {1}".format(mode, ", ".join(COMPRESSION_MODES)))
+    COMPRESSION = mode
+    with _compression_lock:
+        _compression.clear()
+
+
+class _Compression(object):
+    '''
+    The gzip choice of one endpoint. Every full dump measures the transfer time per byte on the
+    wire; every gzip full dump also measures the compression ratio and the decompression CPU per
+    byte. Gzip stays on while the transfer time it saves on a payload, size * (1 - 1/ratio) *
+    transfer, exceeds the time to decompress it, size * cost: on for a congested inter-rack link,
+    off for a fast link or a Jetty without a GzipHandler, which answers uncompressed.
+    '''
+    __slots__ = ('url', 'enabled', 'supported', 'ratio', 'cost', 'transfer', 'skipped',
+                 'wire_bytes_total', 'decode_seconds_total')
+
+    def __init__(self, url):
+        self.url = url
+        # the first fetch asks for gzip, to learn whether and how well the endpoint compresses
+        self.enabled = True
+        self.supported = None
+        self.ratio = None
+        self.cost = None
+        self.transfer = None
+        self.skipped = 0
+        self.wire_bytes_total = 0
+        self.decode_seconds_total = 0.0
+
+    def accept_gzip(self):
+        if COMPRESSION != 'auto':
+            return COMPRESSION == 'always'
+        if self.enabled:
+            return True
+        self.skipped += 1
+        if self.skipped >= GZIP_PROBE_INTERVAL:
+            self.skipped = 0
+            return True
+        return False
+
+    def observe(self, gzip, wire, size, transfer, decode, full=True):
+        '''
+        @param gzip: whether the response was gzip encoded.
+        @param wire: bytes received on the wire.
+        @param size: bytes of the decoded body.
+        @param transfer: seconds spent receiving the body, decompression excluded.
+        @param decode: seconds spent decompressing.
+        @param full: whether it was a full dump; the small ?qry= and ?get= responses are
+                     dominated by latency and only counted, not measured.
+        '''
+        self.wire_bytes_total += wire
+        self.decode_seconds_total += decode
+        if not full:
+            return
+        if transfer > 0 and wire:
+            self.transfer = _smooth(self.transfer, transfer / wire)
+        self.supported = gzip
+        if gzip and wire and size:
+            self.ratio = _smooth(self.ratio, float(size) / wire)
+            self.cost = _smooth(self.cost, decode / size)
+        if COMPRESSION != 'auto':
+            return
+        if not gzip:
+            # not asked for, or the endpoint does not compress: off until the next probe
+            enabled = False
+        elif None in (self.ratio, self.transfer):
+            return
+        else:
+            enabled = (1 - 1 / self.ratio) * self.transfer > self.cost
+            if enabled != self.enabled:
+                logger.info("{0} gzip for {1}: ratio {2:.1f}, {3:.0f} bytes/s on the wire, {4:.3g}s decode per MB".format(
+                    "enable" if enabled else "disable", self.url, self.ratio, 1 / self.transfer, self.cost * (1 << 20)))
+        self.enabled = enabled
+
+
+def _smooth(average, value):
+    return value if average is None else average + GZIP_SMOOTHING * (value - average)
+
+
+def _get_compression(url):
+    with _compression_lock:
+        compression = _compression.get(url)
+        if compression is None:
+            compression = _compression[url] = _Compression(url)
+        return compression
+
+
+def get_compression_stats():
+    '''
+    @return {url: {"enabled": gzip asked for, "ratio": decoded/wire bytes of gzip responses,
+             "rate": wire bytes per second, "wire_bytes_total", "decode_seconds_total"}};
+             ratio and rate are None until measured.
+    '''
+    with _compression_lock:
+        return dict((url, {'enabled': c.enabled and c.supported is not False, 'ratio': c.ratio,
+                           'rate': 1 / c.transfer if c.transfer else None,
+                           'wire_bytes_total': c.wire_bytes_total, 'decode_seconds_total': c.decode_seconds_total})
+                    for url, c in _compression.items())
+
+
+def _record_payload(url, params, size, beans=None, abort=None):
+    with _payload_stats_lock:
+        stats = _payload_stats.get(url)
+        if stats is None:
+            stats = _payload_stats[url] = {'bytes': 0, 'beans': 0, 'bytes_total': 0, 'aborts': {}}
+        stats['bytes_total'] += size
+        if abort is not None:
+            stats['aborts'][abort] = stats['aborts'].get(abort, 0) + 1
+        elif not params:
+            stats['bytes'], stats['beans'] = size, beans
+
+
+def _is_gzip(response):
+    return response.headers.get('Content-Encoding', '').strip().lower() == 'gzip'
+
+
+def _body_chunks(response, counters):
+    '''
+    Yield the decoded body of a streamed response. A gzip body is decompressed here instead of
+    by requests, so that the bytes on the wire and the decompression time are known, and at most
+    PAYLOAD_CHUNK_SIZE bytes at a time, so that a gzip bomb still stops at the payload limits.
+    @param counters: [wire bytes, seconds spent decompressing], updated in place.
+    '''
+    inflate = zlib.decompressobj(16 + zlib.MAX_WBITS) if _is_gzip(response) else None
+    for data in response.raw.stream(PAYLOAD_CHUNK_SIZE, decode_content=False):
+        counters[0] += len(data)
+        if inflate is None:
+            yield data
+            continue
+        while data:
+            start = time.time()
+            chunk = inflate.decompress(data, PAYLOAD_CHUNK_SIZE)
+            counters[1] += time.time() - start
+            data = inflate.unconsumed_tail
+            if chunk:
+                yield chunk
+    if inflate is not None:
+        chunk = inflate.flush()
+        if chunk:
+            yield chunk
+
+
+def _read_payload(url, response, max_bytes, max_beans):
+    '''
+    Read the body chunk by chunk, aborting as soon as a limit is exceeded instead of buffering
+    a runaway payload. The beans are counted by their "modelerType" key, which every bean has once.
+    The limits apply to the decompressed body.
+    @return (body, size, wire bytes, seconds spent decompressing).
+    '''
+    chunks, size, beans, tail = [], 0, 0, ''
+    counters = [0, 0.0]
+    for chunk in _body_chunks(response, counters):
+        size += len(chunk)
+        if max_bytes and size > max_bytes:
+            raise PayloadTooLarge(url, 'bytes', size)
+        if max_beans:
+            # a marker split over two chunks is found through the tail of the previous chunk
+            window = tail + chunk
+            beans += window.count(_BEAN_MARKER)
+            tail = window[-(len(_BEAN_MARKER) - 1):]
+            if beans > max_beans:
+                raise PayloadTooLarge(url, 'beans', beans)
+        chunks.append(chunk)
+    return ''.join(chunks), size, counters[0], counters[1]
+
+
+def fetch_metrics(url, params=None):
     '''
     :param url: The jmx url, e.g. http://host1:50070/jmx,http://host1:8088/jmx, http://host2:19888/jmx...
-    :return a dict of all metrics scraped in the jmx url.
+    :param params: optional query of the jmx servlet, e.g. {"qry": "Hadoop:service=NameNode,name=NameNodeInfo"}.
+    :return a list of all beans scraped in the jmx url, always a new request.
+    :raise PayloadTooLarge when the response exceeds the payload limits of the url.
     '''
+    with tracing.span('fetch', 'fetch', url=url, qry=params.get('qry') if params else None) as span:
+        result = _fetch_metrics(url, params)
+        span.set(beans=len(result))
+    return result
+
+
+def _fetch_metrics(url, params):
     result = []
+    max_bytes, max_beans = _url_payload_limits.get(url, PAYLOAD_LIMIT)
+    compression = _get_compression(url)
+    with _compression_lock:
+        headers = {'Accept-Encoding': 'gzip' if compression.accept_gzip() else 'identity'}
+    s = requests.session()
     try:
-        s = requests.session()
-        response = s.get(url, auth=("admin", "admin"), timeout=5)  # , params=params, auth=(self._user, self._password))
+        with tracing.span('request', 'fetch', gzip=headers['Accept-Encoding'] == 'gzip'):
+            response = s.get(url, params=params, auth=("admin", "admin"), timeout=5, stream=True, headers=headers)
     except Exception as e:
-        logger.warning("error in func: get_metrics, error msg: %s"%e)
+        logger.warning("error in func: fetch_metrics, error msg: %s"%e)
         result = []
-    else:    
-        if response.status_code != requests.codes.ok:
-            logger.warning("Get {0} failed, response code is: {1}.".format(url, response.status_code))
-            result = []
-        rlt = response.json()
-        logger.debug(rlt)
-        if rlt and "beans" in rlt:
-            result = rlt['beans']
-        else:
-            logger.warning("No metrics get in the {0}.".format(url))
-            result = []
+    else:
+        try:
+            if response.status_code != requests.codes.ok:
+                logger.warning("Get {0} failed, response code is: {1}.".format(url, response.status_code))
+                result = []
+            try:
+                start = time.time()
+                try:
+                    with tracing.span('read', 'fetch') as span:
+                        body, size, wire, decode = _read_payload(url, response, max_bytes, max_beans)
+                        span.set(bytes=size, wire_bytes=wire, inflate_ms=int(decode * 1000))
+                except PayloadTooLarge as e:
+                    logger.warning("{0}, the payload limits are {1} bytes and {2} beans".format(e, max_bytes or 'no', max_beans or 'no'))
+                    _record_payload(url, params, e.value if e.limit == 'bytes' else 0, abort=e.limit)
+                    raise
+                with _compression_lock:
+                    compression.observe(_is_gzip(response), wire, size, time.time() - start - decode, decode, full=not params)
+                with tracing.span('decode', 'fetch', backend=decoder.BACKEND, bytes=size):
+                    start = time.time()
+                    rlt = decoder.loads(body)
+                    decode = time.time() - start
+            except _READ_ERRORS as e:
+                # a body cut off, stalled or corrupt loses this target's beans, not the whole scrape
+                logger.warning("Reading {0} failed, error msg: {1}".format(url, e))
+                return []
+            # never build the repr of a whole payload unless debug logging is on
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(rlt)
+            if rlt and "beans" in rlt:
+                result = rlt['beans']
+            else:
+                logger.warning("No metrics get in the {0}.".format(url))
+                result = []
+            if max_beans and len(result) > max_beans:
+                _record_payload(url, params, size, abort='beans')
+                raise PayloadTooLarge(url, 'beans', len(result))
+            _record_payload(url, params, size, len(result))
+            beancost.observe_fetch(url, body, result, wire, decode)
+        finally:
+            response.close()
     finally:
         s.close()
     return result
@@ -272,6 +805,200 @@ def parse_args():
         help='Polling server on this address. (default "127.0.0.1")',
         default='127.0.0.1'
     )
+    parser.add_argument(
+        '--queue-depth',
+        metavar='queue_depth',
+        required=False,
+        type=int,
+        help='Deepest YARN queue level exported per queue and per user, root is 0, -1 exports the whole hierarchy. (default "1")',
+        default=1
+    )
+    parser.add_argument(
+        '--queue-allowlist',
+        metavar='queue_glob',
+        required=False,
+        type=lambda v: [p.strip() for p in v.split(',') if p.strip()],
+        help='Comma separated glob patterns of YARN queue paths exported per queue and per user, e.g. "root.prod.*". (default: all queues)',
+        default=None
+    )
+    parser.add_argument(
+        '--nodemanager-central',
+        required=False,
+        action='store_true',
+        help='Export per-NodeManager capacity, usage and health from the ResourceManager (RMNMInfo) and scrape the NodeManagers themselves only every --nodemanager-interval seconds.',
+        default=False
+    )
+    parser.add_argument(
+        '--nodemanager-interval',
+        metavar='seconds',
+        required=False,
+        type=int,
+        help='NodeManager scrape interval in central mode. (default "300")',
+        default=300
+    )
+    parser.add_argument(
+        '--nodemanager-summary',
+        required=False,
+        action='store_true',
+        help='In central NodeManager mode, export the distribution over all NodeManagers instead of one series per NodeManager.',
+        default=False
+    )
+    parser.add_argument(
+        '--datanode-central',
+        required=False,
+        action='store_true',
+        help='Export per-DataNode capacity, usage, failed volumes and last contact from the NameNode (NameNodeInfo) and scrape the DataNodes themselves only every --datanode-interval seconds.',
+        default=False
+    )
+    parser.add_argument(
+        '--datanode-interval',
+        metavar='seconds',
+        required=False,
+        type=int,
+        help='DataNode scrape interval in central mode. (default "300")',
+        default=300
+    )
+    parser.add_argument(
+        '--datanode-summary',
+        required=False,
+        action='store_true',
+        help='In central DataNode mode, export the distribution over all DataNodes instead of one series per DataNode.',
+        default=False
+    )
+    parser.add_argument(
+        '--fleet-top',
+        metavar='hosts',
+        required=False,
+        type=int,
+        help='Number of outlier hosts (largest values) exported per metric in the DataNode and NodeManager summaries. (default "5")',
+        default=5
+    )
+    parser.add_argument(
+        '--polling-tiers',
+        metavar='tiers_dir',
+        required=False,
+        nargs='?',
+        const=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tiers"),
+        help='Poll the MBeans of every service with a tier file (<service>.yaml) in this directory at per-tier intervals, hot attributes with ?get=. (default: disabled, the directory defaults to "tiers")',
+        default=None
+    )
+    parser.add_argument(
+        '--throttle',
+        required=False,
+        action='store_true',
+        help='Back off from the NameNode, ResourceManager and HBase master while their RPC call queue is saturated: poll every --throttle-interval seconds (4 times longer when saturated) and only the hot beans.',
+        default=False
+    )
+    parser.add_argument(
+        '--throttle-interval',
+        metavar='seconds',
+        required=False,
+        type=int,
+        help='Poll interval of a throttled master. (default "60")',
+        default=60
+    )
+    parser.add_argument(
+        '--throttle-queue-length',
+        metavar='calls',
+        required=False,
+        type=float,
+        help='RPC call queue length from which a master is throttled, 10 times more is saturated. (default "100")',
+        default=100
+    )
+    parser.add_argument(
+        '--throttle-queue-time',
+        metavar='milliseconds',
+        required=False,
+        type=float,
+        help='Average RPC queue time from which a master is throttled, 10 times more is saturated. (default "100")',
+        default=100
+    )
+    parser.add_argument(
+        '--coalesce-window',
+        metavar='seconds',
+        required=False,
+        type=float,
+        help='Scrapes of the same jmx url (and query) within this many seconds share one request, concurrent scrapes always do. (default "1")',
+        default=1.0
+    )
+    parser.add_argument(
+        '--gzip',
+        required=False,
+        choices=COMPRESSION_MODES,
+        help='Gzip transfer of the jmx responses: auto asks every endpoint for gzip while the transfer time it saves exceeds the decompression CPU. (default "auto")',
+        default='auto'
+    )
+    parser.add_argument(
+        '--json-decoder',
+        required=False,
+        choices=('auto',) + decoder.BACKENDS,
+        help='JSON decoder of the jmx responses, auto picks the fastest one installed: orjson, ujson, simdjson, then the json module. (default "auto")',
+        default='auto'
+    )
+    parser.add_argument(
+        '--max-payload-bytes',
+        metavar='bytes',
+        required=False,
+        type=parse_size,
+        help='Abort a /jmx response larger than this (K, M and G suffixes are allowed, 0 is no limit) and fall back to one query per catalog. (default "128M")',
+        default=PAYLOAD_LIMIT[0]
+    )
+    parser.add_argument(
+        '--max-payload-beans',
+        metavar='beans',
+        required=False,
+        type=int,
+        help='Abort a /jmx response with more beans than this and fall back to one query per catalog, 0 is no limit. (default "0")',
+        default=PAYLOAD_LIMIT[1]
+    )
+    parser.add_argument(
+        '--payload-limit',
+        metavar='service=bytes[:beans]',
+        required=False,
+        action='append',
+        type=parse_payload_limit,
+        help='Payload limits of one service overriding --max-payload-bytes and --max-payload-beans, e.g. "regionserver=64M:20000". May be repeated.',
+        default=[]
+    )
+    parser.add_argument(
+        '--sampling',
+        required=False,
+        action='store_true',
+        help='Sample spiky gauges (RPC call queue length, pending replications, running containers, LLAP queued requests) every --sample-period seconds between scrapes and export their max, min and p99 over --sample-window seconds.',
+        default=False
+    )
+    parser.add_argument(
+        '--sample-period',
+        metavar='seconds',
+        required=False,
+        type=float,
+        help='Seconds between two samples. (default "1")',
+        default=1.0
+    )
+    parser.add_argument(
+        '--sample-window',
+        metavar='seconds',
+        required=False,
+        type=float,
+        help='Seconds of samples the sampled gauges are computed over, usually the scrape interval. (default "30")',
+        default=30.0
+    )
+    parser.add_argument(
+        '--sample',
+        metavar='service=bean::attribute',
+        required=False,
+        action='append',
+        help='Attribute sampled for a service instead of the defaults, e.g. "namenode=Hadoop:service=NameNode,name=FSNamesystem::UnderReplicatedBlocks". May be repeated.',
+        default=[]
+    )
+    parser.add_argument(
+        '--log-level',
+        metavar='log_level',
+        required=False,
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+        help='Log level of the exporter, DEBUG also dumps the scraped payloads. (default "INFO")',
+        default='INFO'
+    )
     parser.add_argument(
         '-P', '--port',
         metavar='port',
@@ -280,6 +1007,95 @@ def parse_args():
         help='Listen to this port. (default "9131")',
         default=9131
     )
+    parser.add_argument(
+        '--web-workers',
+        metavar='threads',
+        required=False,
+        type=int,
+        help='Threads serving the scrapes, requests beyond them wait in a bounded queue. (default "8")',
+        default=8
+    )
+    parser.add_argument(
+        '--web-max-pending',
+        metavar='requests',
+        required=False,
+        type=int,
+        help='Requests waiting for a free thread, beyond them a scrape is answered 503 with Retry-After. (default "32")',
+        default=32
+    )
+    parser.add_argument(
+        '--web-max-renders',
+        metavar='renders',
+        required=False,
+        type=int,
+        help='Renders of the metrics running at once, beyond them a scrape is answered 503 with Retry-After. (default "2")',
+        default=2
+    )
+    parser.add_argument(
+        '--web-snapshot-max-age',
+        metavar='seconds',
+        required=False,
+        type=float,
+        help='Scrapes within this many seconds of a render are served its snapshot, concurrent scrapes always share one render. (default "1")',
+        default=1.0
+    )
+    parser.add_argument(
+        '--debug-profile',
+        required=False,
+        action='store_true',
+        help='Serve /debug/profile?seconds=N&format=collapsed|pstats, a CPU profile of the scrapes per collector class. (default off)',
+        default=False
+    )
+    parser.add_argument(
+        '--debug-memory',
+        metavar='backend',
+        required=False,
+        nargs='?',
+        const='auto',
+        choices=['auto', 'tracemalloc', 'gc'],
+        help='Track the allocations of every collector scrape, one scrape at a time, exported as hadoop_exporter_scrape_*_bytes and served on /debug/memory. tracemalloc needs Python >= 3.4, gc counts the objects of the garbage collector. (default off, "auto" without a backend)',
+        default=None
+    )
+    parser.add_argument(
+        '--debug-trace',
+        required=False,
+        action='store_true',
+        help='Trace discovery, fetches, decoding, extraction and rendering as spans and serve the last ?seconds=N of them on /debug/trace, in the Chrome trace-event format of chrome://tracing and ui.perfetto.dev. (default off)',
+        default=False
+    )
+    parser.add_argument(
+        '--trace-file',
+        metavar='path',
+        required=False,
+        help='Trace the scrapes like --debug-trace and write every span to this file, rotated at --trace-file-size. (default off)',
+        default=None
+    )
+    parser.add_argument(
+        '--trace-file-size',
+        metavar='bytes',
+        required=False,
+        type=parse_size,
+        help='Size at which the trace file is rotated, e.g. "64M". (default 64M)',
+        default=tracing.TRACE_FILE_BYTES
+    )
+    parser.add_argument(
+        '--trace-file-backups',
+        metavar='count',
+        required=False,
+        type=int,
+        help='Rotated trace files kept besides the current one. (default 3)',
+        default=tracing.TRACE_FILE_BACKUPS
+    )
+    parser.add_argument(
+        '--debug-beans',
+        metavar='output',
+        required=False,
+        nargs='?',
+        const='report',
+        choices=['report', 'metrics'],
+        help='Account the bytes, decode time, extraction time and series of every MBean group per target and serve them on /debug/beans; "metrics" also exports them as hadoop_exporter_mbean_*, one series per target and group. (default off, "report" without an output)',
+        default=None
+    )
     return parser.parse_args()
 
 
@@ -10,7 +10,6 @@ from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily, REG
 
 import utils
 from utils import get_module_logger
-from consul import Consul
 from common import MetricCol, common_metrics_info
 
 logger = get_module_logger(__name__)
@@ -19,8 +18,15 @@ logger = get_module_logger(__name__)
 
 class NodeManagerMetricCollector(MetricCol):
 
-    def __init__(self, cluster, url):
+    def __init__(self, cluster, url, central=False, central_interval=300):
+        '''
+        @param central: the ResourceManager exporter already derives the per-NodeManager series
+                        from RMNMInfo, so the NodeManager itself is only scraped every
+                        central_interval seconds and the previous beans are served in between.
+        '''
         MetricCol.__init__(self, cluster, url, "yarn", "nodemanager")
+        if central:
+            self._scrape_interval = central_interval
         self._clear_init()
 
     def _clear_init(self):
@@ -28,14 +34,14 @@ class NodeManagerMetricCollector(MetricCol):
         for i in range(len(self._file_list)):
             self._hadoop_nodemanager_metrics.setdefault(self._file_list[i], {})
 
-    def collect(self):
+    def _collect(self):
         self._clear_init()
         # Request data from ambari Collect Host API
         # Request exactly the System level information we need from node
         # beans returns a type of 'List'
 
         try:
-            beans = utils.get_metrics(self._url)
+            beans = self._get_beans()
         except:
             logger.info("Can't scrape metrics from url: {0}".format(self._url))
             pass
@@ -50,10 +56,8 @@ class NodeManagerMetricCollector(MetricCol):
             common_metrics = common_metrics_info(self._cluster, beans, "yarn", "nodemanager")
             self._hadoop_nodemanager_metrics.update(common_metrics())
     
-            for i in range(len(self._merge_list)):
-                service = self._merge_list[i]
-                for metric in self._hadoop_nodemanager_metrics[service]:
-                    yield self._hadoop_nodemanager_metrics[service][metric]
+            for metric in self._catalog_families(self._hadoop_nodemanager_metrics):
+                yield metric
 
     def _setup_metrics_labels(self, beans):
         # The metrics we want to export.
@@ -94,7 +98,7 @@ def main():
         port = int(args.port)
         cluster = args.cluster
         v = args.nodemanager_url
-        REGISTRY.register(NodeManagerMetricCollector(cluster, v))
+        REGISTRY.register(NodeManagerMetricCollector(cluster, v, args.nodemanager_central, args.nodemanager_interval))
 
         start_http_server(port)
         # print("Polling %s. Serving at port: %s" % (args.address, port))
@@ -4,19 +4,64 @@
 import yaml
 import re
 import time
+import fnmatch
+from array import array
 from sys import exit
 from prometheus_client import start_http_server
 from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily, REGISTRY
 
 import utils
 from utils import get_module_logger
-from consul import Consul
-from common import MetricCol, common_metrics_info
+from common import MetricCol, common_metrics_info, rpc_pressure
+from fleet import NodeColumns, FleetSummary, DEFAULT_TOP
 
 logger = get_module_logger(__name__)
 
+# bean name -> (queue path, user, exported) is remembered across scrapes; queues and users are
+# bounded by the scheduler configuration, this only guards against pathological payloads.
+MAX_CACHED_QUEUE_BEANS = 100000
+# deepest queue level exported per queue and per user by default: root and its children. A
+# large scheduler has hundreds of leaf queues, each multiplied by its users.
+DEFAULT_QUEUE_DEPTH = 1
+
+# per-NodeManager series only exported in central mode, derived from RMNMInfo.LiveNodeManagers:
+# (key, metric name, description)
+CENTRAL_NODE_METRICS = (
+    ('UsedVirtualCores', 'node_vcores_used', 'The total number of virtual cores currently used on the host'),
+    ('AvailableVirtualCores', 'node_vcores_available', 'The total number of virtual cores currently available on the host'),
+    ('MemoryCapacityMB', 'node_memory_capacity', 'The total amount of memory of the host managed by YARN (in MB)'),
+    ('VirtualCoresCapacity', 'node_vcores_capacity', 'The total number of virtual cores of the host managed by YARN'),
+    ('Healthy', 'node_healthy', 'Whether the NodeManager is running and healthy, 1 is healthy'),
+    ('HealthReportAge', 'node_health_report_age_seconds', 'Seconds since the last health report of the NodeManager'),
+)
+
+# distributions over all NodeManagers exported instead of the per-NodeManager series in summary mode:
+# (key, metric name, description, histogram buckets)
+NODEMANAGER_SUMMARY_METRICS = (
+    ('NumContainers', 'nodemanagers_containers', 'Number of containers running on a NodeManager',
+     (0, 1, 2, 4, 8, 16, 32, 64, 128)),
+    ('UsedMemoryMB', 'nodemanagers_memory_used', 'Memory used on a NodeManager (in MB)',
+     (1024, 4096, 16384, 65536, 262144)),
+    ('AvailableMemoryMB', 'nodemanagers_memory_available', 'Memory available on a NodeManager (in MB)',
+     (1024, 4096, 16384, 65536, 262144)),
+    ('UsedVirtualCores', 'nodemanagers_vcores_used', 'Virtual cores used on a NodeManager',
+     (1, 2, 4, 8, 16, 32, 64, 128)),
+    ('AvailableVirtualCores', 'nodemanagers_vcores_available', 'Virtual cores available on a NodeManager',
+     (1, 2, 4, 8, 16, 32, 64, 128)),
+    ('HealthReportAge', 'nodemanagers_health_report_age_seconds', 'Seconds since the last health report of a NodeManager',
+     (60, 300, 600, 1800)),
+)
+
+
 class ResourceManagerMetricCollector(MetricCol):
 
+    RUNNING_ELAPSED_TIME = {
+        'running_0': '0to60',
+        'running_60': '60to300',
+        'running_300': '300to1440',
+        'running_1440': '1440up',
+    }
+
     NODE_STATE = {
         'NEW': 1,
         'RUNNING': 2,
@@ -24,10 +69,34 @@ class ResourceManagerMetricCollector(MetricCol):
         'DECOMMISSIONED': 4,
         'LOST': 5,
         'REBOOTED': 6,
+        'DECOMMISSIONING': 7,
+        'SHUTDOWN': 8,
     }
 
-    def __init__(self, cluster, url):
+    # attributes of LiveNodeManagers used by the central NodeManager series
+    CENTRAL_NODE_ATTRIBUTES = ('UsedMemoryMB', 'AvailableMemoryMB', 'UsedVirtualCores', 'AvailableVirtualCores', 'LastHealthUpdate')
+
+    def __init__(self, cluster, url, queue_depth=DEFAULT_QUEUE_DEPTH, queue_allowlist=None, central_nodemanagers=False,
+                 nodemanager_summary=False, fleet_top=DEFAULT_TOP):
+        '''
+        @param queue_depth: deepest queue level exported per queue and per user, root is 0.
+                            None or a negative depth exports the whole hierarchy.
+        @param queue_allowlist: optional list of glob patterns of queue paths, e.g. ["root.prod.*"].
+        @param central_nodemanagers: also export per-NodeManager capacity, usage and health series
+                                     from RMNMInfo, so the NodeManagers can be scraped rarely.
+        @param nodemanager_summary: in central mode, export the distribution over all NodeManagers
+                                    (quantiles, histogram and the fleet_top largest hosts) instead
+                                    of one series per NodeManager.
+        '''
         MetricCol.__init__(self, cluster, url, "yarn", "resourcemanager")
+        self._central_nodemanagers = central_nodemanagers
+        self._nodemanager_summary = central_nodemanagers and nodemanager_summary
+        self._fleet_top = fleet_top
+        self._queue_depth = queue_depth if queue_depth is None or queue_depth >= 0 else None
+        self._queue_allowlist = None
+        if queue_allowlist:
+            self._queue_allowlist = re.compile("|".join(fnmatch.translate(p) for p in queue_allowlist))
+        self._queue_keys = {}
         self._clear_init()
 
     def _clear_init(self):
@@ -35,14 +104,14 @@ class ResourceManagerMetricCollector(MetricCol):
         for i in range(len(self._file_list)):
             self._hadoop_resourcemanager_metrics.setdefault(self._file_list[i], {})
 
-    def collect(self):
+    def _collect(self):
         self._clear_init()
         # Request data from ambari Collect Host API
         # Request exactly the System level information we need from node
         # beans returns a type of 'List'
 
         try:
-            beans = utils.get_metrics(self._url)
+            beans = self._get_beans()
         except:
             logger.info("Can't scrape metrics from url: {0}".format(self._url))
             pass
@@ -57,12 +126,17 @@ class ResourceManagerMetricCollector(MetricCol):
             common_metrics = common_metrics_info(self._cluster, beans, "yarn", "resourcemanager")
             self._hadoop_resourcemanager_metrics.update(common_metrics())
 
-            for i in range(len(self._merge_list)):
-                service = self._merge_list[i]
-                for metric in self._hadoop_resourcemanager_metrics[service]:
-                    yield self._hadoop_resourcemanager_metrics[service][metric]
+            for metric in self._catalog_families(self._hadoop_resourcemanager_metrics):
+                yield metric
+
+            # back off while the RPC queue is saturated, see throttle.py
+            for metric in self._observe_pressure(rpc_pressure(self._hadoop_resourcemanager_metrics['RpcActivity'])):
+                yield metric
 
     def _setup_rmnminfo_labels(self):
+        if self._nodemanager_summary:
+            self._setup_nodemanager_summary_labels()
+            return
         for metric in self._metrics['RMNMInfo']:
            label = ["cluster", "host", "version", "rack"]
            if 'NumContainers' in metric:
@@ -78,6 +152,24 @@ class ResourceManagerMetricCollector(MetricCol):
            self._hadoop_resourcemanager_metrics['RMNMInfo'][metric] = GaugeMetricFamily(name,
                                                                                         self._metrics['RMNMInfo'][metric],
                                                                                         labels=label)
+        if self._central_nodemanagers:
+            for key, name, descriptions in CENTRAL_NODE_METRICS:
+                self._hadoop_resourcemanager_metrics['RMNMInfo'][key] = GaugeMetricFamily("_".join([self._prefix, name]),
+                                                                                         descriptions,
+                                                                                         labels=["cluster", "host", "version", "rack"])
+
+    def _setup_nodemanager_summary_labels(self):
+        metrics = self._hadoop_resourcemanager_metrics['RMNMInfo']
+        self._nodemanager_summaries = {}
+        for key, name, descriptions, buckets in NODEMANAGER_SUMMARY_METRICS:
+            summary = FleetSummary("_".join([self._prefix, name]), descriptions, labels=["cluster"],
+                                   buckets=buckets, top=self._fleet_top)
+            self._nodemanager_summaries[key] = summary
+            for family in summary.families():
+                metrics[family.name] = family
+        metrics['state'] = GaugeMetricFamily("_".join([self._prefix, 'nodemanagers_state']),
+                                             "Number of NodeManagers in each state",
+                                             labels=["cluster", "state"])
 
     def _setup_queue_labels(self):
         running_flag = 1
@@ -100,6 +192,31 @@ class ResourceManagerMetricCollector(MetricCol):
                 self._hadoop_resourcemanager_metrics['QueueMetrics'][metric] = GaugeMetricFamily("_".join([self._prefix, snake_case]),
                                                                                                  self._metrics['QueueMetrics'][metric],
                                                                                                  labels=label)
+        self._setup_queue_hierarchy_labels()
+
+    def _setup_queue_hierarchy_labels(self):
+        # the same metrics for every queue of the hierarchy and every user of a queue,
+        # queue-level series have an empty user.
+        running_flag = 1
+        for metric in self._metrics['QueueMetrics']:
+            snake_case = re.sub('([a-z0-9])([A-Z])', r'\1_\2', metric).lower()
+            if "running_" in metric:
+                if running_flag:
+                    running_flag = 0
+                    label = ["cluster", "queue", "user", "elapsed_time"]
+                    key = "queue_running_app"
+                    name = "queue_running_app_total"
+                    descriptions = "Current number of running applications of the queue in each elapsed time"
+                else:
+                    continue
+            else:
+                label = ["cluster", "queue", "user"]
+                key = "_".join(["queue", metric])
+                name = "_".join(["queue", snake_case])
+                descriptions = self._metrics['QueueMetrics'][metric]
+            self._hadoop_resourcemanager_metrics['QueueMetrics'][key] = GaugeMetricFamily("_".join([self._prefix, name]),
+                                                                                          descriptions,
+                                                                                          labels=label)
 
     def _setup_cluster_labels(self):
         nm_flag, cm_num_flag, cm_avg_flag = 1,1,1
@@ -152,34 +269,137 @@ class ResourceManagerMetricCollector(MetricCol):
 
     def _setup_metrics_labels(self, beans):
         # The metrics we want to export.
+        # every group is set up once per scrape, however many beans of the group there are.
+        rmnminfo_flag, queue_flag, cluster_flag, ha_flag = 1,1,1,1
         for i in range(len(beans)):
-            if 'RMNMInfo' in beans[i]['name']:
+            if 'RMNMInfo' in beans[i]['name'] and rmnminfo_flag:
+                rmnminfo_flag = 0
                 self._setup_rmnminfo_labels()
-            if 'QueueMetrics' in self._metrics:
+            if self._is_queue_bean(beans[i]) and queue_flag:
+                queue_flag = 0
                 self._setup_queue_labels()
-            if 'ClusterMetrics' in self._metrics:
+            if 'ClusterMetrics' in beans[i]['name'] and cluster_flag:
+                cluster_flag = 0
                 self._setup_cluster_labels()
             # 添加高可用相关监控数据
-            if 'Runtime' in beans[i]['name']:
+            if 'Runtime' in beans[i]['name'] and ha_flag:
+                ha_flag = 0
                 self._setup_ha_metrics_labels()
 
 
     def _get_rmnminfo_metrics(self, bean):
+        attributes = [metric for metric in self._metrics['RMNMInfo'] if 'State' != metric]
+        if self._central_nodemanagers:
+            attributes.extend(self.CENTRAL_NODE_ATTRIBUTES)
+        # LiveNodeManagers is a JSON string covering every NodeManager, decoded once.
+        nms = NodeColumns(bean['LiveNodeManagers'], set(attributes), key='HostName')
+        if self._nodemanager_summary:
+            self._get_nodemanager_summary_metrics(nms)
+            return
+        labels = [[self._cluster, nm.get('HostName', ''), nm.get('NodeManagerVersion', ''), nm.get('Rack', '')]
+                  for nm in nms.records]
+        metrics = self._hadoop_resourcemanager_metrics['RMNMInfo']
         for metric in self._metrics['RMNMInfo']:
-            live_nm_list = yaml.safe_load(bean['LiveNodeManagers'])
-            for j in range(len(live_nm_list)):
-                host = live_nm_list[j]['HostName']
-                version = live_nm_list[j]['NodeManagerVersion']
-                rack = live_nm_list[j]['Rack']
-                label = [self._cluster, host, version, rack]
-                if 'State' == metric:
-                    value = self.NODE_STATE[live_nm_list[j]['State']]
+            if 'State' == metric:
+                values = [self.NODE_STATE.get(nm.get('State'), 0) for nm in nms.records]
+            else:
+                values = nms.column(metric)
+            for j in range(nms.size):
+                metrics[metric].add_metric(labels[j], values[j])
+        if self._central_nodemanagers:
+            self._get_central_nodemanager_metrics(nms, labels)
+
+    def _get_health_report_age(self, nms):
+        # LastHealthUpdate is in milliseconds since the epoch
+        now = time.time()
+        return array('d', [max(now - last / 1000.0, 0.0) if last else 0.0 for last in nms.column('LastHealthUpdate')])
+
+    def _get_nodemanager_summary_metrics(self, nms):
+        metrics = self._hadoop_resourcemanager_metrics['RMNMInfo']
+        for key, name, descriptions, buckets in NODEMANAGER_SUMMARY_METRICS:
+            values = self._get_health_report_age(nms) if 'HealthReportAge' == key else nms.column(key)
+            self._nodemanager_summaries[key].add([self._cluster], values, nms.names)
+        counts = {}
+        for nm in nms.records:
+            counts[nm.get('State')] = counts.get(nm.get('State'), 0) + 1
+        for state in sorted(counts):
+            metrics['state'].add_metric([self._cluster, state], counts[state])
+
+    def _get_central_nodemanager_metrics(self, nms, labels):
+        metrics = self._hadoop_resourcemanager_metrics['RMNMInfo']
+        used_mb, available_mb = nms.column('UsedMemoryMB'), nms.column('AvailableMemoryMB')
+        used_vcores, available_vcores = nms.column('UsedVirtualCores'), nms.column('AvailableVirtualCores')
+        health_report_age = self._get_health_report_age(nms)
+        for j in range(nms.size):
+            label = labels[j]
+            healthy = 1.0 if 'RUNNING' == nms.records[j].get('State') and not nms.records[j].get('HealthReport') else 0.0
+            metrics['UsedVirtualCores'].add_metric(label, used_vcores[j])
+            metrics['AvailableVirtualCores'].add_metric(label, available_vcores[j])
+            metrics['MemoryCapacityMB'].add_metric(label, used_mb[j] + available_mb[j])
+            metrics['VirtualCoresCapacity'].add_metric(label, used_vcores[j] + available_vcores[j])
+            metrics['Healthy'].add_metric(label, healthy)
+            metrics['HealthReportAge'].add_metric(label, health_report_age[j])
+
+    def _is_queue_bean(self, bean):
+        # not PartitionQueueMetrics, which repeats the queues once per node label.
+        return 'name=QueueMetrics,' in bean['name']
+
+    def _get_queue_key(self, bean):
+        '''
+        @return (queue path, user, exported) of a QueueMetrics bean; user is "" for the queue itself.
+        '''
+        name = bean['name']
+        key = self._queue_keys.get(name)
+        if key is None:
+            queue = bean.get('tag.Queue', '')
+            user = bean.get('tag.User', '')
+            exported = bool(queue)
+            if exported and self._queue_depth is not None:
+                exported = queue.count('.') <= self._queue_depth
+            if exported and self._queue_allowlist is not None:
+                exported = self._queue_allowlist.match(queue) is not None
+            key = (queue, user, exported)
+            if len(self._queue_keys) < MAX_CACHED_QUEUE_BEANS:
+                self._queue_keys[name] = key
+        return key
+
+    def _index_queues(self, beans):
+        '''
+        Index the QueueMetrics beans of one snapshot by (queue path, user).
+        @return (the root queue bean or None, {(queue path, user): bean} of the exported queues).
+        '''
+        root, index = None, {}
+        for bean in beans:
+            if not self._is_queue_bean(bean):
+                continue
+            queue, user, exported = self._get_queue_key(bean)
+            if 'root' == queue and not user:
+                root = bean
+            if exported:
+                index[(queue, user)] = bean
+        return root, index
+
+    def _get_queue_hierarchy_metrics(self, index):
+        metrics = self._hadoop_resourcemanager_metrics['QueueMetrics']
+        for (queue, user) in sorted(index):
+            bean = index[(queue, user)]
+            for metric in self._metrics['QueueMetrics']:
+                # e.g. the FairScheduler attributes under the CapacityScheduler: no series at all
+                # rather than a 0 per queue and user
+                if metric not in bean:
+                    continue
+                label = [self._cluster, queue, user]
+                if "running_" in metric:
+                    key = "queue_running_app"
+                    label.append(self.RUNNING_ELAPSED_TIME.get(metric, metric))
                 else:
-                    value = live_nm_list[j][metric] if metric in live_nm_list[j] else 0.0
-                self._hadoop_resourcemanager_metrics['RMNMInfo'][metric].add_metric(label, value)
+                    key = "_".join(["queue", metric])
+                metrics[key].add_metric(label, bean[metric])
 
     def _get_queue_metrics(self, bean):
         for metric in self._metrics['QueueMetrics']:
+            if metric not in bean:
+                continue
             label = [self._cluster]
             snake_case = re.sub('([a-z0-9])([A-Z])', r'\1_\2', metric).lower()
             if "running_0" in metric:
@@ -196,8 +416,7 @@ class ResourceManagerMetricCollector(MetricCol):
                 label.append("1440up")
             else:
                 key = metric
-            self._hadoop_resourcemanager_metrics['QueueMetrics'][key].add_metric(label,
-                                                                                 bean[metric] if metric in bean else 0)
+            self._hadoop_resourcemanager_metrics['QueueMetrics'][key].add_metric(label, bean[metric])
 
     def _get_cluster_metrics(self, bean):
         for metric in self._metrics['ClusterMetrics']:
@@ -229,13 +448,16 @@ class ResourceManagerMetricCollector(MetricCol):
 
     def _get_metrics(self, beans):
 
+        root, queues = self._index_queues(beans)
+        if root is not None:
+            self._get_queue_metrics(root)
+        if queues:
+            self._get_queue_hierarchy_metrics(queues)
+
         for i in range(len(beans)):
             if 'RMNMInfo' in beans[i]['name']:
                 self._get_rmnminfo_metrics(beans[i])
 
-            if 'QueueMetrics' in beans[i]['name'] and 'root' == beans[i]['tag.Queue']:
-                self._get_queue_metrics(beans[i])
-
             if 'ClusterMetrics' in beans[i]['name']:
                 self._get_cluster_metrics(beans[i])
             # 添加高可用相关监控数据
@@ -249,7 +471,8 @@ def main():
         port = int(args.port)
         cluster = args.cluster
         v = args.resourcemanager_url
-        REGISTRY.register(ResourceManagerMetricCollector(cluster, v))
+        REGISTRY.register(ResourceManagerMetricCollector(cluster, v, args.queue_depth, args.queue_allowlist,
+                                                         args.nodemanager_central, args.nodemanager_summary, args.fleet_top))
 
         start_http_server(port)
         # print("Polling %s. Serving at port: %s" % (args.address, port))
@@ -1,117 +1,96 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import yaml
-import re
 import time
 from sys import exit
-from prometheus_client import start_http_server
-from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily, REGISTRY
-
-from consul import Consul
+from prometheus_client.core import REGISTRY
 
 from cmd import utils
-from cmd.utils import get_host_ip
+from cmd import decoder
 from cmd.utils import get_module_logger
-from cmd.hdfs_namenode import NameNodeMetricCollector
-from cmd.hdfs_datanode import DataNodeMetricCollector
-from cmd.hdfs_journalnode import JournalNodeMetricCollector
-from cmd.yarn_resourcemanager import ResourceManagerMetricCollector
-from cmd.yarn_nodemanager import NodeManagerMetricCollector
-from cmd.mapreduce_jobhistoryserver import MapReduceMetricCollector
-from cmd.hbase_master import HBaseMasterMetricCollector
-from cmd.hbase_regionserver import HBaseRegionServerMetricCollector
-from cmd.hive_server import HiveServerMetricCollector
-from cmd.hive_llap import HiveLlapDaemonMetricCollector
+from cmd import tiers
+from cmd import throttle
+from cmd import sampler
+from cmd import profiler
+from cmd import memory
+from cmd import tracing
+from cmd import beancost
+from cmd.exposition import start_http_server
+from cmd.collectors import find_collector, get_collector_options, load_collector
+from cmd.rules import RuleMetricCollector, get_rules_index
+from cmd.selfstats import ExporterMetricCollector
 
 logger = get_module_logger(__name__)
 
 
-def register_consul(address, port):
-    start_http_server(port)
+def get_debug_handlers(args):
+    '''
+    @return {path: handler} of the /debug endpoints enabled on the command line.
+    '''
+    handlers = {}
+    if args.debug_profile:
+        handlers['/debug/profile'] = profiler.handle
+    if args.debug_memory:
+        handlers['/debug/memory'] = memory.handle
+    if args.debug_trace:
+        handlers['/debug/trace'] = tracing.handle
+    if args.debug_beans:
+        handlers['/debug/beans'] = beancost.handle
+    return handlers
+
+
+def register_consul(address, port, args=None):
+    '''
+    @return the started ExpositionServer, not ready until the first services are registered.
+    '''
+    options = {}
+    if args is not None:
+        options = dict(workers=args.web_workers, max_pending=args.web_max_pending,
+                       max_renders=args.web_max_renders, snapshot_max_age=args.web_snapshot_max_age,
+                       debug_handlers=get_debug_handlers(args))
+    httpd = start_http_server(port, ready=False, **options)
+    REGISTRY.register(httpd)
     # print("Polling %s. Serving at port: %s" % (args.address, port))
     print "Polling %s. Serving at port: %s" % (address, port)
+    return httpd
 
 
-def register_prometheus(rest_url):
+def register_prometheus(rest_url, args=None, httpd=None):
     try:
-        namenode_flag, datanode_flag, journalnode_flag, resourcemanager_flag, nodemanager_flag, hbase_master_flag, hbase_regionserver_flag, historyserver_flag, hive_server_interactive_flag, hive_llap_flag = 1,1,1,1,1,1,1,1,1,1
+        # collector modules already registered, every kind of collector is registered once.
+        registered = set()
+        # services without a python collector, described by a rules file in rules/
+        rules_index = get_rules_index()
+        rules_registered = set()
         while True:
             url = 'http://{0}/cluster_config.json'.format(rest_url)
-            node_info = utils.get_node_info(url)
+            with tracing.span('discovery', 'discovery', api=url) as span:
+                node_info = utils.get_node_info(url)
+                span.set(clusters=len(node_info or ()))
             if node_info:
                 for cluster, info in node_info.items():
                     for k, v in info.items():
-                        if 'NAMENODE' in k:
-                            if namenode_flag:
-                                namenode_url = v['jmx']
-                                logger.info("namenode_url = {0}, start to register".format(namenode_url))
-                                REGISTRY.register(NameNodeMetricCollector(cluster, namenode_url))
-                                namenode_flag = 0
-                                continue
-                        if 'DATANODE' in k:
-                            if datanode_flag:
-                                datanode_url = v['jmx']
-                                logger.info("datanode_url = {0}, start to register".format(datanode_url))
-                                REGISTRY.register(DataNodeMetricCollector(cluster, datanode_url))
-                                datanode_flag = 0
-                                continue
-                        if 'JOURNALNODE' in k:
-                            if journalnode_flag:
-                                journalnode_url = v['jmx']
-                                logger.info("journalnode_url = {0}, start to register".format(journalnode_url))
-                                REGISTRY.register(JournalNodeMetricCollector(cluster, journalnode_url))
-                                journalnode_flag = 0
-                                continue
-                        if 'RESOURCEMANAGER' in k:
-                            if resourcemanager_flag:
-                                resourcemanager_url = v['jmx']
-                                logger.info("resourcemanager_url = {0}, start to register".format(resourcemanager_url))
-                                REGISTRY.register(ResourceManagerMetricCollector(cluster, resourcemanager_url))
-                                resourcemanager_flag = 0
-                                continue
-                        if 'NODEMANAGER' in k:
-                            if nodemanager_flag:
-                                nodemanager_url = v['jmx']
-                                logger.info("nodemanager_url = {0}, start to register".format(nodemanager_url))
-                                REGISTRY.register(NodeManagerMetricCollector(cluster, nodemanager_url))
-                                nodemanager_flag = 0
-                                continue
-                        if 'HBASE_MASTER' in k:
-                            if hbase_master_flag:
-                                hbase_master_url = v['jmx']
-                                logger.info("hbase_master_url = {0}, start to register".format(hbase_master_url))
-                                REGISTRY.register(HBaseMasterMetricCollector(cluster, hbase_master_url))
-                                hbase_master_flag = 0
-                                continue
-                        if 'HBASE_REGIONSERVER' in k:
-                            if hbase_regionserver_flag:
-                                hbase_regionserver_url = v['jmx']
-                                logger.info("hbase_regionserver_url = {0}, start to register".format(hbase_regionserver_url))
-                                REGISTRY.register(HBaseRegionServerMetricCollector(cluster, hbase_regionserver_url))
-                                hbase_regionserver_flag = 0
-                                continue
-                        if 'HISTORYSERVER' in k:
-                            if historyserver_flag:
-                                historyserver_url = v['jmx']
-                                logger.info("historyserver_url = {0}, start to register".format(historyserver_url))
-                                REGISTRY.register(MapReduceMetricCollector(cluster, historyserver_url))
-                                historyserver_flag = 0
-                                continue
-                        if 'HIVE_SERVER_INTERACTIVE' in k:
-                            if hive_server_interactive_flag:
-                                hive_server_interactive_url = v['jmx']
-                                logger.info("hive_server_interactive_url = {0}, start to register".format(hive_server_interactive_url))
-                                REGISTRY.register(HiveServerMetricCollector(cluster, hive_server_interactive_url))
-                                hive_server_interactive_flag = 0
-                                continue
-                        if 'HIVE_LLAP' in k:
-                            if hive_llap_flag:
-                                hive_llap_url = v['jmx']
-                                logger.info("hive_llap_url = {0}, start to register".format(hive_llap_url))
-                                REGISTRY.register(HiveLlapDaemonMetricCollector(cluster, hive_llap_url))
-                                hive_llap_flag = 0
+                        entry = find_collector(k)
+                        if entry is not None:
+                            keyword, module_name, class_name = entry
+                            if module_name not in registered:
+                                # the collector module (and its metric catalogs) is only loaded
+                                # once the service is discovered on this node.
+                                collector_url = v['jmx']
+                                logger.info("{0}_url = {1}, start to register".format(keyword.lower(), collector_url))
+                                with tracing.span('register', 'discovery', collector=class_name, url=collector_url):
+                                    collector = load_collector(module_name, class_name)
+                                    options = get_collector_options(module_name, args)
+                                    REGISTRY.register(collector(cluster, collector_url, **options))
+                                registered.add(module_name)
                                 continue
+                        if k in rules_index and k not in rules_registered:
+                            rules_url = v['jmx']
+                            logger.info("{0} url = {1}, start to register".format(k, rules_url))
+                            REGISTRY.register(RuleMetricCollector(cluster, rules_url, rules_index[k]))
+                            rules_registered.add(k)
+                if httpd is not None:
+                    httpd.set_ready()
                 time.sleep(300)
             else:
                 logger.error("No service running in THIS node")
@@ -128,11 +107,33 @@ def register_prometheus(rest_url):
 def main():
     try:
         args = utils.parse_args()
+        utils.set_log_level(args.log_level)
+        utils.set_coalesce_window(args.coalesce_window)
+        utils.set_compression(args.gzip)
+        decoder.set_backend(args.json_decoder)
+        logger.info("json decoder: {0}".format(decoder.BACKEND))
+        tiers.set_tiers_path(args.polling_tiers)
+        utils.set_payload_limits((args.max_payload_bytes, args.max_payload_beans), dict(args.payload_limit))
+        if args.debug_trace or args.trace_file:
+            tracing.configure(args.trace_file, args.trace_file_size, args.trace_file_backups)
+            logger.info("tracing the scrapes{0}".format(" to " + args.trace_file if args.trace_file else ""))
+        REGISTRY.register(ExporterMetricCollector())
+        if args.debug_beans:
+            REGISTRY.register(beancost.configure(metrics=args.debug_beans == 'metrics'))
+        if args.debug_memory:
+            REGISTRY.register(memory.configure(args.debug_memory))
+        if args.sampling:
+            samples = {}
+            for service, entry in map(sampler.parse_sample, args.sample):
+                samples.setdefault(service, []).append(entry)
+            sampler.configure(args.sample_period, args.sample_window, samples)
+        if args.throttle:
+            throttle.configure(args.throttle_interval, args.throttle_queue_length, args.throttle_queue_time)
         address = args.address
         port = int(args.port)
         rest_url = args.services_api
-        register_consul(address, port)
-        register_prometheus(rest_url)
+        httpd = register_consul(address, port, args)
+        register_prometheus(rest_url, args, httpd)
     except Exception as e:
         logger.info('Error happened, msg: %s'%e)
     else:
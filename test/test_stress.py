@@ -0,0 +1,39 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Parallel scrapes of every fixture role must render exactly what a scrape taken alone renders,
+both from the collectors and through the exposition server:
+
+    python test/test_stress.py [threads] [scrapes per thread] [ROLE ...]
+
+Exits with 1 when a role fails. The fixtures are the test/<dir> of each role, see
+cmd/stress.py FIXTURES.
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cmd'))
+
+import stress
+
+THREADS = 8
+SCRAPES = 10
+
+
+def test_parallel_scrapes():
+    failed = stress.run(THREADS, SCRAPES)
+    assert not failed, "parallel scrapes differ: {0}".format(", ".join(failed))
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else THREADS
+    scrapes = int(sys.argv[2]) if len(sys.argv) > 2 else SCRAPES
+    failed = stress.run(threads, scrapes, sys.argv[3:])
+    if failed:
+        sys.stderr.write("parallel scrapes differ: {0}\n".format(", ".join(failed)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()